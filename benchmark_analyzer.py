@@ -0,0 +1,94 @@
+"""
+Vocabulary size and throughput of the text analyzer
+
+Compares the original pipeline (per-call regex, no stemming) with the
+configurable analyzer over the stored documents, or over the sample
+documents when run with --synthetic or without a database.
+"""
+import asyncio
+import re
+import sys
+import time
+from collections import Counter
+from mongodb import connect_db, close_db, get_database
+from sample_data import SAMPLE_DOCUMENTS
+from text_processing import Analyzer, STOP_WORDS
+
+# Maximum number of stored documents to analyze
+MAX_DOCUMENTS = 20_000
+# Times the sample documents are repeated for the synthetic corpus
+SYNTHETIC_REPEAT = 200
+
+
+def legacy_term_positions(text: str):
+    """The pipeline before the analyzer: lowercase regex tokens minus stop words, unstemmed"""
+    positions = {}
+    for position, token in enumerate(re.findall(r'\b\w+\b', text.lower())):
+        if token not in STOP_WORDS:
+            positions.setdefault(token, []).append(position)
+    return positions
+
+
+# Runs of the repeatable measurements; the fastest is reported
+REPEAT = 5
+
+
+def timed(func, *args, repeat: int = 1) -> float:
+    """Fastest of `repeat` runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def load_texts():
+    if "--synthetic" not in sys.argv:
+        try:
+            await connect_db()
+            cursor = get_database().documents.find({}, {"title": 1, "content": 1}).limit(MAX_DOCUMENTS)
+            texts = [f"{doc.get('title', '')} {doc.get('title', '')} {doc.get('content', '')}" async for doc in cursor]
+            if texts:
+                return texts, "stored documents"
+        except Exception as e:
+            print(f"   ⚠️ Using sample documents: {e}")
+        finally:
+            await close_db()
+    texts = [f"{doc['title']} {doc['title']} {doc['content']}" for doc in SAMPLE_DOCUMENTS] * SYNTHETIC_REPEAT
+    return texts, "sample documents"
+
+
+async def main():
+    print("🔍 ANALYZER BENCHMARK")
+    texts, source = await load_texts()
+    tokens = sum(len(re.findall(r"\w+", text)) for text in texts)
+    print(f"   {len(texts):,} {source}, {tokens:,} tokens")
+
+    legacy_vocabulary = Counter(term for text in texts for term in legacy_term_positions(text))
+    print("\n📦 Vocabulary")
+    print(f"   unstemmed: {len(legacy_vocabulary):>10,} terms")
+    for stemming, folding in [(True, False), (True, True)]:
+        analyzer = Analyzer(stemming=stemming, ascii_folding=folding)
+        vocabulary = Counter(term for positions in analyzer.analyze_many(texts) for term in positions)
+        print(f"   {analyzer.signature():<10} {len(vocabulary):>10,} terms "
+              f"({1 - len(vocabulary) / max(len(legacy_vocabulary), 1):.0%} smaller)")
+
+    print("\n⏱️  Throughput")
+    legacy_time = timed(lambda: [legacy_term_positions(text) for text in texts], repeat=REPEAT)
+    print(f"   legacy (unstemmed):        {tokens / legacy_time:>12,.0f} tokens/s")
+
+    cold = Analyzer()
+    cold_time = timed(cold.analyze_many, texts)
+    warm_time = timed(cold.analyze_many, texts, repeat=REPEAT)
+    print(f"   analyzer, cold cache:      {tokens / cold_time:>12,.0f} tokens/s")
+    print(f"   analyzer, warm cache:      {tokens / warm_time:>12,.0f} tokens/s ({cold.cache_info()['size']:,} cached)")
+
+    sample = texts[:max(1, len(texts) // 10)]
+    sample_tokens = sum(len(re.findall(r"\w+", text)) for text in sample)
+    uncached_time = timed(Analyzer(cache_size=0).analyze_many, sample)
+    print(f"   analyzer, no cache:        {sample_tokens / uncached_time:>12,.0f} tokens/s (stemming every token)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Size report and throughput benchmarks for the compressed postings codec
+
+Reports how much smaller the stored postings of the active index are than
+plain BSON arrays, then times encoding and decoding on synthetic postings
+of increasing density. Run with --synthetic to skip the database.
+"""
+import asyncio
+import sys
+import time
+import bson
+import numpy as np
+from mongodb import connect_db, close_db, get_index_collections
+from postings_codec import encode_doc_set, decode_doc_set, decode_freqs, encode_positions, decode_positions
+
+# Number of documents in the synthetic collection
+SYNTHETIC_DOCUMENTS = 1_000_000
+# Fraction of documents containing each synthetic term
+DENSITIES = [0.0001, 0.001, 0.01, 0.1, 0.5]
+
+
+def bson_size(values) -> int:
+    """Size of a value stored as a plain BSON field"""
+    return len(bson.encode({"v": values})) - len(bson.encode({"v": []}))
+
+
+def timed(func, *args, repeat: int = 5) -> float:
+    """Best wall time of several calls, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def size_report():
+    print("\n📦 Stored postings of the active index")
+    inverted_index, _ = get_index_collections()
+
+    terms = 0
+    doc_set_bytes = doc_set_raw = 0
+    freqs_bytes = freqs_raw = 0
+    positions_bytes = positions_raw = 0
+    async for entry in inverted_index.find({}, {"doc_nums": 1, "freqs": 1, "positions": 1}):
+        terms += 1
+        doc_nums = decode_doc_set(entry["doc_nums"])
+        doc_set_bytes += len(entry["doc_nums"])
+        doc_set_raw += bson_size(doc_nums.tolist())
+        freqs_bytes += len(entry["freqs"])
+        # Stored before as a map of document number strings to frequencies
+        freqs_raw += len(bson.encode({
+            str(doc_num): freq for doc_num, freq in zip(doc_nums.tolist(), decode_freqs(entry["freqs"]).tolist())
+        }))
+        for data in entry.get("positions", {}).values():
+            positions_bytes += len(data)
+            positions_raw += bson_size(decode_positions(data))
+
+    if not terms:
+        print("   (index is empty)")
+        return
+
+    print(f"   Terms:          {terms}")
+    print(f"   Document sets:  {doc_set_bytes:>12,} bytes (plain arrays {doc_set_raw:,}, "
+          f"ratio {doc_set_raw / max(doc_set_bytes, 1):.2f}x)")
+    print(f"   Frequencies:    {freqs_bytes:>12,} bytes (plain map {freqs_raw:,}, "
+          f"ratio {freqs_raw / max(freqs_bytes, 1):.2f}x)")
+    print(f"   Positions:      {positions_bytes:>12,} bytes (plain arrays {positions_raw:,}, "
+          f"ratio {positions_raw / max(positions_bytes, 1):.2f}x)")
+
+
+def throughput_report():
+    print(f"\n⏱️  Document set codec over {SYNTHETIC_DOCUMENTS:,} documents")
+    print(f"   {'density':>8} {'postings':>10} {'bytes':>10} {'bits/doc':>9} {'encode/s':>12} {'decode/s':>12}")
+
+    rng = np.random.default_rng(42)
+    for density in DENSITIES:
+        count = int(SYNTHETIC_DOCUMENTS * density)
+        doc_nums = np.sort(rng.choice(SYNTHETIC_DOCUMENTS, size=count, replace=False))
+        data = encode_doc_set(doc_nums)
+        assert np.array_equal(decode_doc_set(data), doc_nums)
+
+        encode_time = timed(encode_doc_set, doc_nums)
+        decode_time = timed(decode_doc_set, data)
+        print(
+            f"   {density:>8} {count:>10,} {len(data):>10,} {len(data) * 8 / count:>9.2f} "
+            f"{count / encode_time:>12,.0f} {count / decode_time:>12,.0f}"
+        )
+
+    print("\n⏱️  Positions codec (10,000 lists of 1-64 positions)")
+    positions = [
+        np.cumsum(rng.integers(1, 200, size=rng.integers(1, 65))).tolist()
+        for _ in range(10_000)
+    ]
+    total = sum(len(p) for p in positions)
+    encoded = [encode_positions(p) for p in positions]
+    encode_time = timed(lambda: [encode_positions(p) for p in positions])
+    decode_time = timed(lambda: [decode_positions(data) for data in encoded])
+    size = sum(len(data) for data in encoded)
+    print(f"   {total:,} positions in {size:,} bytes ({size * 8 / total:.2f} bits/position)")
+    print(f"   encode {total / encode_time:,.0f}/s, decode {total / decode_time:,.0f}/s")
+
+
+async def main():
+    print("🔍 POSTINGS CODEC BENCHMARK")
+
+    if "--synthetic" not in sys.argv:
+        try:
+            await connect_db()
+            await size_report()
+        except Exception as e:
+            print(f"   ⚠️ Skipping size report: {e}")
+        finally:
+            await close_db()
+
+    throughput_report()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Vectorized BM25 scoring over stored term-frequency and document-length arrays
+"""
+from config import settings
+from index_engine import index_engine
+from collection_stats import collection_stats
+from typing import List
+import numpy as np
+
+
+class BM25Ranker:
+    """Score many candidate documents against a query in one NumPy pass"""
+
+    def __init__(self, k1: float = None, b: float = None):
+        self.k1 = settings.BM25_K1 if k1 is None else k1
+        self.b = settings.BM25_B if b is None else b
+
+    @staticmethod
+    def idf(doc_freqs: np.ndarray, total_docs: int) -> np.ndarray:
+        """BM25 inverse document frequency (never negative)"""
+        doc_freqs = np.asarray(doc_freqs, dtype=np.float64)
+        return np.log1p((total_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+    def score(
+        self,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_freqs: np.ndarray,
+        total_docs: int,
+        avg_doc_length: float
+    ) -> np.ndarray:
+        """
+        Score documents from a (documents x terms) term-frequency matrix
+
+        Args:
+            term_freqs: Occurrences of each query term in each candidate
+            doc_lengths: Indexed length of each candidate
+            doc_freqs: Number of documents containing each query term
+            total_docs: Number of documents in the collection
+            avg_doc_length: Average indexed document length
+
+        Returns:
+            One BM25 score per candidate
+        """
+        term_freqs = np.asarray(term_freqs, dtype=np.float64)
+        if term_freqs.size == 0 or total_docs == 0:
+            return np.zeros(term_freqs.shape[0])
+
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float64)
+        length_norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / (avg_doc_length or 1.0))
+
+        weights = term_freqs * (self.k1 + 1.0) / (term_freqs + length_norm[:, None])
+        return weights @ self.idf(doc_freqs, total_docs)
+
+    @staticmethod
+    def term_frequency_matrix(doc_nums: np.ndarray, query_terms: List[str]) -> np.ndarray:
+        """Gather term frequencies for candidate document numbers from the in-memory index"""
+        matrix = np.zeros((len(doc_nums), len(query_terms)), dtype=np.int32)
+
+        for col, term in enumerate(query_terms):
+            postings = index_engine.get_postings(term)
+            if postings is None or len(postings) == 0:
+                continue
+
+            posting_docs = np.frombuffer(postings.doc_nums, dtype=np.int32)
+            posting_freqs = np.frombuffer(postings.freqs, dtype=np.int32)
+
+            # Binary-search every candidate in the sorted postings at once
+            pos = np.searchsorted(posting_docs, doc_nums)
+            pos = np.minimum(pos, len(posting_docs) - 1)
+            hits = posting_docs[pos] == doc_nums
+            matrix[hits, col] = posting_freqs[pos[hits]]
+
+        return matrix
+
+    def posting_weights(self, term: str) -> np.ndarray:
+        """BM25 contribution of a term to every document in its in-memory postings"""
+        postings = index_engine.get_postings(term)
+        if postings is None or len(postings) == 0:
+            return np.zeros(0)
+
+        posting_docs = np.frombuffer(postings.doc_nums, dtype=np.int32)
+        freqs = np.frombuffer(postings.freqs, dtype=np.int32).astype(np.float64)
+        doc_lengths = np.frombuffer(index_engine.doc_lengths, dtype=np.int32)[posting_docs]
+        length_norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / (collection_stats.avg_doc_length or 1.0))
+
+        idf = self.idf(np.array([collection_stats.doc_freq(term)]), collection_stats.total_documents)[0]
+        return idf * freqs * (self.k1 + 1.0) / (freqs + length_norm)
+
+    def score_candidates(self, doc_nums: np.ndarray, query_terms: List[str]) -> np.ndarray:
+        """Score candidate document numbers using only the in-memory index"""
+        doc_nums = np.asarray(doc_nums, dtype=np.int32)
+        term_freqs = self.term_frequency_matrix(doc_nums, query_terms)
+        doc_lengths = np.frombuffer(index_engine.doc_lengths, dtype=np.int32)[doc_nums]
+        doc_freqs = np.array([collection_stats.doc_freq(term) for term in query_terms], dtype=np.float64)
+
+        return self.score(
+            term_freqs,
+            doc_lengths,
+            doc_freqs,
+            collection_stats.total_documents,
+            collection_stats.avg_doc_length
+        )
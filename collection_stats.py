@@ -0,0 +1,122 @@
+"""
+Cached collection statistics used for IDF and length normalisation
+"""
+from mongodb import get_index_collections
+from index_engine import index_engine
+from typing import Dict, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionStats:
+    """
+    Document count, per-term document frequency and total indexed length.
+
+    Loaded once and then updated incrementally whenever a document is
+    indexed or removed, so ranking never has to query MongoDB for them.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.total_documents = 0
+        self.total_length = 0
+        self._doc_freqs: Dict[str, int] = {}
+
+    def clear(self):
+        """Reset all statistics to an empty collection"""
+        self.total_documents = 0
+        self.total_length = 0
+        self._doc_freqs = {}
+
+    async def load(self):
+        """Load statistics from the in-memory index, or from MongoDB if it is not loaded"""
+        # Collect into a fresh instance and swap it in whole so readers never see partial totals
+        fresh = CollectionStats()
+
+        if index_engine.loaded:
+            for term in index_engine.terms():
+                fresh._doc_freqs[term] = len(index_engine.get_postings(term))
+            for doc_length in index_engine.doc_lengths:
+                if doc_length:
+                    fresh.total_documents += 1
+                    fresh.total_length += doc_length
+        else:
+            inverted_index, doc_stats = get_index_collections()
+
+            cursor = inverted_index.find({}, {"term": 1, "doc_count": 1})
+            async for entry in cursor:
+                # A term's postings may be split across several bucket documents
+                term = entry["term"]
+                fresh._doc_freqs[term] = fresh._doc_freqs.get(term, 0) + entry.get("doc_count", 0)
+
+            cursor = doc_stats.aggregate([
+                {"$group": {"_id": None, "count": {"$sum": 1}, "total": {"$sum": "$length"}}}
+            ])
+            async for result in cursor:
+                fresh.total_documents = result["count"]
+                fresh.total_length = result["total"]
+
+        self.total_documents = fresh.total_documents
+        self.total_length = fresh.total_length
+        self._doc_freqs = fresh._doc_freqs
+        self.loaded = True
+        logger.info(f"✅ Loaded collection statistics: {self.total_documents} documents, {len(self._doc_freqs)} terms")
+
+    def add_document(self, terms: Iterable[str], doc_length: int):
+        """Account for a newly indexed document (ignored until the statistics are loaded)"""
+        if not self.loaded:
+            return
+
+        self.total_documents += 1
+        self.total_length += doc_length
+        for term in terms:
+            self._doc_freqs[term] = self._doc_freqs.get(term, 0) + 1
+
+    def remove_document(self, terms: Iterable[str], doc_length: int):
+        """Account for a document removed from the index (ignored until the statistics are loaded)"""
+        if not self.loaded:
+            return
+
+        self.total_documents = max(self.total_documents - 1, 0)
+        self.total_length = max(self.total_length - doc_length, 0)
+        for term in terms:
+            doc_freq = self._doc_freqs.get(term, 0) - 1
+            if doc_freq > 0:
+                self._doc_freqs[term] = doc_freq
+            else:
+                self._doc_freqs.pop(term, None)
+
+    def update_document(self, added_terms: Iterable[str], removed_terms: Iterable[str], old_length: int, new_length: int):
+        """Account for an edited document's term-level diff (ignored until the statistics are loaded)"""
+        if not self.loaded:
+            return
+
+        self.total_length += new_length - old_length
+        for term in added_terms:
+            self._doc_freqs[term] = self._doc_freqs.get(term, 0) + 1
+        for term in removed_terms:
+            doc_freq = self._doc_freqs.get(term, 0) - 1
+            if doc_freq > 0:
+                self._doc_freqs[term] = doc_freq
+            else:
+                self._doc_freqs.pop(term, None)
+
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing a term"""
+        return self._doc_freqs.get(term, 0)
+
+    def doc_freqs(self) -> Dict[str, int]:
+        """Document frequency of every indexed term"""
+        return self._doc_freqs
+
+    @property
+    def avg_doc_length(self) -> float:
+        """Average indexed document length"""
+        if self.total_documents == 0:
+            return 0.0
+        return self.total_length / self.total_documents
+
+
+# Global collection statistics instance
+collection_stats = CollectionStats()
@@ -18,6 +18,51 @@ class Settings:
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Ranking Configuration
+    RANKING_MODE: str = os.getenv("RANKING_MODE", "tfidf")  # "tfidf" or "bm25"
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    
+    # Fuzzy Matching Configuration
+    FUZZY_MAX_DISTANCE: int = int(os.getenv("FUZZY_MAX_DISTANCE", "2"))
+    FUZZY_PREFIX_LENGTH: int = int(os.getenv("FUZZY_PREFIX_LENGTH", "7"))
+    
+    # Indexing Configuration
+    REBUILD_BATCH_SIZE: int = int(os.getenv("REBUILD_BATCH_SIZE", "500"))
+    INDEX_WORKERS: int = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))
+    POSTINGS_BUCKET_SIZE: int = int(os.getenv("POSTINGS_BUCKET_SIZE", "10000"))  # documents per postings bucket
+    POSTINGS_BUCKET_BYTES: int = int(os.getenv("POSTINGS_BUCKET_BYTES", str(4 * 1024 * 1024)))  # estimated stored bytes per postings bucket (MongoDB caps documents at 16 MB)
+    
+    # Index Storage Configuration
+    INDEX_STORAGE: str = os.getenv("INDEX_STORAGE", "mongodb")  # "mongodb" or "segments"
+    SEGMENT_DIR: str = os.getenv("SEGMENT_DIR", "index_segments")
+    SEGMENT_FLUSH_DOCS: int = int(os.getenv("SEGMENT_FLUSH_DOCS", "1000"))  # documents buffered in memory before a flush
+    SEGMENT_MERGE_FACTOR: int = int(os.getenv("SEGMENT_MERGE_FACTOR", "4"))  # similar-sized segments merged at once
+    
+    # Indexing Queue Configuration
+    INDEX_QUEUE_SIZE: int = int(os.getenv("INDEX_QUEUE_SIZE", "10000"))  # 0 indexes inline with each write
+    INDEX_QUEUE_BATCH: int = int(os.getenv("INDEX_QUEUE_BATCH", "500"))  # operations per group commit
+    INDEX_QUEUE_LINGER: float = float(os.getenv("INDEX_QUEUE_LINGER", "0.05"))  # seconds to gather a batch
+    INDEX_MAX_LAG: float = float(os.getenv("INDEX_MAX_LAG", "5"))  # seconds behind before writers wait
+    
+    # Bulk Ingestion Configuration
+    BULK_BATCH_SIZE: int = int(os.getenv("BULK_BATCH_SIZE", "1000"))  # documents per insert_many and index commit
+    BULK_MAX_LINE_BYTES: int = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))  # longest accepted NDJSON line
+    
+    # Text Analysis Configuration (changing these rebuilds the index at startup)
+    ANALYZER_STEMMING: bool = os.getenv("ANALYZER_STEMMING", "True").lower() == "true"
+    ANALYZER_ASCII_FOLDING: bool = os.getenv("ANALYZER_ASCII_FOLDING", "False").lower() == "true"
+    ANALYZER_CACHE_SIZE: int = int(os.getenv("ANALYZER_CACHE_SIZE", "100000"))  # cached token -> term entries
+    
+    # Query Result Cache Configuration
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "1000"))  # 0 disables the cache
+    QUERY_CACHE_TTL: float = float(os.getenv("QUERY_CACHE_TTL", "300"))  # seconds
+    QUERY_CACHE_DEPTH: int = int(os.getenv("QUERY_CACHE_DEPTH", "1000"))  # ranked results kept per query
+    QUERY_CACHE_MAX_RESULTS: int = int(os.getenv("QUERY_CACHE_MAX_RESULTS", "200000"))  # ranked results kept in total
+    
+    # Document Cache Configuration
+    DOCUMENT_CACHE_BYTES: int = int(os.getenv("DOCUMENT_CACHE_BYTES", str(64 * 1024 * 1024)))  # 0 disables the cache
+    
     # Application Settings
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     ALLOWED_ORIGINS: List[str] = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:8000").split(",")
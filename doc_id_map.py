@@ -0,0 +1,91 @@
+"""
+Mapping between document IDs and the dense integer numbers stored in postings
+"""
+from mongodb import get_database, get_index_collections, doc_num_counter_id
+from index_engine import index_engine
+from pymongo import UpdateOne, ReturnDocument
+from typing import Dict, Iterable, List, Optional
+
+
+class DocIdMap:
+    """
+    Every indexed document gets an int32 number, unique within its index
+    version and recorded next to its length in doc_stats. Postings,
+    term frequencies and positions are keyed by these numbers, so they are
+    several times smaller than ObjectId strings and can be processed as
+    sorted integer arrays; IDs are translated back only for results.
+
+    Numbers come from a per-version counter in index_meta, so a rebuild
+    numbers documents densely from 0 in _id order.
+    """
+
+    # Maximum number of IDs per $in query when translating in bulk
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    async def assign(doc_ids: List[str], version: Optional[int] = None) -> Dict[str, int]:
+        """Get the numbers of documents, assigning new ones to documents not yet numbered"""
+        _, doc_stats = get_index_collections(version)
+        doc_nums = await DocIdMap.get_doc_num_map(doc_ids, version)
+
+        missing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in doc_nums]
+        if not missing:
+            return doc_nums
+
+        counter = await get_database().index_meta.find_one_and_update(
+            {"_id": doc_num_counter_id(version)},
+            {"$inc": {"next": len(missing)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        first = counter["next"] - len(missing)
+
+        # $setOnInsert keeps the number of a document numbered concurrently by another writer
+        await doc_stats.bulk_write(
+            [
+                UpdateOne({"doc_id": doc_id}, {"$setOnInsert": {"doc_num": first + i}}, upsert=True)
+                for i, doc_id in enumerate(missing)
+            ],
+            ordered=False
+        )
+        doc_nums.update(await DocIdMap.get_doc_num_map(missing, version))
+        return doc_nums
+
+    @staticmethod
+    async def get_doc_num_map(doc_ids: List[str], version: Optional[int] = None) -> Dict[str, int]:
+        """Look up the document numbers of document IDs in doc_stats"""
+        _, doc_stats = get_index_collections(version)
+        doc_nums = {}
+        for i in range(0, len(doc_ids), DocIdMap.BATCH_SIZE):
+            cursor = doc_stats.find(
+                {"doc_id": {"$in": doc_ids[i:i + DocIdMap.BATCH_SIZE]}, "doc_num": {"$exists": True}},
+                {"doc_id": 1, "doc_num": 1}
+            )
+            async for entry in cursor:
+                doc_nums[entry["doc_id"]] = entry["doc_num"]
+        return doc_nums
+
+    @staticmethod
+    async def get_doc_ids(doc_nums: Iterable[int], version: Optional[int] = None) -> List[str]:
+        """Translate document numbers back to IDs, keeping their order"""
+        doc_nums = list(doc_nums)
+        if index_engine.loaded and version is None:
+            return [index_engine.doc_id(doc_num) for doc_num in doc_nums]
+
+        doc_ids = await DocIdMap.get_doc_id_map(doc_nums, version)
+        return [doc_ids[doc_num] for doc_num in doc_nums if doc_num in doc_ids]
+
+    @staticmethod
+    async def get_doc_id_map(doc_nums: Iterable[int], version: Optional[int] = None) -> Dict[int, str]:
+        """Look up the document IDs of document numbers in doc_stats"""
+        _, doc_stats = get_index_collections(version)
+        doc_nums = list(doc_nums)
+        doc_ids = {}
+        for i in range(0, len(doc_nums), DocIdMap.BATCH_SIZE):
+            cursor = doc_stats.find(
+                {"doc_num": {"$in": doc_nums[i:i + DocIdMap.BATCH_SIZE]}},
+                {"doc_id": 1, "doc_num": 1}
+            )
+            async for entry in cursor:
+                doc_ids[entry["doc_num"]] = entry["doc_id"]
+        return doc_ids
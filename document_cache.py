@@ -0,0 +1,98 @@
+"""
+Read-through cache of hot documents bounded by their content size
+"""
+from config import settings
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class DocumentCache:
+    """
+    LRU cache of full documents keyed by string ID.
+
+    The bound is on the UTF-8 bytes of cached titles and contents rather
+    than the number of entries, so a few very large documents cannot crowd
+    out memory. Every invalidation bumps a generation counter; documents
+    read from MongoDB before an invalidation are not stored, so a read that
+    races with an update or delete never caches the old version.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = settings.DOCUMENT_CACHE_BYTES if max_bytes is None else max_bytes
+        self.total_bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Dict, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def document_size(doc: Dict) -> int:
+        """Bytes a document counts against the cache bound"""
+        return len(doc.get("title", "").encode("utf-8")) + len(doc.get("content", "").encode("utf-8"))
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """Get a copy of a cached document, or None on a miss"""
+        entry = self._entries.get(doc_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(doc_id)
+        self.hits += 1
+        return dict(entry[0])
+
+    def get_many(self, doc_ids: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Split document IDs into cached copies and the IDs that missed"""
+        found, missing = {}, []
+        for doc_id in doc_ids:
+            doc = self.get(doc_id)
+            if doc is None:
+                missing.append(doc_id)
+            else:
+                found[doc_id] = doc
+        return found, missing
+
+    def put(self, doc: Dict, generation: int):
+        """Cache a document (with a string _id) read at the given generation"""
+        if generation != self.generation:
+            return
+
+        size = self.document_size(doc)
+        if size > self.max_bytes:
+            return
+
+        self._discard(doc["_id"])
+        self._entries[doc["_id"]] = (dict(doc), size)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def _discard(self, doc_id: str):
+        """Remove an entry and release its bytes"""
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def invalidate(self, doc_id: str):
+        """Drop a document that was updated or deleted"""
+        self.generation += 1
+        self._discard(doc_id)
+
+    def stats(self) -> Dict:
+        """Cache counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Global document cache instance
+document_cache = DocumentCache()
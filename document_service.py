@@ -1,11 +1,18 @@
 from mongodb import get_database
 from document import Document, DocumentCreate, DocumentUpdate
+from indexing_queue import indexing_queue
 from indexing_service import IndexingService
+from document_cache import document_cache
+from config import settings
 from fastapi import HTTPException, status
+from pydantic import ValidationError
 from bson import ObjectId
-from typing import List
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from datetime import datetime
+import asyncio
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +20,9 @@ logger = logging.getLogger(__name__)
 class DocumentService:
     """Service for document CRUD operations"""
     
+    # Maximum number of IDs per $in query when fetching documents in bulk
+    FETCH_BATCH_SIZE = 1000
+    
     @staticmethod
     async def create_document(doc_data: DocumentCreate, author_id: str) -> Document:
         """Create a new document and index it"""
@@ -30,30 +40,170 @@ class DocumentService:
         doc_id = str(result.inserted_id)
         doc.id = doc_id
         
-        # Build index for this document
-        await IndexingService.build_index_for_document(doc_id, doc.title, doc.content)
+        # Index in the background; search picks the document up within INDEX_MAX_LAG
+        await indexing_queue.add(doc_id, doc.title, doc.content)
         
         logger.info(f"✅ Created document {doc_id}")
         return doc
     
+    @staticmethod
+    async def create_documents(docs: List[DocumentCreate], author_id: str) -> List[str]:
+        """Insert a batch of documents with one insert_many and index them with one commit"""
+        if not docs:
+            return []
+        db = get_database()
+        
+        now = datetime.utcnow()
+        records = [
+            {"title": doc.title, "content": doc.content, "author_id": author_id, "created_at": now, "updated_at": now}
+            for doc in docs
+        ]
+        result = await db.documents.insert_many(records)
+        doc_ids = [str(inserted_id) for inserted_id in result.inserted_ids]
+        
+        await IndexingService.build_index_for_documents(
+            [(doc_id, doc.title, doc.content) for doc_id, doc in zip(doc_ids, docs)]
+        )
+        return doc_ids
+    
+    @staticmethod
+    async def read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[Dict], Optional[str]]]:
+        """
+        Split a byte stream into newline-delimited JSON objects
+        
+        Yields (line number, object, error) per non-blank line. Only one
+        line is buffered at a time; lines longer than BULK_MAX_LINE_BYTES
+        are skipped and reported instead of being held in memory.
+        """
+        buffer = bytearray()
+        line_no = 0
+        oversized = False
+        
+        def parse(line: bytes) -> Tuple[Optional[Dict], Optional[str]]:
+            try:
+                value = json.loads(line)
+            except ValueError as e:
+                return None, f"Invalid JSON: {e}"
+            if not isinstance(value, dict):
+                return None, "Expected a JSON object"
+            return value, None
+        
+        async for chunk in chunks:
+            start = 0
+            while True:
+                end = chunk.find(b"\n", start)
+                if end < 0:
+                    if not oversized:
+                        buffer += chunk[start:]
+                        if len(buffer) > settings.BULK_MAX_LINE_BYTES:
+                            oversized = True
+                            buffer.clear()
+                    break
+                
+                line_no += 1
+                if oversized:
+                    yield line_no, None, f"Line exceeds {settings.BULK_MAX_LINE_BYTES} bytes"
+                    oversized = False
+                else:
+                    buffer += chunk[start:end]
+                    if len(buffer) > settings.BULK_MAX_LINE_BYTES:
+                        yield line_no, None, f"Line exceeds {settings.BULK_MAX_LINE_BYTES} bytes"
+                    elif buffer.strip():
+                        yield (line_no, *parse(bytes(buffer)))
+                buffer.clear()
+                start = end + 1
+        
+        if oversized or buffer.strip():
+            line_no += 1
+            if oversized:
+                yield line_no, None, f"Line exceeds {settings.BULK_MAX_LINE_BYTES} bytes"
+            else:
+                yield (line_no, *parse(bytes(buffer)))
+    
+    @staticmethod
+    async def ingest_ndjson(chunks: AsyncIterator[bytes], author_id: str) -> AsyncIterator[Dict]:
+        """
+        Create documents from a stream of NDJSON {"title", "content"} objects
+        
+        Documents are inserted and indexed BULK_BATCH_SIZE at a time, and a
+        progress report is yielded after each batch, so memory stays bounded
+        by one batch however large the upload. Invalid lines are reported
+        and skipped.
+        
+        Yields:
+            One progress report per batch, then a summary
+        """
+        started = time.perf_counter()
+        batch: List[DocumentCreate] = []
+        errors: List[Dict] = []
+        batches = inserted = failed = 0
+        
+        async def commit() -> Dict:
+            nonlocal batches, inserted
+            doc_ids = await DocumentService.create_documents(batch, author_id)
+            batches += 1
+            inserted += len(doc_ids)
+            report = {
+                "batch": batches,
+                "inserted": len(doc_ids),
+                "total_inserted": inserted,
+                "errors": list(errors),
+                "docs_per_sec": round(inserted / max(time.perf_counter() - started, 1e-9), 1)
+            }
+            batch.clear()
+            errors.clear()
+            return report
+        
+        async for line_no, value, error in DocumentService.read_ndjson(chunks):
+            if value is not None:
+                try:
+                    batch.append(DocumentCreate(**value))
+                except ValidationError as e:
+                    error = f"Invalid document: {e.errors()[0]['loc'][-1]}: {e.errors()[0]['msg']}"
+            if error:
+                failed += 1
+                errors.append({"line": line_no, "error": error})
+            
+            # Rejected lines count towards the batch too, so their reports stay bounded as well
+            if len(batch) + len(errors) >= settings.BULK_BATCH_SIZE:
+                yield await commit()
+        
+        if batch or errors:
+            yield await commit()
+        
+        elapsed = time.perf_counter() - started
+        logger.info(f"✅ Bulk ingested {inserted} documents ({failed} rejected) in {elapsed:.1f}s")
+        yield {
+            "done": True,
+            "total_inserted": inserted,
+            "total_rejected": failed,
+            "seconds": round(elapsed, 3)
+        }
+    
     @staticmethod
     async def get_document(doc_id: str, user_id: str) -> Document:
         """Get a specific document"""
         db = get_database()
         
-        try:
-            doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
-        except:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid document ID"
-            )
-        
-        if not doc:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
+        doc = document_cache.get(doc_id)
+        if doc is None:
+            generation = document_cache.generation
+            try:
+                doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
+            except:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid document ID"
+                )
+            
+            if not doc:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Document not found"
+                )
+            
+            doc["_id"] = str(doc["_id"])
+            document_cache.put(doc, generation)
         
         # Check ownership
         if doc["author_id"] != user_id:
@@ -62,9 +212,51 @@ class DocumentService:
                 detail="Not authorized to access this document"
             )
         
-        doc["_id"] = str(doc["_id"])
         return Document(**doc)
     
+    @staticmethod
+    async def get_documents_by_ids(doc_ids: List[str], projection: Optional[Dict] = None) -> List[Dict]:
+        """
+        Fetch documents by ID with one $in query per batch, in the order given
+        
+        Full documents (no projection) are served from the document cache
+        where possible; only the misses are read from MongoDB.
+        """
+        db = get_database()
+        
+        docs_by_id = {}
+        fetch_ids = doc_ids
+        if projection is None:
+            docs_by_id, fetch_ids = document_cache.get_many(doc_ids)
+        generation = document_cache.generation
+        
+        object_ids = []
+        for doc_id in fetch_ids:
+            try:
+                object_ids.append(ObjectId(doc_id))
+            except Exception:
+                # Skip invalid IDs
+                continue
+        
+        async def fetch_batch(batch: List[ObjectId]) -> List[Dict]:
+            cursor = db.documents.find({"_id": {"$in": batch}}, projection)
+            return await cursor.to_list(length=None)
+        
+        batches = [
+            object_ids[i:i + DocumentService.FETCH_BATCH_SIZE]
+            for i in range(0, len(object_ids), DocumentService.FETCH_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(fetch_batch(batch) for batch in batches))
+        
+        for batch_docs in results:
+            for doc in batch_docs:
+                doc["_id"] = str(doc["_id"])
+                docs_by_id[doc["_id"]] = doc
+                if projection is None:
+                    document_cache.put(doc, generation)
+        
+        return [docs_by_id[doc_id] for doc_id in doc_ids if doc_id in docs_by_id]
+    
     @staticmethod
     async def get_user_documents(user_id: str, skip: int = 0, limit: int = 10) -> List[Document]:
         """Get all documents for a user"""
@@ -104,11 +296,11 @@ class DocumentService:
             {"_id": ObjectId(doc_id)},
             {"$set": update_data}
         )
+        document_cache.invalidate(doc_id)
         
-        # Re-index document
+        # Re-index only the terms that changed
         updated_doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
-        await IndexingService.remove_document_from_index(doc_id)
-        await IndexingService.build_index_for_document(
+        await indexing_queue.update(
             doc_id,
             updated_doc["title"],
             updated_doc["content"]
@@ -127,9 +319,10 @@ class DocumentService:
         await DocumentService.get_document(doc_id, user_id)
         
         # Remove from index
-        await IndexingService.remove_document_from_index(doc_id)
+        await indexing_queue.remove(doc_id)
         
         # Delete document
         await db.documents.delete_one({"_id": ObjectId(doc_id)})
+        document_cache.invalidate(doc_id)
         
         logger.info(f"✅ Deleted document {doc_id}")
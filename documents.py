@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, status, Query
+from fastapi import APIRouter, Depends, status, Query, Request
+from fastapi.responses import StreamingResponse
 from auth_middleware import get_current_user
 from document_service import DocumentService
 from document import DocumentCreate, DocumentUpdate, DocumentResponse
 from user import User
 from typing import List
+import anyio
+import json
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
 
 
+class BodyStreamingResponse(StreamingResponse):
+    """Streaming response whose content is produced while the request body is still being read"""
+
+    async def listen_for_disconnect(self, receive):
+        # The body reader owns receive(); a disconnect surfaces there as ClientDisconnect
+        await anyio.sleep_forever()
+
+
 @router.post("", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
 async def create_document(
     doc_data: DocumentCreate,
@@ -18,6 +29,25 @@ async def create_document(
     return doc
 
 
+@router.post("/bulk")
+async def create_documents_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create documents from a newline-delimited JSON body of {"title", "content"} objects
+
+    The body is read as a stream and documents are inserted and indexed in
+    batches; one NDJSON progress line is streamed back per batch, followed
+    by a summary line.
+    """
+    async def progress():
+        async for report in DocumentService.ingest_ndjson(request.stream(), current_user.id):
+            yield json.dumps(report) + "\n"
+    
+    return BodyStreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 @router.get("", response_model=List[DocumentResponse])
 async def get_documents(
     skip: int = Query(0, ge=0),
@@ -0,0 +1,151 @@
+"""
+Typo-tolerant term lookup using a SymSpell-style deletion dictionary
+"""
+from mongodb import get_index_collections
+from index_engine import index_engine
+from config import settings
+from typing import Dict, Iterable, List, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def damerau_levenshtein(word1: str, word2: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance between two words, bounded by max_distance
+
+    Returns max_distance + 1 as soon as the distance is known to exceed the bound.
+    """
+    if word1 == word2:
+        return 0
+
+    len1, len2 = len(word1), len(word2)
+    if abs(len1 - len2) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len2 + 1))
+
+    for i in range(1, len1 + 1):
+        current = [i] + [0] * len2
+        row_min = i
+        for j in range(1, len2 + 1):
+            cost = 0 if word1[i - 1] == word2[j - 1] else 1
+            value = min(
+                previous[j] + 1,         # deletion
+                current[j - 1] + 1,      # insertion
+                previous[j - 1] + cost   # substitution
+            )
+            if (i > 1 and j > 1 and word1[i - 1] == word2[j - 2]
+                    and word1[i - 2] == word2[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)  # transposition
+            current[j] = value
+            row_min = min(row_min, value)
+
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+
+    distance = previous[len2]
+    return distance if distance <= max_distance else max_distance + 1
+
+
+class FuzzyTermIndex:
+    """
+    Precomputed deletion dictionary over the indexed vocabulary.
+
+    Every term registers the strings obtained by deleting up to max_distance
+    characters from its first prefix_length characters. A lookup generates
+    the same deletes for the query word, so candidates are found by
+    dictionary hits instead of comparing against every term, and only those
+    candidates are verified with a bounded Damerau-Levenshtein distance.
+    """
+
+    def __init__(self, max_distance: int = None, prefix_length: int = None):
+        self.max_distance = settings.FUZZY_MAX_DISTANCE if max_distance is None else max_distance
+        self.prefix_length = settings.FUZZY_PREFIX_LENGTH if prefix_length is None else prefix_length
+        self.loaded = False
+        self._terms: Set[str] = set()
+        self._deletes: Dict[str, Set[str]] = {}
+
+    def clear(self):
+        """Drop all terms"""
+        self._terms = set()
+        self._deletes = {}
+
+    async def load(self):
+        """Build the deletion dictionary from the current vocabulary"""
+        if index_engine.loaded:
+            terms = index_engine.terms()
+        else:
+            inverted_index, _ = get_index_collections()
+            terms = await inverted_index.distinct("term")
+
+        # Build a fresh dictionary and swap it in whole so lookups never see a partial one
+        fresh = FuzzyTermIndex(self.max_distance, self.prefix_length)
+        fresh.add_terms(terms)
+        self._terms, self._deletes = fresh._terms, fresh._deletes
+
+        self.loaded = True
+        logger.info(f"✅ Loaded fuzzy term index: {len(self._terms)} terms, {len(self._deletes)} deletes")
+
+    def _generate_deletes(self, word: str) -> Set[str]:
+        """All variants of the word's prefix with up to max_distance characters deleted"""
+        deletes = {word[:self.prefix_length]}
+        frontier = set(deletes)
+        for _ in range(self.max_distance):
+            next_frontier = set()
+            for variant in frontier:
+                for i in range(len(variant)):
+                    next_frontier.add(variant[:i] + variant[i + 1:])
+            next_frontier -= deletes
+            deletes |= next_frontier
+            frontier = next_frontier
+        return deletes
+
+    def add_term(self, term: str):
+        """Register a term"""
+        if term in self._terms:
+            return
+        self._terms.add(term)
+        for variant in self._generate_deletes(term):
+            self._deletes.setdefault(variant, set()).add(term)
+
+    def add_terms(self, terms: Iterable[str]):
+        """Register several terms"""
+        for term in terms:
+            self.add_term(term)
+
+    def remove_term(self, term: str):
+        """Unregister a term that no longer appears in any document"""
+        if term not in self._terms:
+            return
+        self._terms.discard(term)
+        for variant in self._generate_deletes(term):
+            bucket = self._deletes.get(variant)
+            if bucket is not None:
+                bucket.discard(term)
+                if not bucket:
+                    del self._deletes[variant]
+
+    def lookup(self, word: str, max_distance: int = None) -> List[Tuple[str, int]]:
+        """Find indexed terms within max_distance edits of word, closest first"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        candidates = set()
+        for variant in self._generate_deletes(word):
+            candidates.update(self._deletes.get(variant, ()))
+
+        matches = []
+        for candidate in candidates:
+            distance = damerau_levenshtein(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((candidate, distance))
+
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+
+# Global fuzzy term index instance
+fuzzy_index = FuzzyTermIndex()
@@ -0,0 +1,207 @@
+"""
+Offline bulk importer: load documents from JSONL or CSV files and index them
+
+Files are read as a stream, tokenized across a process pool, deduplicated
+by content hash (against each other and the documents already stored),
+and written with insert_many plus one bulk index commit per batch.
+
+Run it while the API server is stopped: postings are merged without the
+concurrency checks live writes use, and a running server would not see
+the new documents until it reloads the index.
+
+Usage:
+    python import_documents.py corpus.jsonl [more.csv ...] [--author-email EMAIL]
+        [--title-field title] [--content-field content] [--batch-size N] [--workers N]
+"""
+from mongodb import connect_db, close_db, get_database, INDEX_FORMAT
+import mongodb
+from doc_id_map import DocIdMap
+from indexing_service import IndexingService, analyze_documents, analysis_pool
+from segment_store import segment_store
+from text_processing import analyzer
+from config import settings
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import sys
+import time
+
+
+def open_text(path: str) -> io.TextIOBase:
+    """Open a (optionally gzipped) text file"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """Stream records from a JSONL or CSV file, chosen by extension"""
+    name = path[:-3] if path.endswith(".gz") else path
+    with open_text(path) as f:
+        if name.endswith(".csv"):
+            csv.field_size_limit(sys.maxsize)
+            yield from csv.DictReader(f)
+            return
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print(f"   ⚠️ {path}:{line_no}: invalid JSON, skipped")
+
+
+def content_hash(title: str, content: str) -> bytes:
+    """Digest identifying a document by its text"""
+    return hashlib.blake2b(f"{title}\0{content}".encode("utf-8"), digest_size=16).digest()
+
+
+class Importer:
+    """Streams files into the documents collection and the active index"""
+
+    def __init__(self, author_id: str, title_field: str, content_field: str, batch_size: int, workers: int):
+        self.author_id = author_id
+        self.title_field = title_field
+        self.content_field = content_field
+        self.batch_size = batch_size
+        self.workers = workers
+        self.seen: Set[bytes] = set()
+        self.read = self.duplicates = self.invalid = self.imported = 0
+        self.started = time.perf_counter()
+
+    async def load_existing_hashes(self):
+        """Seed the dedupe set with the documents already stored"""
+        cursor = get_database().documents.find({}, {"title": 1, "content": 1, "_id": 0})
+        async for doc in cursor:
+            self.seen.add(content_hash(doc.get("title", ""), doc.get("content", "")))
+        print(f"   {len(self.seen):,} existing documents")
+
+    def batches(self, paths: List[str]) -> Iterator[List[Tuple[str, str]]]:
+        """Valid, previously unseen (title, content) pairs in batches"""
+        batch = []
+        for path in paths:
+            for record in read_records(path):
+                self.read += 1
+                title = str(record.get(self.title_field) or "").strip()
+                content = str(record.get(self.content_field) or "").strip()
+                if not title or not content:
+                    self.invalid += 1
+                    continue
+
+                digest = content_hash(title, content)
+                if digest in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(digest)
+
+                batch.append((title[:200], content))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def commit(self, documents: List[Tuple[str, str]], analysis):
+        """Insert a batch of documents and write their postings"""
+        now = datetime.utcnow()
+        result = await get_database().documents.insert_many([
+            {"title": title, "content": content, "author_id": self.author_id, "created_at": now, "updated_at": now}
+            for title, content in documents
+        ])
+        doc_ids = [str(inserted_id) for inserted_id in result.inserted_ids]
+
+        # Analysis ran on placeholder IDs (positions in the batch) while the previous batch was written
+        analyzed = [(doc_ids[int(index)], term_positions) for chunk in await analysis for index, term_positions in chunk]
+
+        if settings.INDEX_STORAGE == "segments":
+            await segment_store.add_documents(analyzed)
+        else:
+            doc_nums = await DocIdMap.assign(doc_ids)
+            await asyncio.gather(
+                IndexingService.write_doc_stats(analyzed),
+                IndexingService.merge_postings(analyzed, doc_nums)
+            )
+
+        self.imported += len(documents)
+        elapsed = time.perf_counter() - self.started
+        print(
+            f"📦 {self.imported:,} imported, {self.duplicates:,} duplicates, {self.invalid:,} invalid "
+            f"({self.imported / max(elapsed, 1e-9):,.0f} docs/sec)"
+        )
+
+    async def run(self, paths: List[str]):
+        loop = asyncio.get_running_loop()
+        with analysis_pool(self.workers) as pool:
+            pending = None
+            for documents in self.batches(paths):
+                # Tokenize this batch in the pool while the previous batch is written
+                placeholders = [(str(i), title, content) for i, (title, content) in enumerate(documents)]
+                chunk_size = max(1, -(-len(placeholders) // self.workers))
+                analysis = asyncio.gather(*(
+                    loop.run_in_executor(pool, analyze_documents, placeholders[i:i + chunk_size])
+                    for i in range(0, len(placeholders), chunk_size)
+                ))
+
+                if pending:
+                    await self.commit(*pending)
+                pending = (documents, analysis)
+
+            if pending:
+                await self.commit(*pending)
+
+        if settings.INDEX_STORAGE == "segments":
+            await segment_store.flush()
+            await segment_store.close()
+
+
+async def resolve_author(email: Optional[str]) -> Optional[str]:
+    """ID of the user owning the imported documents"""
+    user = await get_database().users.find_one({"email": email or "sample@example.com"})
+    return str(user["_id"]) if user else None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Import documents from JSONL or CSV files and index them")
+    parser.add_argument("paths", nargs="+", help="JSONL (.jsonl/.ndjson) or CSV (.csv) files, optionally .gz")
+    parser.add_argument("--author-email", help="Owner of the imported documents (default: the sample user)")
+    parser.add_argument("--title-field", default="title")
+    parser.add_argument("--content-field", default="content")
+    parser.add_argument("--batch-size", type=int, default=settings.REBUILD_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.INDEX_WORKERS)
+    args = parser.parse_args()
+
+    print("🚀 BULK IMPORT")
+    await connect_db()
+    try:
+        if settings.INDEX_STORAGE != "segments" and (
+            mongodb.active_index_format < INDEX_FORMAT or mongodb.active_index_analyzer != analyzer.signature()
+        ):
+            print("❌ The index was built in an older format or with another analyzer; "
+                  "start the server once to migrate it first")
+            return
+
+        author_id = await resolve_author(args.author_email)
+        if author_id is None:
+            print(f"❌ No user with email {args.author_email or 'sample@example.com'}")
+            return
+
+        importer = Importer(author_id, args.title_field, args.content_field, args.batch_size, args.workers)
+        await importer.load_existing_hashes()
+        await importer.run(args.paths)
+
+        elapsed = time.perf_counter() - importer.started
+        print(f"\n🎉 Imported {importer.imported:,} of {importer.read:,} records in {elapsed:.1f}s "
+              f"({importer.imported / max(elapsed, 1e-9):,.0f} docs/sec)")
+        print(f"   {importer.duplicates:,} duplicates and {importer.invalid:,} invalid records skipped")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
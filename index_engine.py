@@ -0,0 +1,291 @@
+"""
+In-memory inverted index engine backed by compact typed arrays
+"""
+from mongodb import get_index_collections
+from postings_codec import decode_postings, doc_set_cardinality
+from segment_store import segment_store
+from config import settings
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Iterable, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TermPostings:
+    """
+    Sorted internal document numbers and matching term frequencies for one term.
+
+    Postings loaded from MongoDB keep their stored bucket encoding and are
+    only decoded into arrays the first time a query reads or changes them.
+    """
+
+    __slots__ = ("_doc_nums", "_freqs", "_encoded")
+
+    def __init__(self, encoded: Optional[List[Tuple[bytes, bytes]]] = None):
+        self._encoded = encoded
+        self._doc_nums = array("i")
+        self._freqs = array("i")
+
+    def _decode(self):
+        doc_nums, freqs = decode_postings(self._encoded)
+        self._doc_nums = array("i", doc_nums.astype(np.int32).tobytes())
+        self._freqs = array("i", freqs.astype(np.int32).tobytes())
+        self._encoded = None
+
+    @property
+    def doc_nums(self) -> array:
+        if self._encoded is not None:
+            self._decode()
+        return self._doc_nums
+
+    @doc_nums.setter
+    def doc_nums(self, doc_nums: array):
+        self._doc_nums = doc_nums
+
+    @property
+    def freqs(self) -> array:
+        if self._encoded is not None:
+            self._decode()
+        return self._freqs
+
+    @freqs.setter
+    def freqs(self, freqs: array):
+        self._freqs = freqs
+
+    def __len__(self) -> int:
+        if self._encoded is not None:
+            return sum(doc_set_cardinality(doc_set) for doc_set, _ in self._encoded)
+        return len(self._doc_nums)
+
+    def set(self, doc_num: int, freq: int):
+        """Insert or update the posting for a document, keeping doc_nums sorted"""
+        pos = bisect_left(self.doc_nums, doc_num)
+        if pos < len(self.doc_nums) and self.doc_nums[pos] == doc_num:
+            self.freqs[pos] = freq
+        else:
+            self.doc_nums.insert(pos, doc_num)
+            self.freqs.insert(pos, freq)
+
+    def discard(self, doc_num: int) -> bool:
+        """Remove the posting for a document if present"""
+        pos = bisect_left(self.doc_nums, doc_num)
+        if pos < len(self.doc_nums) and self.doc_nums[pos] == doc_num:
+            del self.doc_nums[pos]
+            del self.freqs[pos]
+            return True
+        return False
+
+
+class IndexEngine:
+    """
+    In-process copy of the inverted index used to serve term lookups.
+
+    MongoDB stays the durable store; the engine is loaded from it at startup
+    and kept in sync by IndexingService. Documents are addressed by the
+    same dense integer numbers stored in the MongoDB postings, so postings
+    live in typed arrays instead of lists of ObjectId strings.
+
+    With INDEX_STORAGE set to "segments", postings are not held here at
+    all: they are read from the memory-mapped segment store, and only the
+    document number maps and lengths are kept in memory.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._postings: Dict[str, TermPostings] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_nums: Dict[str, int] = {}
+        self.doc_lengths = array("i")
+
+    def clear(self):
+        """Drop all postings and document numbers"""
+        self._postings = {}
+        self._doc_ids = []
+        self._doc_nums = {}
+        self.doc_lengths = array("i")
+
+    @property
+    def uses_segments(self) -> bool:
+        """Whether postings are served from the segment store"""
+        return settings.INDEX_STORAGE == "segments"
+
+    async def load(self):
+        """Load postings and document lengths from MongoDB, or open the segment store"""
+        if self.uses_segments:
+            await self._load_segments()
+            return
+
+        inverted_index, doc_stats = get_index_collections()
+
+        # Build into a fresh engine and swap it in whole so lookups never see a partial index
+        fresh = IndexEngine()
+
+        cursor = doc_stats.find({}, {"doc_id": 1, "doc_num": 1, "length": 1})
+        async for entry in cursor:
+            fresh._register(entry["doc_id"], entry["doc_num"])
+            fresh.doc_lengths[entry["doc_num"]] = entry.get("length", 0)
+
+        # Each term's buckets arrive in order and are joined into one postings array
+        cursor = inverted_index.find(
+            {}, {"term": 1, "doc_nums": 1, "freqs": 1}
+        ).sort([("term", 1), ("bucket", 1)])
+        term, buckets = None, []
+        async for entry in cursor:
+            if entry["term"] != term:
+                if buckets:
+                    fresh._postings[term] = TermPostings(buckets)
+                term, buckets = entry["term"], []
+            buckets.append((entry["doc_nums"], entry["freqs"]))
+        if buckets:
+            fresh._postings[term] = TermPostings(buckets)
+
+        self._postings = fresh._postings
+        self._doc_ids = fresh._doc_ids
+        self._doc_nums = fresh._doc_nums
+        self.doc_lengths = fresh.doc_lengths
+        self.loaded = True
+        logger.info(f"✅ Loaded in-memory index: {len(self._postings)} terms, {len(self._doc_ids)} documents")
+
+    async def _load_segments(self):
+        """Load document numbers and lengths from the segment store's document tables"""
+        await segment_store.open()
+
+        # No await between building and swapping, so the maps always match the store's segments
+        fresh = IndexEngine()
+        for doc_num, doc_id, length in segment_store.documents():
+            fresh._register(doc_id, doc_num)
+            fresh.doc_lengths[doc_num] = length
+
+        self._postings = {}
+        self._doc_ids = fresh._doc_ids
+        self._doc_nums = fresh._doc_nums
+        self.doc_lengths = fresh.doc_lengths
+        self.loaded = True
+        logger.info(f"✅ Loaded segment index: {len(self._doc_nums)} documents")
+
+    def _register(self, doc_id: str, doc_num: int):
+        """Record a document's number, growing the per-document arrays to cover it"""
+        if doc_num >= len(self._doc_ids):
+            grow = doc_num + 1 - len(self._doc_ids)
+            self._doc_ids.extend([None] * grow)
+            self.doc_lengths.extend([0] * grow)
+        self._doc_ids[doc_num] = doc_id
+        self._doc_nums[doc_id] = doc_num
+
+    def add_document(self, doc_id: str, doc_num: int, term_freqs: Dict[str, int], doc_length: int):
+        """Add or replace a document's postings (ignored until the engine is loaded)"""
+        if not self.loaded:
+            return
+
+        self._register(doc_id, doc_num)
+        self.doc_lengths[doc_num] = doc_length
+        if self.uses_segments:
+            return
+
+        for term, freq in term_freqs.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = TermPostings()
+            postings.set(doc_num, freq)
+
+    def update_document(
+        self,
+        doc_id: str,
+        term_freqs: Dict[str, int],
+        removed_terms: Iterable[str],
+        doc_length: int
+    ) -> List[str]:
+        """
+        Apply a term-level diff to an indexed document
+
+        Returns:
+            Removed terms that no longer appear in any document
+        """
+        if not self.loaded:
+            return []
+
+        doc_num = self._doc_nums.get(doc_id)
+        if doc_num is None:
+            return []
+        self.add_document(doc_id, doc_num, term_freqs, doc_length)
+
+        emptied = []
+        for term in removed_terms:
+            postings = self._postings.get(term)
+            if postings is not None and postings.discard(doc_num) and not postings:
+                del self._postings[term]
+                emptied.append(term)
+        return emptied
+
+    def remove_document(self, doc_id: str, terms: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Remove a document from the postings of the given terms (all terms if omitted)
+
+        Returns:
+            Terms that no longer appear in any document
+        """
+        if not self.loaded:
+            return []
+
+        doc_num = self._doc_nums.get(doc_id)
+        if doc_num is None:
+            return []
+
+        if self.uses_segments:
+            # The segment store has already dropped or tombstoned the document
+            emptied = [term for term in terms or [] if segment_store.get_postings(term) is None]
+        else:
+            if terms is None:
+                terms = list(self._postings)
+
+            emptied = []
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None and postings.discard(doc_num) and not postings:
+                    del self._postings[term]
+                    emptied.append(term)
+
+        self.doc_lengths[doc_num] = 0
+        self._doc_ids[doc_num] = None
+        del self._doc_nums[doc_id]
+        return emptied
+
+    def get_postings(self, term: str) -> Optional[TermPostings]:
+        """Get the postings for a term"""
+        if self.uses_segments:
+            stored = segment_store.get_postings(term)
+            if stored is None:
+                return None
+            postings = TermPostings()
+            postings.doc_nums = array("i", stored[0].astype(np.int32).tobytes())
+            postings.freqs = array("i", stored[1].astype(np.int32).tobytes())
+            return postings
+        return self._postings.get(term)
+
+    def get_doc_ids(self, term: str) -> List[str]:
+        """Get the document IDs containing a term"""
+        postings = self.get_postings(term)
+        if postings is None:
+            return []
+        return [self._doc_ids[doc_num] for doc_num in postings.doc_nums]
+
+    def doc_id(self, doc_num: int) -> str:
+        """Translate an internal document number back to its document ID"""
+        return self._doc_ids[doc_num]
+
+    def doc_num(self, doc_id: str) -> Optional[int]:
+        """Translate a document ID to its internal number"""
+        return self._doc_nums.get(doc_id)
+
+    def terms(self) -> List[str]:
+        """Get all indexed terms"""
+        if self.uses_segments:
+            return list(segment_store.terms())
+        return list(self._postings)
+
+
+# Global index engine instance
+index_engine = IndexEngine()
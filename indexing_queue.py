@@ -0,0 +1,224 @@
+"""
+Background indexing worker fed by a bounded queue
+"""
+from indexing_service import IndexingService
+from config import settings
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Queued index operations
+ADD = "add"
+UPDATE = "update"
+REMOVE = "remove"
+
+
+class IndexingQueue:
+    """
+    Moves index maintenance off the request path.
+
+    Document writes enqueue an operation and return; a single worker
+    drains the queue in batches of up to INDEX_QUEUE_BATCH operations,
+    keeps only the net operation per document, and indexes all new
+    documents of a batch with one group commit. A full queue makes
+    writers wait (backpressure), and so does an index more than
+    INDEX_MAX_LAG seconds behind, which bounds how stale search can get.
+
+    A batch that fails is retried with exponential backoff, together with
+    whatever was queued meanwhile, so newer operations on the same
+    documents still win. After MAX_ATTEMPTS its documents are reported as
+    failed (and the index as needing a reconcile) until a later operation
+    on them succeeds.
+
+    Until the worker is started (or with INDEX_QUEUE_SIZE=0) operations
+    are applied inline, so scripts using the services directly still index.
+    """
+
+    # Attempts at a failing batch before its documents are given up on
+    MAX_ATTEMPTS = 5
+    # Seconds before the first retry, doubling up to MAX_BACKOFF
+    RETRY_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._caught_up: Optional[asyncio.Condition] = None
+        # Enqueue times of queued operations, oldest first
+        self._enqueued: Deque[float] = deque()
+        self.indexed = 0
+        self.commits = 0
+        self.failures = 0
+        self.last_commit_size = 0
+        # Operations of the failed batch awaiting a retry, still counted as queued
+        self._retry: List[Tuple] = []
+        self._attempts = 0
+        # Documents whose operations were given up on, by ID
+        self.failed: Dict[str, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start the worker (no-op when INDEX_QUEUE_SIZE is 0)"""
+        if self.running or settings.INDEX_QUEUE_SIZE <= 0:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.INDEX_QUEUE_SIZE)
+        self._caught_up = asyncio.Condition()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"✅ Started indexing worker (queue size {settings.INDEX_QUEUE_SIZE})")
+
+    async def stop(self):
+        """Index everything still queued, then stop the worker"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def flush(self):
+        """Wait until every queued operation has been indexed"""
+        if self.running:
+            await self._queue.join()
+
+    def lag(self) -> float:
+        """Age in seconds of the oldest operation not yet indexed"""
+        return time.monotonic() - self._enqueued[0] if self._enqueued else 0.0
+
+    async def add(self, doc_id: str, title: str, content: str):
+        """Index a new document"""
+        await self._submit((ADD, doc_id, title, content))
+
+    async def update(self, doc_id: str, title: str, content: str):
+        """Re-index an edited document"""
+        await self._submit((UPDATE, doc_id, title, content))
+
+    async def remove(self, doc_id: str):
+        """Remove a document from the index"""
+        await self._submit((REMOVE, doc_id, None, None))
+
+    async def _submit(self, operation: Tuple):
+        if not self.running:
+            await self._apply([operation])
+            return
+
+        if self.lag() > settings.INDEX_MAX_LAG:
+            async with self._caught_up:
+                await self._caught_up.wait_for(lambda: self.lag() <= settings.INDEX_MAX_LAG)
+
+        # Blocks while the queue is full
+        enqueued = time.monotonic()
+        await self._queue.put(operation)
+        self._enqueued.append(enqueued)
+
+    async def _run(self):
+        while True:
+            if self._retry:
+                batch, self._retry = self._retry, []
+            else:
+                batch = [await self._queue.get()]
+
+            # Linger briefly so a burst of writes lands in one commit
+            deadline = time.monotonic() + settings.INDEX_QUEUE_LINGER
+            while len(batch) < settings.INDEX_QUEUE_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._apply(batch)
+                for operation in batch:
+                    self.failed.pop(operation[1], None)
+            except Exception as e:
+                self.failures += 1
+                self._attempts += 1
+                if self._attempts < self.MAX_ATTEMPTS:
+                    logger.warning(
+                        f"⚠️ Indexing batch of {len(batch)} operations failed "
+                        f"(attempt {self._attempts} of {self.MAX_ATTEMPTS}), retrying: {e}"
+                    )
+                    self._retry = batch
+                    await asyncio.sleep(min(self.RETRY_BACKOFF * 2 ** (self._attempts - 1), self.MAX_BACKOFF))
+                    continue
+                logger.error(f"❌ Indexing batch of {len(batch)} operations failed {self._attempts} times, giving up: {e}")
+                for operation in batch:
+                    self.failed[operation[1]] = operation[0]
+
+            self._attempts = 0
+            for _ in batch:
+                self._enqueued.popleft()
+                self._queue.task_done()
+
+            async with self._caught_up:
+                self._caught_up.notify_all()
+
+    @staticmethod
+    def coalesce(operations: List[Tuple]) -> Dict[str, Tuple]:
+        """
+        Reduce a batch to one net operation per document, in first-seen order
+
+        An edit of a document added in the same batch is folded into the
+        add; a later remove replaces whatever came before.
+        """
+        net: Dict[str, Tuple] = {}
+        for operation in operations:
+            kind, doc_id = operation[0], operation[1]
+            previous = net.get(doc_id)
+            if previous is not None and previous[0] == ADD and kind == UPDATE:
+                operation = (ADD,) + operation[1:]
+            net[doc_id] = operation
+        return net
+
+    async def _apply(self, operations: List[Tuple]):
+        net = IndexingQueue.coalesce(operations)
+
+        # Removes and edits first, then every new document in one group commit
+        for kind, doc_id, title, content in net.values():
+            if kind == REMOVE:
+                await IndexingService.remove_document_from_index(doc_id)
+            elif kind == UPDATE:
+                await IndexingService.update_document_index(doc_id, title, content)
+
+        additions = [
+            (doc_id, title, content) for kind, doc_id, title, content in net.values() if kind == ADD
+        ]
+        if additions:
+            await IndexingService.build_index_for_documents(additions)
+
+        self.indexed += len(net)
+        self.commits += 1
+        self.last_commit_size = len(net)
+
+    def stats(self) -> Dict:
+        """Queue depth, indexing lag, commit counters and documents that could not be indexed"""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "lag_seconds": round(self.lag(), 3),
+            "max_lag_seconds": settings.INDEX_MAX_LAG,
+            "indexed": self.indexed,
+            "commits": self.commits,
+            "last_commit_size": self.last_commit_size,
+            "failures": self.failures,
+            "retry_attempt": self._attempts,
+            "failed_documents": len(self.failed),
+            "failed_doc_ids": list(self.failed)[:20],
+            "needs_reconcile": bool(self.failed)
+        }
+
+
+# Global indexing queue instance
+indexing_queue = IndexingQueue()
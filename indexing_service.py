@@ -1,7 +1,29 @@
-from mongodb import get_database
-from text_processing import process_text, get_unique_terms
-from typing import List, Dict
+from mongodb import (
+    get_database, get_index_collections, create_index_collection_indexes,
+    activate_index_version, drop_inactive_index_versions
+)
+import mongodb
+from doc_id_map import DocIdMap
+from text_processing import analyzer
+from index_engine import index_engine
+from fuzzy_index import fuzzy_index
+from collection_stats import collection_stats
+from suggest_index import suggest_index
+from query_cache import query_cache
+from segment_store import segment_store
+from postings_codec import encode_doc_set, decode_doc_set, decode_doc_sets, encode_freqs, decode_freqs, encode_positions
+from config import settings
+from pymongo import UpdateOne, InsertOne, DeleteOne
+from bson import ObjectId
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import asyncio
+import multiprocessing
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -9,95 +31,906 @@ logger = logging.getLogger(__name__)
 class IndexingService:
     """Service for building and maintaining inverted index"""
     
+    # Catch-up passes run over a shadow index before it is activated
+    RECONCILE_PASSES = 3
+    # Allowance for clock skew when selecting documents edited during a rebuild
+    RECONCILE_MARGIN = timedelta(seconds=1)
+    # Stored bytes of a posting besides its positions: the BSON field plus its share of the document set and frequencies
+    POSTING_OVERHEAD = 16
+    
+    @staticmethod
+    def analyze_document(title: str, content: str) -> Dict[str, List[int]]:
+        """Record the positions of each term in a document's indexed text"""
+        # Title is indexed twice for higher weight, each field at its own position base
+        return analyzer.document_positions(title, content)
+    
+    @staticmethod
+    def term_frequencies(term_positions: Dict[str, List[int]]) -> Dict[str, int]:
+        """Count term occurrences from their positions"""
+        return {term: len(positions) for term, positions in term_positions.items()}
+    
+    @staticmethod
+    def posting_size(doc_num: int, encoded_positions: bytes) -> int:
+        """Estimated bytes a posting adds to its bucket document"""
+        return len(encoded_positions) + len(str(doc_num)) + IndexingService.POSTING_OVERHEAD
+    
     @staticmethod
     async def build_index_for_document(doc_id: str, title: str, content: str):
         """Build inverted index entries for a document"""
-        db = get_database()
+        await IndexingService.build_index_for_documents([(doc_id, title, content)])
+    
+    @staticmethod
+    async def build_index_for_documents(documents: List[Tuple[str, str, str]]):
+        """Build inverted index entries for a batch of (doc_id, title, content) documents"""
+        analyzed = analyze_documents(documents)
         
-        # Combine title and content for indexing (title gets more weight)
-        full_text = f"{title} {title} {content}"  # Title appears twice for higher weight
+        if index_engine.uses_segments:
+            doc_nums, replaced = await segment_store.add_documents(analyzed)
+            for doc_id, (doc_terms, doc_length) in replaced.items():
+                IndexingService.forget_document(doc_id, doc_terms, doc_length)
+        else:
+            doc_nums = await IndexingService.write_postings(analyzed)
         
-        # Get unique terms
-        terms = get_unique_terms(full_text)
+        for doc_id, term_positions in analyzed:
+            term_freqs = IndexingService.term_frequencies(term_positions)
+            doc_length = sum(term_freqs.values())
+            index_engine.add_document(doc_id, doc_nums[doc_id], term_freqs, doc_length)
+            fuzzy_index.add_terms(term_freqs)
+            collection_stats.add_document(term_freqs, doc_length)
+            suggest_index.update_terms(term_freqs)
+        query_cache.bump_generation()
         
-        # Update inverted index for each term
-        for term in terms:
-            await db.inverted_index.update_one(
-                {"term": term},
-                {
-                    "$addToSet": {"doc_ids": doc_id},
-                    "$inc": {"doc_count": 0}  # Will be set correctly below
-                },
+        if len(analyzed) == 1:
+            doc_id, term_positions = analyzed[0]
+            logger.info(f"✅ Indexed document {doc_id} with {len(term_positions)} unique terms")
+        else:
+            logger.info(f"✅ Indexed {len(analyzed)} documents")
+    
+    @staticmethod
+    async def write_postings(
+        analyzed: List[Tuple[str, Dict[str, List[int]]]],
+        version: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Persist postings, lengths and forward index entries for analyzed documents
+        
+        Returns:
+            The document number of each document
+        """
+        if not analyzed:
+            return {}
+        
+        doc_nums = await DocIdMap.assign([doc_id for doc_id, _ in analyzed], version)
+        await asyncio.gather(
+            IndexingService.write_doc_stats(analyzed, version),
+            IndexingService.add_postings(analyzed, doc_nums, version)
+        )
+        return doc_nums
+    
+    @staticmethod
+    async def write_doc_stats(analyzed: List[Tuple[str, Dict[str, List[int]]]], version: Optional[int] = None):
+        """Store document lengths plus the forward index (document -> term frequencies)"""
+        _, doc_stats = get_index_collections(version)
+        
+        writes = []
+        for doc_id, term_positions in analyzed:
+            term_freqs = IndexingService.term_frequencies(term_positions)
+            writes.append(UpdateOne(
+                {"doc_id": doc_id},
+                {"$set": {"length": sum(term_freqs.values()), "term_freqs": term_freqs}},
                 upsert=True
+            ))
+        
+        await doc_stats.bulk_write(writes, ordered=False)
+    
+    @staticmethod
+    async def add_postings(
+        analyzed: List[Tuple[str, Dict[str, List[int]]]],
+        doc_nums: Dict[str, int],
+        version: Optional[int] = None
+    ):
+        """
+        Add postings for analyzed documents
+        
+        Each posting is routed to a bucket of its term. Positions are
+        per-document fields, so they are set (and the bucket's estimated size
+        increased) with one unordered bulk upsert per touched bucket; the
+        documents and their term frequencies are then added to each bucket's
+        compressed document set.
+        """
+        inverted_index, _ = get_index_collections(version)
+        
+        # Group encoded postings by term so each bucket is upserted once per batch
+        postings_by_term: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+        for doc_id, term_positions in analyzed:
+            doc_num = doc_nums[doc_id]
+            for term, positions in term_positions.items():
+                postings_by_term.setdefault(term, {})[doc_num] = (len(positions), encode_positions(positions))
+        
+        while postings_by_term:
+            routed = await IndexingService.route_postings(inverted_index, {
+                term: {doc_num: IndexingService.posting_size(doc_num, data) for doc_num, (_, data) in postings.items()}
+                for term, postings in postings_by_term.items()
+            })
+            
+            # A document written again (e.g. by a resumed rebuild) replaces its positions, so only the difference counts
+            replaced = {}
+            cursor = inverted_index.find(
+                {"$or": [{"term": term, "bucket": bucket} for term, bucket in routed]},
+                {"term": 1, "bucket": 1, **{
+                    f"positions.{doc_num}": 1
+                    for bucket_nums in routed.values() for doc_num in bucket_nums
+                }}
             )
+            async for entry in cursor:
+                for doc_num, data in entry.get("positions", {}).items():
+                    replaced[(entry["term"], entry["bucket"], int(doc_num))] = data
+            
+            writes = []
+            for (term, bucket), bucket_nums in routed.items():
+                postings = postings_by_term[term]
+                fields = {f"positions.{doc_num}": postings[doc_num][1] for doc_num in bucket_nums}
+                size = sum(
+                    IndexingService.posting_size(doc_num, postings[doc_num][1])
+                    - (IndexingService.posting_size(doc_num, replaced[(term, bucket, doc_num)])
+                       if (term, bucket, doc_num) in replaced else 0)
+                    for doc_num in bucket_nums
+                )
+                writes.append(UpdateOne(
+                    {"term": term, "bucket": bucket},
+                    {
+                        "$setOnInsert": {
+                            "min_doc": bucket_nums[0],
+                            "last_doc": -1,
+                            "doc_nums": encode_doc_set([]),
+                            "freqs": encode_freqs([]),
+                            "doc_count": 0,
+                            "rev": 0
+                        },
+                        "$set": fields,
+                        "$inc": {"size": size}
+                    },
+                    upsert=True
+                ))
+            await inverted_index.bulk_write(writes, ordered=False)
+            
+            # Buckets emptied and deleted by a concurrent removal in the meantime are written again
+            missing = await IndexingService.update_doc_sets(inverted_index, added={
+                key: {doc_num: postings_by_term[key[0]][doc_num][0] for doc_num in bucket_nums}
+                for key, bucket_nums in routed.items()
+            })
+            retry: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+            for term, bucket in missing:
+                for doc_num in routed[(term, bucket)]:
+                    retry.setdefault(term, {})[doc_num] = postings_by_term[term][doc_num]
+            postings_by_term = retry
+    
+    @staticmethod
+    async def route_postings(
+        inverted_index,
+        sizes_by_term: Dict[str, Dict[int, int]]
+    ) -> Dict[Tuple[str, int], List[int]]:
+        """Group new postings, given as {term: {doc_num: estimated size}}, by the (term, bucket) they belong in"""
+        buckets_by_term: Dict[str, List[Dict]] = {}
+        cursor = inverted_index.find(
+            {"term": {"$in": list(sizes_by_term)}},
+            {"term": 1, "bucket": 1, "min_doc": 1, "last_doc": 1, "doc_count": 1, "size": 1}
+        ).sort([("term", 1), ("bucket", 1)])
+        async for entry in cursor:
+            buckets_by_term.setdefault(entry["term"], []).append(entry)
         
-        # Update document counts
-        for term in terms:
-            result = await db.inverted_index.find_one({"term": term})
-            if result:
-                doc_count = len(result.get("doc_ids", []))
-                await db.inverted_index.update_one(
-                    {"term": term},
-                    {"$set": {"doc_count": doc_count}}
+        routed = {}
+        for term, sizes in sizes_by_term.items():
+            for bucket, bucket_nums in IndexingService.assign_buckets(buckets_by_term.get(term, []), sizes).items():
+                routed[(term, bucket)] = bucket_nums
+        return routed
+    
+    @staticmethod
+    def assign_buckets(buckets: List[Dict], sizes: Dict[int, int]) -> Dict[int, List[int]]:
+        """
+        Assign document numbers, given with their estimated sizes, to a term's buckets (given in bucket order)
+        
+        Documents within the range the buckets already cover go to the
+        bucket whose range holds them. Newer documents are appended to the
+        tail bucket until it is full and then open new buckets, so inserts
+        for common terms only ever rewrite their tail. A bucket is full at
+        POSTINGS_BUCKET_SIZE documents or POSTINGS_BUCKET_BYTES estimated
+        bytes, whichever comes first, so buckets of long documents stay far
+        below MongoDB's document size limit.
+        """
+        bucket_size = settings.POSTINGS_BUCKET_SIZE
+        bucket_bytes = settings.POSTINGS_BUCKET_BYTES
+        starts = [bucket["min_doc"] for bucket in buckets]
+        tail = buckets[-1] if buckets else None
+        room = bucket_size - tail["doc_count"] if tail else 0
+        byte_room = bucket_bytes - tail.get("size", 0) if tail else 0
+        
+        routed: Dict[int, List[int]] = {}
+        appended = []
+        for doc_num in sorted(sizes):
+            if tail is not None and doc_num <= tail["last_doc"]:
+                i = max(bisect_right(starts, doc_num) - 1, 0)
+                routed.setdefault(buckets[i]["bucket"], []).append(doc_num)
+            elif not appended and room > 0 and sizes[doc_num] <= byte_room:
+                routed.setdefault(tail["bucket"], []).append(doc_num)
+                room -= 1
+                byte_room -= sizes[doc_num]
+            else:
+                # Once one document overflows the tail, later ones follow it so bucket ranges stay ascending
+                appended.append(doc_num)
+        
+        # New buckets are filled up to both limits, but always take at least one document
+        bucket = tail["bucket"] + 1 if tail else 0
+        count = used = 0
+        for doc_num in appended:
+            if count and (count >= bucket_size or used + sizes[doc_num] > bucket_bytes):
+                bucket += 1
+                count = used = 0
+            routed.setdefault(bucket, []).append(doc_num)
+            count += 1
+            used += sizes[doc_num]
+        return routed
+    
+    @staticmethod
+    def apply_postings(
+        doc_nums: np.ndarray,
+        freqs: np.ndarray,
+        added: Optional[Dict[int, int]] = None,
+        removed: Optional[List[int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Add documents with their frequencies (replacing any already present) to aligned postings, and remove others"""
+        if added:
+            added_nums = np.fromiter(added.keys(), dtype=np.int32, count=len(added))
+            added_freqs = np.fromiter(added.values(), dtype=np.int32, count=len(added))
+            kept = ~np.isin(doc_nums, added_nums)
+            doc_nums = np.concatenate((doc_nums[kept], added_nums))
+            freqs = np.concatenate((freqs[kept], added_freqs))
+            order = np.argsort(doc_nums, kind="stable")
+            doc_nums, freqs = doc_nums[order], freqs[order]
+        if removed:
+            kept = ~np.isin(doc_nums, removed)
+            doc_nums, freqs = doc_nums[kept], freqs[kept]
+        return doc_nums, freqs
+    
+    @staticmethod
+    async def update_doc_sets(
+        inverted_index,
+        added: Optional[Dict[Tuple[str, int], Dict[int, int]]] = None,
+        removed: Optional[Dict[Tuple[str, int], List[int]]] = None
+    ) -> List[Tuple[str, int]]:
+        """
+        Add documents (numbers with their term frequencies) to and remove them from (term, bucket) pairs
+        
+        All touched buckets are read with one query and written back with
+        one unordered bulk write, each write guarded by the rev that was
+        read, so concurrent writers to the same bucket never overwrite each
+        other. If any guard fails, the written buckets are read again and the
+        change re-applied; adding and removing numbers is idempotent, so
+        buckets whose write did land are left alone. Buckets left without
+        documents are deleted.
+        
+        Returns:
+            Buckets to add to that do not exist
+        """
+        added = added or {}
+        removed = removed or {}
+        pending = set(added) | set(removed)
+        missing = []
+        if not pending:
+            return missing
+        
+        # Over-fetches only buckets of a touched term that share a number with another touched bucket
+        query = {
+            "term": {"$in": list({term for term, _ in pending})},
+            "bucket": {"$in": list({bucket for _, bucket in pending})}
+        }
+        while True:
+            entries = {}
+            async for entry in inverted_index.find(query, {"term": 1, "bucket": 1, "doc_nums": 1, "freqs": 1, "rev": 1}):
+                key = (entry["term"], entry["bucket"])
+                if key in pending:
+                    entries[key] = entry
+            
+            writes, written = [], []
+            for key in pending:
+                entry = entries.get(key)
+                if entry is None:
+                    if key in added:
+                        missing.append(key)
+                    continue
+                
+                current = decode_doc_set(entry["doc_nums"]), decode_freqs(entry["freqs"])
+                doc_nums, freqs = IndexingService.apply_postings(*current, added.get(key), removed.get(key))
+                if np.array_equal(doc_nums, current[0]) and np.array_equal(freqs, current[1]):
+                    continue
+                
+                expected = {"_id": entry["_id"], "rev": entry["rev"]}
+                written.append(entry["_id"])
+                if doc_nums.size:
+                    writes.append(UpdateOne(
+                        expected,
+                        {
+                            "$set": {
+                                "doc_nums": encode_doc_set(doc_nums),
+                                "freqs": encode_freqs(freqs),
+                                "doc_count": int(doc_nums.size),
+                                "last_doc": int(doc_nums[-1])
+                            },
+                            "$inc": {"rev": 1}
+                        }
+                    ))
+                else:
+                    writes.append(DeleteOne(expected))
+            
+            if not writes:
+                return missing
+            result = await inverted_index.bulk_write(writes, ordered=False)
+            if result.matched_count + result.deleted_count == len(writes):
+                return missing
+            
+            # Some rev guards failed: retry the written buckets only
+            retry = set(written)
+            pending = {key for key in pending if key in entries and entries[key]["_id"] in retry}
+            query = {"_id": {"$in": written}}
+    
+    @staticmethod
+    async def update_document_index(doc_id: str, title: str, content: str):
+        """Re-index an edited document, writing only the postings that changed"""
+        if index_engine.uses_segments:
+            # Segments are immutable: the old version is tombstoned and the new one added under a new number
+            await IndexingService.remove_document_from_index(doc_id)
+            await IndexingService.build_index_for_document(doc_id, title, content)
+            return
+        
+        inverted_index, doc_stats = get_index_collections()
+        
+        stats_entry = await doc_stats.find_one({"doc_id": doc_id})
+        if not stats_entry or "term_freqs" not in stats_entry or "doc_num" not in stats_entry:
+            # No forward index entry to diff against
+            await IndexingService.remove_document_from_index(doc_id)
+            await IndexingService.build_index_for_document(doc_id, title, content)
+            return
+        
+        doc_num: int = stats_entry["doc_num"]
+        old_freqs: Dict[str, int] = stats_entry["term_freqs"]
+        new_positions = IndexingService.analyze_document(title, content)
+        new_freqs = IndexingService.term_frequencies(new_positions)
+        old_length = stats_entry.get("length", 0)
+        new_length = sum(new_freqs.values())
+        
+        added = {term: positions for term, positions in new_positions.items() if term not in old_freqs}
+        removed = [term for term in old_freqs if term not in new_positions]
+        
+        # Retained terms need rewriting only if their positions moved
+        retained = [term for term in new_positions if term in old_freqs]
+        old_positions: Dict[str, Tuple[int, bytes]] = {}
+        if retained:
+            cursor = inverted_index.find(
+                {"term": {"$in": retained}, f"positions.{doc_num}": {"$exists": True}},
+                {"term": 1, "bucket": 1, f"positions.{doc_num}": 1}
+            )
+            async for entry in cursor:
+                old_positions[entry["term"]] = (entry["bucket"], entry["positions"][str(doc_num)])
+        changed = {
+            term: new_positions[term] for term in retained
+            if term not in old_positions or old_positions[term][1] != encode_positions(new_positions[term])
+        }
+        
+        if not added and not removed and not changed:
+            logger.info(f"✅ Document {doc_id} index unchanged")
+            return
+        
+        # Retained terms whose postings went missing are written like new ones
+        unplaced = {term: positions for term, positions in changed.items() if term not in old_positions}
+        moved = {term: positions for term, positions in changed.items() if term in old_positions}
+        
+        async def rewrite_moved():
+            # Positions are rewritten in place; frequencies live in the bucket's rev-guarded postings
+            writes = []
+            for term, positions in moved.items():
+                bucket, old_data = old_positions[term]
+                data = encode_positions(positions)
+                writes.append(UpdateOne(
+                    {"term": term, "bucket": bucket},
+                    {"$set": {f"positions.{doc_num}": data}, "$inc": {"size": len(data) - len(old_data)}}
+                ))
+            await inverted_index.bulk_write(writes, ordered=False)
+            missing = await IndexingService.update_doc_sets(inverted_index, added={
+                (term, old_positions[term][0]): {doc_num: len(positions)} for term, positions in moved.items()
+            })
+            # Buckets emptied by a concurrent removal are written like new postings
+            if missing:
+                await IndexingService.add_postings(
+                    [(doc_id, {term: moved[term] for term, _ in missing})], {doc_id: doc_num}
                 )
         
-        logger.info(f"✅ Indexed document {doc_id} with {len(terms)} unique terms")
+        writes = [
+            IndexingService.write_doc_stats([(doc_id, new_positions)]),
+            IndexingService.add_postings([(doc_id, {**added, **unplaced})], {doc_id: doc_num}),
+            IndexingService.remove_postings(doc_num, removed)
+        ]
+        if moved:
+            writes.append(rewrite_moved())
+        await asyncio.gather(*writes)
+        
+        emptied = index_engine.update_document(
+            doc_id, IndexingService.term_frequencies({**added, **changed}), removed, new_length
+        )
+        fuzzy_index.add_terms(added)
+        for term in emptied:
+            fuzzy_index.remove_term(term)
+        collection_stats.update_document(added, removed, old_length, new_length)
+        suggest_index.update_terms([*added, *removed])
+        query_cache.bump_generation()
+        
+        logger.info(
+            f"✅ Re-indexed document {doc_id}: "
+            f"{len(added)} added, {len(removed)} removed, {len(changed)} changed terms"
+        )
     
     @staticmethod
     async def remove_document_from_index(doc_id: str):
-        """Remove a document from the inverted index"""
-        db = get_database()
+        """Remove a document from the postings of the terms it contains"""
+        if index_engine.uses_segments:
+            deleted = await segment_store.delete_document(doc_id)
+            was_indexed = deleted is not None
+            doc_terms, doc_length = deleted if was_indexed else ([], 0)
+        else:
+            doc_terms, doc_length, was_indexed = await IndexingService.delete_document_postings(doc_id)
         
-        # Remove doc_id from all index entries
-        await db.inverted_index.update_many(
-            {"doc_ids": doc_id},
-            {"$pull": {"doc_ids": doc_id}}
-        )
+        if was_indexed:
+            IndexingService.forget_document(doc_id, doc_terms, doc_length)
+        else:
+            index_engine.remove_document(doc_id, doc_terms)
+        query_cache.bump_generation()
         
-        # Update document counts and remove empty entries
-        await db.inverted_index.delete_many({"doc_ids": {"$size": 0}})
+        logger.info(f"✅ Removed document {doc_id} from index ({len(doc_terms)} terms)")
+    
+    @staticmethod
+    def forget_document(doc_id: str, doc_terms: List[str], doc_length: int):
+        """Drop a document whose postings are gone from the in-memory engine, term indexes and statistics"""
+        for term in index_engine.remove_document(doc_id, doc_terms):
+            fuzzy_index.remove_term(term)
+        collection_stats.remove_document(doc_terms, doc_length)
+        suggest_index.update_terms(doc_terms)
+    
+    @staticmethod
+    async def delete_document_postings(doc_id: str, version: Optional[int] = None) -> Tuple[List[str], int, bool]:
+        """
+        Delete a document's postings and forward index entry from stored index collections
         
-        # Update doc_count for remaining entries
-        cursor = db.inverted_index.find({})
-        async for entry in cursor:
-            doc_count = len(entry.get("doc_ids", []))
-            await db.inverted_index.update_one(
-                {"_id": entry["_id"]},
-                {"$set": {"doc_count": doc_count}}
-            )
+        Returns:
+            The document's indexed terms, its indexed length, and whether it was indexed at all
+        """
+        _, doc_stats = get_index_collections(version)
+        
+        # The forward index lists exactly the terms this document contributed
+        stats_entry = await doc_stats.find_one({"doc_id": doc_id})
+        if not stats_entry:
+            return [], 0, False
+        doc_terms = list(stats_entry.get("term_freqs", {}))
+        doc_length = stats_entry.get("length", 0)
+        
+        if "doc_num" in stats_entry:
+            await IndexingService.remove_postings(stats_entry["doc_num"], doc_terms, version)
+        await doc_stats.delete_one({"doc_id": doc_id})
+        
+        return doc_terms, doc_length, True
+    
+    @staticmethod
+    async def remove_postings(doc_num: int, terms: List[str], version: Optional[int] = None):
+        """Remove a document's postings for the given terms and drop buckets left empty"""
+        inverted_index, _ = get_index_collections(version)
+        
+        if not terms:
+            return
+        
+        # A document's per-document fields live in the bucket holding its number
+        cursor = inverted_index.find(
+            {"term": {"$in": terms}, f"positions.{doc_num}": {"$exists": True}},
+            {"term": 1, "bucket": 1, f"positions.{doc_num}": 1}
+        )
+        sizes = {
+            (entry["term"], entry["bucket"]): IndexingService.posting_size(doc_num, entry["positions"][str(doc_num)])
+            async for entry in cursor
+        }
+        keys = list(sizes)
+        if not keys:
+            return
         
-        logger.info(f"✅ Removed document {doc_id} from index")
+        await inverted_index.bulk_write(
+            [
+                UpdateOne(
+                    {"term": term, "bucket": bucket},
+                    {"$unset": {f"positions.{doc_num}": ""}, "$inc": {"size": -sizes[(term, bucket)]}}
+                )
+                for term, bucket in keys
+            ],
+            ordered=False
+        )
+        await IndexingService.update_doc_sets(inverted_index, removed={key: [doc_num] for key in keys})
     
     @staticmethod
     async def get_documents_for_term(term: str) -> List[str]:
         """Get list of document IDs containing a term"""
-        db = get_database()
+        if index_engine.loaded:
+            return index_engine.get_doc_ids(term.lower())
         
-        result = await db.inverted_index.find_one({"term": term.lower()})
+        inverted_index, _ = get_index_collections()
         
-        if result:
-            return result.get("doc_ids", [])
+        cursor = inverted_index.find({"term": term.lower()}, {"doc_nums": 1}).sort("bucket", 1)
+        chunks = [entry["doc_nums"] async for entry in cursor]
+        
+        if chunks:
+            return await DocIdMap.get_doc_ids(decode_doc_sets(chunks).tolist())
         return []
     
     @staticmethod
-    async def rebuild_entire_index():
-        """Rebuild the entire inverted index from scratch"""
+    async def merge_postings(
+        analyzed: List[Tuple[str, Dict[str, List[int]]]],
+        doc_nums: Dict[str, int],
+        version: Optional[int] = None
+    ):
+        """
+        Add a batch of new documents to the index with one write per bucket
+        
+        Only valid for documents known not to be indexed yet, in an index
+        version no other writer is updating (e.g. a rebuild's shadow
+        version), since document sets are rewritten without the rev check.
+        """
+        inverted_index, _ = get_index_collections(version)
+        
+        # Merge the batch's encoded postings in memory so each bucket is read and written once
+        postings_by_term: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+        for doc_id, term_positions in analyzed:
+            doc_num = doc_nums[doc_id]
+            for term, positions in term_positions.items():
+                postings_by_term.setdefault(term, {})[doc_num] = (len(positions), encode_positions(positions))
+        
+        if not postings_by_term:
+            return
+        
+        routed = await IndexingService.route_postings(inverted_index, {
+            term: {doc_num: IndexingService.posting_size(doc_num, data) for doc_num, (_, data) in postings.items()}
+            for term, postings in postings_by_term.items()
+        })
+        existing = {
+            (entry["term"], entry["bucket"]): entry async for entry in inverted_index.find(
+                {"$or": [{"term": term, "bucket": bucket} for term, bucket in routed]},
+                {"term": 1, "bucket": 1, "doc_nums": 1, "freqs": 1}
+            )
+        }
+        
+        writes = []
+        for (term, bucket), bucket_nums in routed.items():
+            term_freqs = {}
+            positions_by_doc = {}
+            size = 0
+            for doc_num in bucket_nums:
+                term_freqs[doc_num], data = postings_by_term[term][doc_num]
+                positions_by_doc[str(doc_num)] = data
+                size += IndexingService.posting_size(doc_num, data)
+            
+            entry = existing.get((term, bucket))
+            if entry is None:
+                writes.append(InsertOne({
+                    "term": term,
+                    "bucket": bucket,
+                    "min_doc": bucket_nums[0],
+                    "last_doc": bucket_nums[-1],
+                    "doc_nums": encode_doc_set(bucket_nums),
+                    "freqs": encode_freqs(list(term_freqs.values())),
+                    "doc_count": len(bucket_nums),
+                    "size": size,
+                    "rev": 0,
+                    "positions": positions_by_doc
+                }))
+                continue
+            
+            merged_nums, merged_freqs = IndexingService.apply_postings(
+                decode_doc_set(entry["doc_nums"]), decode_freqs(entry["freqs"]), term_freqs
+            )
+            fields = {
+                "doc_nums": encode_doc_set(merged_nums),
+                "freqs": encode_freqs(merged_freqs),
+                "doc_count": int(merged_nums.size),
+                "last_doc": int(merged_nums[-1])
+            }
+            fields.update({f"positions.{doc_num}": data for doc_num, data in positions_by_doc.items()})
+            writes.append(UpdateOne({"_id": entry["_id"]}, {"$set": fields, "$inc": {"size": size, "rev": 1}}))
+        
+        await inverted_index.bulk_write(writes, ordered=False)
+    
+    @staticmethod
+    async def rebuild_entire_index(
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        resume: bool = True
+    ) -> int:
+        """
+        Rebuild the entire inverted index into a new version, then swap it in
+        
+        Search keeps serving from the active version while the new one is
+        built in its own shadow collections. Documents are streamed from a
+        cursor in _id order and tokenized in batches across a process pool;
+        each batch's postings are merged in memory and written with bulk
+        operations. Progress is checkpointed after every batch, so an
+        interrupted rebuild resumes after the last committed batch when
+        called again with resume=True.
+        
+        Once every document has been visited, the shadow version is
+        reconciled with edits made during the build, activated with a single
+        pointer update, and the previous versions are dropped.
+        
+        Returns:
+            Number of documents indexed by this run
+        """
+        if index_engine.uses_segments:
+            return await IndexingService.rebuild_segments(batch_size, workers)
+        
         db = get_database()
+        batch_size = batch_size or settings.REBUILD_BATCH_SIZE
+        workers = workers or settings.INDEX_WORKERS
         
-        # Clear existing index
-        await db.inverted_index.delete_many({})
+        checkpoint = await db.index_rebuilds.find_one({"_id": "current"})
+        resuming = bool(
+            resume and checkpoint and checkpoint.get("status") == "running"
+            and checkpoint.get("version") not in (None, mongodb.active_index_version)
+            and checkpoint.get("format") == mongodb.INDEX_FORMAT
+            and checkpoint.get("analyzer") == analyzer.signature()
+        )
         
-        # Rebuild from all documents
-        cursor = db.documents.find({})
+        if resuming:
+            version = checkpoint["version"]
+            started_at = checkpoint["started_at"]
+            query = {"_id": {"$gt": checkpoint["last_doc_id"]}} if checkpoint.get("last_doc_id") else {}
+            indexed = checkpoint.get("indexed", 0)
+            logger.info(f"🔄 Resuming rebuild of index version {version} after {indexed} documents")
+        else:
+            # Discard shadow versions left behind by abandoned rebuilds
+            await drop_inactive_index_versions()
+            version = mongodb.active_index_version + 1
+            started_at = datetime.utcnow()
+            query = {}
+            indexed = 0
+            await db.index_rebuilds.replace_one(
+                {"_id": "current"},
+                {
+                    "status": "running",
+                    "version": version,
+                    "format": mongodb.INDEX_FORMAT,
+                    "analyzer": analyzer.signature(),
+                    "last_doc_id": None,
+                    "indexed": 0,
+                    "started_at": started_at
+                },
+                upsert=True
+            )
+            logger.info(f"🔄 Building index version {version}")
+        
+        await create_index_collection_indexes(version)
+        
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
         count = 0
         
-        async for doc in cursor:
-            doc_id = str(doc["_id"])
-            title = doc.get("title", "")
-            content = doc.get("content", "")
+        # The first batch after a resume may have been partly written, so it uses the idempotent path
+        safe_batch = resuming
+        
+        async def commit(batch: List[Dict], analysis):
+            nonlocal count, indexed, safe_batch
+            analyzed = [pair for chunk in await analysis for pair in chunk]
             
-            await IndexingService.build_index_for_document(doc_id, title, content)
-            count += 1
+            if safe_batch:
+                await IndexingService.write_postings(analyzed, version)
+                safe_batch = False
+            else:
+                doc_nums = await DocIdMap.assign([doc_id for doc_id, _ in analyzed], version)
+                await asyncio.gather(
+                    IndexingService.write_doc_stats(analyzed, version),
+                    IndexingService.merge_postings(analyzed, doc_nums, version)
+                )
+            
+            count += len(batch)
+            indexed += len(batch)
+            docs_per_sec = count / max(time.perf_counter() - started, 1e-9)
+            await db.index_rebuilds.update_one(
+                {"_id": "current"},
+                {"$set": {
+                    "last_doc_id": batch[-1]["_id"],
+                    "indexed": indexed,
+                    "docs_per_sec": round(docs_per_sec, 1),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+            logger.info(f"📦 Indexed {indexed} documents ({docs_per_sec:.0f} docs/sec)")
         
-        logger.info(f"✅ Rebuilt entire index for {count} documents")
+        with analysis_pool(workers) as pool:
+            cursor = db.documents.find(query, {"title": 1, "content": 1}).sort("_id", 1)
+            pending = None
+            
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                
+                # Tokenize this batch in the pool while the previous batch is written
+                documents = [(str(doc["_id"]), doc.get("title", ""), doc.get("content", "")) for doc in batch]
+                chunk_size = max(1, -(-len(documents) // workers))
+                analysis = asyncio.gather(*(
+                    loop.run_in_executor(pool, analyze_documents, documents[i:i + chunk_size])
+                    for i in range(0, len(documents), chunk_size)
+                ))
+                
+                if pending:
+                    await commit(*pending)
+                pending = (batch, analysis)
+            
+            if pending:
+                await commit(*pending)
+        
+        # Catch up with documents created, edited or deleted while the shadow was built
+        since = started_at - IndexingService.RECONCILE_MARGIN
+        for _ in range(IndexingService.RECONCILE_PASSES):
+            pass_started = datetime.utcnow()
+            fixed = await IndexingService.reconcile_index(version, since)
+            since = pass_started - IndexingService.RECONCILE_MARGIN
+            if not fixed:
+                break
+        
+        await activate_index_version(version)
+        
+        # Reload the in-memory structures from the new version
+        await index_engine.load()
+        await fuzzy_index.load()
+        await collection_stats.load()
+        await suggest_index.load()
+        query_cache.bump_generation()
+        
+        # Writes between the last pass and the swap went to the previous version
+        await IndexingService.reconcile_index(version, since, live=True)
+        
+        elapsed = time.perf_counter() - started
+        await db.index_rebuilds.update_one(
+            {"_id": "current"},
+            {"$set": {"status": "complete", "completed_at": datetime.utcnow()}}
+        )
+        
+        await drop_inactive_index_versions()
+        
+        logger.info(
+            f"✅ Rebuilt index version {version} for {indexed} documents "
+            f"({count / max(elapsed, 1e-9):.0f} docs/sec over {elapsed:.1f}s)"
+        )
+        return count
+    
+    @staticmethod
+    async def rebuild_segments(batch_size: Optional[int] = None, workers: Optional[int] = None) -> int:
+        """
+        Rebuild the segment store from the documents collection
+        
+        New segments are written beside the live ones and swapped in
+        together, so search keeps serving the old index until the swap;
+        writes wait for the rebuild to finish.
+        
+        Returns:
+            Number of documents indexed
+        """
+        db = get_database()
+        batch_size = batch_size or settings.REBUILD_BATCH_SIZE
+        workers = workers or settings.INDEX_WORKERS
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        
+        async def batches(pool):
+            cursor = db.documents.find({}, {"title": 1, "content": 1}).sort("_id", 1)
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                documents = [(str(doc["_id"]), doc.get("title", ""), doc.get("content", "")) for doc in batch]
+                chunk_size = max(1, -(-len(documents) // workers))
+                chunks = await asyncio.gather(*(
+                    loop.run_in_executor(pool, analyze_documents, documents[i:i + chunk_size])
+                    for i in range(0, len(documents), chunk_size)
+                ))
+                yield [pair for chunk in chunks for pair in chunk]
+        
+        logger.info("🔄 Rebuilding index segments")
+        with analysis_pool(workers) as pool:
+            count = await segment_store.rebuild(batches(pool))
+        
+        # The engine's document maps must follow the swap before anything else reads the new segments
+        await index_engine.load()
+        await fuzzy_index.load()
+        await collection_stats.load()
+        await suggest_index.load()
+        query_cache.bump_generation()
+        
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"✅ Rebuilt index segments for {count} documents "
+            f"({count / max(elapsed, 1e-9):.0f} docs/sec over {elapsed:.1f}s)"
+        )
         return count
+    
+    @staticmethod
+    async def reconcile_index(version: int, since: datetime, live: bool = False) -> int:
+        """
+        Bring an index version in line with the documents collection
+        
+        Removes documents that no longer exist and (re)indexes documents that
+        are missing or were created or edited since the given time. With
+        live=True the version must be the active one, and the in-memory
+        structures are updated along with the stored index.
+        
+        Returns:
+            Number of documents fixed
+        """
+        db = get_database()
+        _, doc_stats = get_index_collections(version)
+        
+        indexed_ids = {entry["doc_id"] async for entry in doc_stats.find({}, {"doc_id": 1, "_id": 0})}
+        document_ids = {str(doc["_id"]) async for doc in db.documents.find({}, {"_id": 1})}
+        changed_ids = {
+            str(doc["_id"]) async for doc in db.documents.find(
+                {"$or": [{"created_at": {"$gte": since}}, {"updated_at": {"$gte": since}}]},
+                {"_id": 1}
+            )
+        }
+        
+        orphan_ids = indexed_ids - document_ids
+        missing_ids = document_ids - indexed_ids
+        stale_ids = (changed_ids & document_ids) - missing_ids
+        
+        for doc_id in orphan_ids:
+            if live:
+                await IndexingService.remove_document_from_index(doc_id)
+            else:
+                await IndexingService.delete_document_postings(doc_id, version)
+        
+        to_index = sorted(missing_ids | stale_ids)
+        for i in range(0, len(to_index), settings.REBUILD_BATCH_SIZE):
+            batch_ids = [ObjectId(doc_id) for doc_id in to_index[i:i + settings.REBUILD_BATCH_SIZE]]
+            cursor = db.documents.find({"_id": {"$in": batch_ids}}, {"title": 1, "content": 1})
+            documents = [
+                (str(doc["_id"]), doc.get("title", ""), doc.get("content", ""))
+                async for doc in cursor
+            ]
+            
+            if live:
+                new_documents = [doc for doc in documents if doc[0] in missing_ids]
+                if new_documents:
+                    await IndexingService.build_index_for_documents(new_documents)
+                for doc_id, title, content in documents:
+                    if doc_id in stale_ids:
+                        await IndexingService.update_document_index(doc_id, title, content)
+            else:
+                for doc_id, _, _ in documents:
+                    if doc_id in stale_ids:
+                        await IndexingService.delete_document_postings(doc_id, version)
+                await IndexingService.write_postings(analyze_documents(documents), version)
+        
+        fixed = len(orphan_ids) + len(to_index)
+        if fixed:
+            logger.info(
+                f"✅ Reconciled index version {version}: {len(orphan_ids)} removed, "
+                f"{len(missing_ids)} added, {len(stale_ids)} re-indexed"
+            )
+        return fixed
+
+def analysis_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for analyze_documents
+    
+    Workers are started by a fork server (spawned where that is unavailable),
+    never forked from this process: it runs the MongoDB driver's monitor
+    threads and to_thread workers, and forking a threaded process can deadlock.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def analyze_documents(documents: List[Tuple[str, str, str]]) -> List[Tuple[str, Dict[str, List[int]]]]:
+    """Analyze (doc_id, title, content) documents; runs in rebuild worker processes"""
+    return [(doc_id, analyzer.document_positions(title, content)) for doc_id, title, content in documents]
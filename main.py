@@ -1,7 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from mongodb import connect_db, close_db
+from mongodb import connect_db, close_db, INDEX_FORMAT
+import mongodb
+from index_engine import index_engine
+from fuzzy_index import fuzzy_index
+from collection_stats import collection_stats
+from suggest_index import suggest_index
+from indexing_service import IndexingService
+from segment_store import segment_store
+from indexing_queue import indexing_queue
+from text_processing import analyzer
 from config import settings
 import logging
 
@@ -39,6 +48,33 @@ async def lifespan(app: FastAPI):
             else:
                 logger.error("❌ Could not connect to MongoDB on startup. App will run but API may fail.")
     
+    # Load the inverted index into memory; search falls back to MongoDB if this fails
+    try:
+        if index_engine.uses_segments:
+            await index_engine.load()
+            stale = segment_store.empty or segment_store.analyzer != analyzer.signature()
+            if stale and await mongodb.get_database().documents.estimated_document_count():
+                # First start with segment storage, or the analyzer changed: build segments from the stored documents
+                logger.info("🔄 Building index segments from existing documents...")
+                await IndexingService.rebuild_entire_index()
+            else:
+                await fuzzy_index.load()
+                await collection_stats.load()
+                await suggest_index.load()
+        elif mongodb.active_index_format < INDEX_FORMAT or mongodb.active_index_analyzer != analyzer.signature():
+            # Postings stored by an older version or another analyzer are migrated by rebuilding (which also loads them)
+            logger.info("🔄 Migrating inverted index to the current storage format and analyzer...")
+            await IndexingService.rebuild_entire_index()
+        else:
+            await index_engine.load()
+            await fuzzy_index.load()
+            await collection_stats.load()
+            await suggest_index.load()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load in-memory index: {e}")
+    
+    indexing_queue.start()
+    
     try:
         yield
     except Exception as e:
@@ -46,6 +82,14 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown
         logger.info("🛑 Shutting down Search Engine API...")
+        try:
+            await indexing_queue.stop()
+        except Exception as e:
+            logger.warning(f"⚠️ Error draining indexing queue: {e}")
+        try:
+            await segment_store.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing segment store: {e}")
         try:
             await close_db()
         except Exception as e:
@@ -102,8 +146,11 @@ async def read_upload():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint with DB status"""
+    """Health check endpoint with DB status, cache counters and indexing lag"""
     from mongodb import get_database
+    from document_cache import document_cache
+    from query_cache import query_cache
+    from indexing_queue import indexing_queue
     
     db_status = "disconnected"
     db_error = None
@@ -119,11 +166,19 @@ async def health_check():
         db_error = str(e)
         logger.error(f"Health check DB error: {e}")
 
+    indexing = indexing_queue.stats()
+    
     return {
-        "status": "online",
+        # Documents the indexer gave up on are missing from search until re-indexed
+        "status": "degraded" if indexing["needs_reconcile"] else "online",
         "service": "Search Engine API",
         "database": db_status,
         "error": db_error,
+        "caches": {
+            "documents": document_cache.stats(),
+            "queries": query_cache.stats()
+        },
+        "indexing": indexing,
         "version": "1.0.0"
     }
 
@@ -1,7 +1,10 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import settings
+from text_processing import analyzer, LEGACY_ANALYZER
+from typing import List, Optional, Tuple
 import logging
 import certifi
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +12,22 @@ logger = logging.getLogger(__name__)
 client: AsyncIOMotorClient = None
 database = None
 
+# Version of the inverted index collections serving reads and writes.
+# Version 0 is the original unversioned inverted_index/doc_stats pair.
+active_index_version = 0
+
+# Storage format of the postings: 1 = ObjectId strings, 2 = integer document numbers,
+# 3 = compressed binary document sets and positions, 4 = postings split into buckets,
+# 5 = term frequencies compressed alongside each bucket's document set,
+# 6 = buckets also capped by their estimated size in bytes
+INDEX_FORMAT = 6
+active_index_format = 1
+
+# Analyzer settings the active index was built with
+active_index_analyzer = LEGACY_ANALYZER
+
+INDEX_COLLECTION_PATTERN = re.compile(r"^(inverted_index|doc_stats)(?:_v(\d+))?$")
+
 async def connect_db():
     """Connect to MongoDB database with retry logic"""
     global client, database
@@ -34,6 +53,7 @@ async def connect_db():
             
             # Create indexes
             await create_indexes()
+            await load_active_index_version()
             return
             
         except Exception as e:
@@ -65,14 +85,88 @@ async def create_indexes():
         await database.documents.create_index("author_id")
         await database.documents.create_index("created_at")
         
-        # Inverted index collection indexes
-        await database.inverted_index.create_index("term")
-        
         logger.info("Database indexes created")
     except Exception as e:
         logger.warning(f"Index creation warning: {e}")
 
 
+async def create_index_collection_indexes(version: Optional[int] = None):
+    """Create indexes on the inverted index collections of a version"""
+    inverted_index, doc_stats = get_index_collections(version)
+    await inverted_index.create_index([("term", 1), ("bucket", 1)], unique=True)
+    await doc_stats.create_index("doc_id", unique=True)
+    await doc_stats.create_index("doc_num", unique=True, sparse=True)
+
+
+async def load_active_index_version():
+    """Read which inverted index version is active"""
+    global active_index_version, active_index_format, active_index_analyzer
+    
+    pointer = await database.index_meta.find_one({"_id": "active_index"})
+    active_index_version = pointer["version"] if pointer else 0
+    active_index_format = pointer.get("format", 1) if pointer else 1
+    active_index_analyzer = pointer.get("analyzer", LEGACY_ANALYZER) if pointer else LEGACY_ANALYZER
+    
+    try:
+        await create_index_collection_indexes()
+    except Exception as e:
+        logger.warning(f"Index creation warning: {e}")
+    
+    logger.info(f"Active inverted index version: {active_index_version} (format {active_index_format})")
+
+
+async def activate_index_version(version: int):
+    """Atomically point reads and writes at another inverted index version"""
+    global active_index_version, active_index_format, active_index_analyzer
+    
+    await database.index_meta.update_one(
+        {"_id": "active_index"},
+        {"$set": {"version": version, "format": INDEX_FORMAT, "analyzer": analyzer.signature()}},
+        upsert=True
+    )
+    active_index_version = version
+    active_index_format = INDEX_FORMAT
+    active_index_analyzer = analyzer.signature()
+    logger.info(f"Activated inverted index version {version}")
+
+
+async def drop_inactive_index_versions() -> List[str]:
+    """Drop the inverted index collections of every version except the active one"""
+    dropped = []
+    dropped_versions = set()
+    for name in await database.list_collection_names():
+        match = INDEX_COLLECTION_PATTERN.match(name)
+        if match and int(match.group(2) or 0) != active_index_version:
+            await database.drop_collection(name)
+            dropped.append(name)
+            dropped_versions.add(int(match.group(2) or 0))
+    
+    if dropped_versions:
+        await database.index_meta.delete_many(
+            {"_id": {"$in": [doc_num_counter_id(version) for version in dropped_versions]}}
+        )
+    
+    if dropped:
+        logger.info(f"Dropped inactive index collections: {', '.join(sorted(dropped))}")
+    return dropped
+
+
+def get_index_collections(version: Optional[int] = None) -> Tuple:
+    """Get the (inverted_index, doc_stats) collections of a version (the active one by default)"""
+    if version is None:
+        version = active_index_version
+    if version == 0:
+        return database.inverted_index, database.doc_stats
+    return database[f"inverted_index_v{version}"], database[f"doc_stats_v{version}"]
+
+
+def doc_num_counter_id(version: Optional[int] = None) -> str:
+    """ID of the index_meta document that hands out document numbers for a version"""
+    if version is None:
+        version = active_index_version
+    return f"doc_num_counter_v{version}"
+
+
 def get_database():
     """Get database instance"""
     return database
@@ -0,0 +1,148 @@
+"""
+Phrase and proximity queries answered from positional postings
+"""
+from mongodb import get_index_collections
+from text_processing import analyzer, MAX_SLOP
+from index_engine import index_engine
+from postings_ops import intersect
+from postings_codec import CompressedDocSet, decode_positions
+from segment_store import segment_store
+from typing import Dict, List, Optional, Set, Tuple
+import heapq
+
+
+class PhraseQuery:
+    """
+    A quoted phrase: its terms, each term's offset within the phrase, and
+    how many positions the terms may drift from the exact phrase (slop).
+
+    Stop words are dropped from the phrase but still count towards the
+    offsets, matching how positions are recorded at index time.
+    """
+
+    __slots__ = ("terms", "offsets", "slop")
+
+    def __init__(self, text: str, slop: int = 0):
+        self.terms: List[str] = []
+        self.offsets: List[int] = []
+        # Fields lie MAX_SLOP positions apart, so a larger slop could match across them
+        self.slop = min(slop, MAX_SLOP)
+        for position, term in analyzer.positioned_terms(text):
+            self.terms.append(term)
+            self.offsets.append(position)
+
+    def key(self) -> Tuple:
+        """Hashable form of the phrase"""
+        return tuple(zip(self.terms, self.offsets)), self.slop
+
+
+class PhraseService:
+    """Service for matching phrase and proximity queries against the positional index"""
+
+    # Maximum number of documents whose positions are projected in one query
+    POSITIONS_BATCH_SIZE = 1000
+
+    @staticmethod
+    def match_positions(position_lists: List[List[int]], offsets: List[int], slop: int) -> bool:
+        """
+        Check whether one occurrence of every term lines up as the phrase
+
+        Each term's sorted positions are shifted back by its offset to where
+        the phrase would start. An exact phrase needs a start shared by all
+        terms; with slop, the closest starts (one per term) may be up to slop
+        positions apart.
+        """
+        starts = [[position - offset for position in positions] for positions, offset in zip(position_lists, offsets)]
+
+        if slop == 0:
+            common = set(min(starts, key=len))
+            for term_starts in starts:
+                common.intersection_update(term_starts)
+                if not common:
+                    return False
+            return True
+
+        # Smallest window holding a start from every list, advancing the lowest start each step
+        heap = [(term_starts[0], i, 0) for i, term_starts in enumerate(starts)]
+        heapq.heapify(heap)
+        highest = max(start for start, _, _ in heap)
+        while True:
+            lowest, i, j = heapq.heappop(heap)
+            if highest - lowest <= slop:
+                return True
+            if j + 1 == len(starts[i]):
+                return False
+            highest = max(highest, starts[i][j + 1])
+            heapq.heappush(heap, (starts[i][j + 1], i, j + 1))
+
+    @staticmethod
+    async def get_candidate_documents(terms: List[str]) -> List[int]:
+        """Get the numbers of documents containing every term, intersecting the rarest postings first"""
+        unique_terms = list(dict.fromkeys(terms))
+
+        if index_engine.loaded:
+            postings = [index_engine.get_postings(term) for term in unique_terms]
+            if any(term_postings is None for term_postings in postings):
+                return []
+            return intersect([term_postings.doc_nums for term_postings in postings])
+
+        inverted_index, _ = get_index_collections()
+        chunks: Dict[str, List[bytes]] = {}
+        cursor = inverted_index.find(
+            {"term": {"$in": unique_terms}}, {"term": 1, "doc_nums": 1}
+        ).sort([("term", 1), ("bucket", 1)])
+        async for entry in cursor:
+            chunks.setdefault(entry["term"], []).append(entry["doc_nums"])
+        if len(chunks) < len(unique_terms):
+            return []
+
+        return intersect([CompressedDocSet(term_chunks) for term_chunks in chunks.values()])
+
+    @staticmethod
+    async def find_documents(phrase: PhraseQuery, candidates: Optional[Set[int]] = None) -> Set[int]:
+        """
+        Find documents containing a phrase, using only the positional index
+
+        Args:
+            phrase: Parsed phrase query
+            candidates: Optional restriction to document numbers already known to match
+
+        Returns:
+            Numbers of matching documents
+        """
+        doc_nums = await PhraseService.get_candidate_documents(phrase.terms)
+        if candidates is not None:
+            doc_nums = [doc_num for doc_num in doc_nums if doc_num in candidates]
+
+        # A single-term phrase matches wherever the term occurs
+        if len(phrase.terms) == 1:
+            return set(doc_nums)
+
+        inverted_index, _ = get_index_collections()
+        unique_terms = list(dict.fromkeys(phrase.terms))
+        matches = set()
+
+        for i in range(0, len(doc_nums), PhraseService.POSITIONS_BATCH_SIZE):
+            batch = doc_nums[i:i + PhraseService.POSITIONS_BATCH_SIZE]
+            positions: Dict[str, Dict[str, bytes]] = {}
+
+            if index_engine.uses_segments:
+                for term in unique_terms:
+                    positions[term] = {
+                        str(doc_num): data for doc_num, data in segment_store.get_positions(term, batch).items()
+                    }
+            else:
+                projection = {"term": 1, **{f"positions.{doc_num}": 1 for doc_num in batch}}
+                cursor = inverted_index.find({"term": {"$in": unique_terms}}, projection)
+                async for entry in cursor:
+                    positions.setdefault(entry["term"], {}).update(entry.get("positions", {}))
+
+            for doc_num in batch:
+                encoded = [positions.get(term, {}).get(str(doc_num)) for term in phrase.terms]
+                if not all(encoded):
+                    continue
+                position_lists = [decode_positions(data) for data in encoded]
+                if PhraseService.match_positions(position_lists, phrase.offsets, phrase.slop):
+                    matches.add(doc_num)
+
+        return matches
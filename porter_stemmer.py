@@ -0,0 +1,133 @@
+"""
+Porter stemming algorithm (M.F. Porter, 1980)
+
+Reduces English words to a common stem so inflected forms share one
+postings list, e.g. "learning", "learned" and "learns" all become "learn".
+"""
+
+VOWELS = frozenset("aeiou")
+
+
+def _is_consonant(word: str, i: int) -> bool:
+    char = word[i]
+    if char in VOWELS:
+        return False
+    if char == "y":
+        return i == 0 or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(stem: str) -> int:
+    """Number of vowel-consonant sequences in a stem ([C](VC){m}[V])"""
+    m = 0
+    previous_vowel = False
+    for i in range(len(stem)):
+        vowel = not _is_consonant(stem, i)
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def _has_vowel(stem: str) -> bool:
+    return any(not _is_consonant(stem, i) for i in range(len(stem)))
+
+
+def _ends_double_consonant(word: str) -> bool:
+    return len(word) >= 2 and word[-1] == word[-2] and _is_consonant(word, len(word) - 1)
+
+
+def _ends_cvc(word: str) -> bool:
+    """Consonant-vowel-consonant ending, where the last consonant is not w, x or y"""
+    return (
+        len(word) >= 3
+        and _is_consonant(word, len(word) - 3)
+        and not _is_consonant(word, len(word) - 2)
+        and _is_consonant(word, len(word) - 1)
+        and word[-1] not in "wxy"
+    )
+
+
+def _replace_suffix(word: str, rules, min_measure: int) -> str:
+    """Apply the first rule whose suffix matches, if the remaining stem is long enough"""
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            stem = word[:len(word) - len(suffix)]
+            if _measure(stem) > min_measure:
+                return stem + replacement
+            return word
+    return word
+
+
+STEP2_RULES = [
+    ("ational", "ate"), ("tional", "tion"), ("enci", "ence"), ("anci", "ance"),
+    ("izer", "ize"), ("abli", "able"), ("alli", "al"), ("entli", "ent"),
+    ("eli", "e"), ("ousli", "ous"), ("ization", "ize"), ("ation", "ate"),
+    ("ator", "ate"), ("alism", "al"), ("iveness", "ive"), ("fulness", "ful"),
+    ("ousness", "ous"), ("aliti", "al"), ("iviti", "ive"), ("biliti", "ble")
+]
+STEP3_RULES = [
+    ("icate", "ic"), ("ative", ""), ("alize", "al"), ("iciti", "ic"),
+    ("ical", "ic"), ("ful", ""), ("ness", "")
+]
+STEP4_SUFFIXES = [
+    "al", "ance", "ence", "er", "ic", "able", "ible", "ant", "ement", "ment",
+    "ent", "ion", "ou", "ism", "ate", "iti", "ous", "ive", "ize"
+]
+
+
+def stem(word: str) -> str:
+    """Stem a lowercase word"""
+    if len(word) <= 2:
+        return word
+
+    # Step 1a: plurals
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+
+    # Step 1b: -ed and -ing
+    if word.endswith("eed"):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ("ed", "ing"):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(("at", "bl", "iz")):
+                    word += "e"
+                elif _ends_double_consonant(word) and word[-1] not in "lsz":
+                    word = word[:-1]
+                elif _measure(word) == 1 and _ends_cvc(word):
+                    word += "e"
+                break
+
+    # Step 1c: y -> i
+    if word.endswith("y") and _has_vowel(word[:-1]):
+        word = word[:-1] + "i"
+
+    # Steps 2 and 3: derivational suffixes
+    word = _replace_suffix(word, STEP2_RULES, 0)
+    word = _replace_suffix(word, STEP3_RULES, 0)
+
+    # Step 4: strip suffixes from long stems
+    for suffix in sorted(STEP4_SUFFIXES, key=len, reverse=True):
+        if word.endswith(suffix):
+            stem_part = word[:len(word) - len(suffix)]
+            if _measure(stem_part) > 1 and (suffix != "ion" or stem_part.endswith(("s", "t"))):
+                word = stem_part
+            break
+
+    # Step 5: tidy up a final -e and -ll
+    if word.endswith("e"):
+        stem_part = word[:-1]
+        m = _measure(stem_part)
+        if m > 1 or (m == 1 and not _ends_cvc(stem_part)):
+            word = stem_part
+    if _measure(word) > 1 and _ends_double_consonant(word) and word.endswith("l"):
+        word = word[:-1]
+
+    return word
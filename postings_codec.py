@@ -0,0 +1,236 @@
+"""
+Compressed binary encodings for postings stored in MongoDB
+
+Positions, and document sets of rare terms, are stored as delta gaps in
+variable-byte form. Larger document sets use Roaring-style containers:
+document numbers are split by their high 16 bits, and each chunk is stored
+either as a sorted array of 16-bit values or, once it holds more than
+ARRAY_CONTAINER_MAX documents, as a 65536-bit bitmap. Term frequencies are
+stored next to a document set as variable-byte integers in the same order.
+"""
+from array import array
+from typing import Iterator, List, Sequence, Tuple
+import numpy as np
+import struct
+
+# Leading byte of an encoded document set
+SMALL_SET = 0
+CONTAINERS = 1
+
+# Document sets up to this size are stored as gaps rather than containers
+SMALL_SET_MAX = 64
+
+# Total cardinality and number of containers, after the leading byte
+HEADER = struct.Struct("<IH")
+
+# Chunks with more documents than this are stored as bitmaps (8 KiB) instead of arrays
+ARRAY_CONTAINER_MAX = 4096
+BITMAP_BYTES = 65536 // 8
+
+
+def encode_doc_set(doc_nums: Sequence[int]) -> bytes:
+    """Encode sorted, unique document numbers"""
+    values = np.asarray(doc_nums, dtype=np.uint32)
+    if values.size <= SMALL_SET_MAX:
+        values = values.tolist()
+        return bytes([SMALL_SET]) + encode_gaps([len(values)]) + encode_gaps(values)
+
+    keys = values >> 16
+    lows = (values & 0xFFFF).astype("<u2")
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [values.size]))
+
+    # Directory of (key, cardinality - 1) pairs, then the container bodies in key order
+    directory = np.empty((len(starts), 2), dtype="<u2")
+    directory[:, 0] = keys[starts]
+    directory[:, 1] = ends - starts - 1
+
+    parts = [bytes([CONTAINERS]), HEADER.pack(values.size, len(starts)), directory.tobytes()]
+    for start, end in zip(starts, ends):
+        if end - start > ARRAY_CONTAINER_MAX:
+            bitmap = np.zeros(65536, dtype=bool)
+            bitmap[lows[start:end]] = True
+            parts.append(np.packbits(bitmap, bitorder="little").tobytes())
+        else:
+            parts.append(lows[start:end].tobytes())
+    return b"".join(parts)
+
+
+def decode_doc_set(data: bytes) -> np.ndarray:
+    """Decode an encoded document set back to sorted int32 document numbers"""
+    if data[0] == SMALL_SET:
+        _, offset = read_varint(data, 1)
+        return np.array(decode_gaps(data[offset:]), dtype=np.int32)
+
+    cardinality, count = HEADER.unpack_from(data, 1)
+    directory = np.frombuffer(data, dtype="<u2", count=count * 2, offset=1 + HEADER.size).reshape(count, 2)
+
+    doc_nums = np.empty(cardinality, dtype=np.int32)
+    offset = 1 + HEADER.size + count * 4
+    filled = 0
+    for key, size in directory.tolist():
+        size += 1
+        if size > ARRAY_CONTAINER_MAX:
+            bitmap = np.frombuffer(data, dtype=np.uint8, count=BITMAP_BYTES, offset=offset)
+            lows = np.flatnonzero(np.unpackbits(bitmap, bitorder="little"))
+            offset += BITMAP_BYTES
+        else:
+            lows = np.frombuffer(data, dtype="<u2", count=size, offset=offset)
+            offset += size * 2
+        doc_nums[filled:filled + size] = lows
+        doc_nums[filled:filled + size] |= key << 16
+        filled += size
+    return doc_nums
+
+
+def doc_set_cardinality(data: bytes) -> int:
+    """Number of documents in an encoded set, read from its header"""
+    if data[0] == SMALL_SET:
+        return read_varint(data, 1)[0]
+    return HEADER.unpack_from(data, 1)[0]
+
+
+def decode_doc_sets(chunks: List[bytes]) -> np.ndarray:
+    """Decode a term's bucketed document sets, read in bucket order, into one sorted array"""
+    if len(chunks) == 1:
+        return decode_doc_set(chunks[0])
+    if not chunks:
+        return np.empty(0, dtype=np.int32)
+
+    doc_nums = np.concatenate([decode_doc_set(data) for data in chunks])
+    # Buckets hold ascending ranges, unless concurrent writers opened overlapping ones
+    if np.any(np.diff(doc_nums) <= 0):
+        doc_nums = np.unique(doc_nums)
+    return doc_nums
+
+
+def decode_postings(buckets: List[Tuple[bytes, bytes]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode a term's bucketed (document set, frequencies) pairs, read in bucket order, into aligned sorted arrays"""
+    if len(buckets) == 1:
+        return decode_doc_set(buckets[0][0]), decode_freqs(buckets[0][1])
+    if not buckets:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+
+    doc_nums = np.concatenate([decode_doc_set(doc_set) for doc_set, _ in buckets])
+    freqs = np.concatenate([decode_freqs(data) for _, data in buckets])
+    # Buckets hold ascending ranges, unless concurrent writers opened overlapping ones
+    if np.any(np.diff(doc_nums) <= 0):
+        order = np.argsort(doc_nums, kind="stable")
+        doc_nums, first = np.unique(doc_nums[order], return_index=True)
+        freqs = freqs[order][first]
+    return doc_nums, freqs
+
+
+def encode_freqs(freqs: Sequence[int]) -> bytes:
+    """Encode term frequencies, in document set order, as variable-byte integers"""
+    values = np.asarray(freqs, dtype=np.uint32)
+    if not values.size or values.max() < 0x80:
+        # Almost every frequency fits in one byte
+        return values.astype(np.uint8).tobytes()
+
+    encoded = bytearray()
+    for value in values.tolist():
+        while value >= 0x80:
+            encoded.append(value & 0x7F | 0x80)
+            value >>= 7
+        encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_freqs(data: bytes) -> np.ndarray:
+    """Decode variable-byte term frequencies back to int32"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if not raw.size or raw.max() < 0x80:
+        return raw.astype(np.int32)
+
+    values = []
+    value = shift = 0
+    for byte in raw.tolist():
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return np.array(values, dtype=np.int32)
+
+
+def encode_gaps(values: Sequence[int]) -> bytes:
+    """Encode sorted integers as variable-byte delta gaps"""
+    encoded = bytearray()
+    previous = 0
+    for value in values:
+        gap = value - previous
+        previous = value
+        while gap >= 0x80:
+            encoded.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+
+def decode_gaps(data: bytes) -> List[int]:
+    """Decode variable-byte delta gaps back to sorted integers"""
+    values = []
+    value = gap = shift = 0
+    for byte in data:
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            value += gap
+            values.append(value)
+            gap = shift = 0
+    return values
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """Read one variable-byte integer, returning it and the offset after it"""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+# Positions within a document are stored as plain gaps
+encode_positions = encode_gaps
+decode_positions = decode_gaps
+
+
+class CompressedDocSet:
+    """
+    A term's stored document sets, only decoded when its postings are read.
+
+    Its length comes from the bucket headers, so queries can order and skip
+    terms by document frequency without decoding them.
+    """
+
+    __slots__ = ("_chunks", "_doc_nums")
+
+    def __init__(self, chunks: List[bytes]):
+        self._chunks = chunks
+        self._doc_nums = None
+
+    @property
+    def doc_nums(self) -> array:
+        """Decoded document numbers"""
+        if self._doc_nums is None:
+            self._doc_nums = array("i", decode_doc_sets(self._chunks).tobytes())
+            self._chunks = None
+        return self._doc_nums
+
+    def __len__(self) -> int:
+        if self._doc_nums is None:
+            return sum(doc_set_cardinality(data) for data in self._chunks)
+        return len(self._doc_nums)
+
+    def __getitem__(self, index):
+        return self.doc_nums[index]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_nums)
@@ -0,0 +1,66 @@
+"""
+Set operations over sorted postings lists
+"""
+from bisect import bisect_left
+from typing import List, Sequence
+import heapq
+
+
+def gallop(postings: Sequence, target, lo: int = 0) -> int:
+    """Index of the first posting >= target at or after lo, by exponential then binary search"""
+    step = 1
+    hi = lo
+    while hi < len(postings) and postings[hi] < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(postings, target, lo, min(hi, len(postings)))
+
+
+def intersect(postings_lists: List[Sequence]) -> List:
+    """
+    Intersect sorted postings lists, rarest first
+
+    Each posting of the running (smallest) result gallops forward through
+    the next list, so the cost grows with the rarest list rather than the
+    most common one.
+    """
+    if not postings_lists:
+        return []
+
+    ordered = sorted(postings_lists, key=len)
+    result = list(ordered[0])
+    for postings in ordered[1:]:
+        if not result:
+            break
+        matches = []
+        pos = 0
+        for posting in result:
+            pos = gallop(postings, posting, pos)
+            if pos == len(postings):
+                break
+            if postings[pos] == posting:
+                matches.append(posting)
+                pos += 1
+        result = matches
+    return result
+
+
+def union(postings_lists: List[Sequence]) -> List:
+    """Merge sorted postings lists, dropping duplicates"""
+    result = []
+    for posting in heapq.merge(*postings_lists):
+        if not result or result[-1] != posting:
+            result.append(posting)
+    return result
+
+
+def difference(postings: Sequence, excluded: Sequence) -> List:
+    """Postings not present in the excluded sorted list"""
+    result = []
+    pos = 0
+    for posting in postings:
+        pos = gallop(excluded, posting, pos)
+        if pos == len(excluded) or excluded[pos] != posting:
+            result.append(posting)
+    return result
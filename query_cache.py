@@ -0,0 +1,95 @@
+"""
+Result cache for repeated search queries
+"""
+from config import settings
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+import time
+
+
+class QueryResultCache:
+    """
+    LRU cache of ranked search results with a time-to-live.
+
+    Entries are tagged with the index generation they were computed at.
+    IndexingService bumps the generation on every index mutation, which
+    drops all cached results, and results computed against an older
+    generation are never stored.
+
+    Memory is bounded by ranked results, not just entries: each entry
+    keeps at most max_depth (doc_id, score) pairs, marked incomplete so
+    deeper pages are ranked again, and the least recently used entries
+    are evicted once all entries together hold more than max_results. A
+    result larger than max_results on its own is not cached.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, max_depth: int = None, max_results: int = None):
+        self.max_entries = settings.QUERY_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = settings.QUERY_CACHE_TTL if ttl is None else ttl
+        self.max_depth = settings.QUERY_CACHE_DEPTH if max_depth is None else max_depth
+        self.max_results = settings.QUERY_CACHE_MAX_RESULTS if max_results is None else max_results
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # Ranked pairs held by all entries together
+        self.results = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Get cached results for a key, or None if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != self.generation or entry[1] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: Hashable, results: Dict, generation: int):
+        """Cache results computed at the given index generation"""
+        if self.max_entries <= 0 or generation != self.generation:
+            return
+
+        if len(results["ranked"]) > self.max_depth:
+            results = {**results, "ranked": results["ranked"][:self.max_depth], "complete": False}
+
+        if key in self._entries:
+            self._remove(key)
+        if len(results["ranked"]) > self.max_results:
+            return
+
+        self._entries[key] = (generation, time.monotonic() + self.ttl, results)
+        self.results += len(results["ranked"])
+        while len(self._entries) > self.max_entries or self.results > self.max_results:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        self.results -= len(self._entries.pop(key)[2]["ranked"])
+
+    def stats(self) -> Dict:
+        """Cache counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "results": self.results,
+            "max_results": self.max_results,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def bump_generation(self):
+        """Invalidate every cached result after the index changed"""
+        self.generation += 1
+        self._entries.clear()
+        self.results = 0
+
+
+# Global query result cache instance
+query_cache = QueryResultCache()
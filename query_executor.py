@@ -0,0 +1,108 @@
+"""
+Boolean query execution over sorted postings lists
+"""
+from mongodb import get_index_collections
+from index_engine import index_engine
+from doc_id_map import DocIdMap
+from phrase_service import PhraseService
+from query_parser import TermNode, PhraseNode, term_nodes
+from postings_ops import intersect, union, difference
+from postings_codec import CompressedDocSet
+from typing import Dict, List, Sequence
+
+
+class QueryExecutor:
+    """
+    Evaluate a parsed query to the sorted list of matching documents.
+
+    Postings are sorted document numbers, read from the in-memory index
+    when it is loaded or from MongoDB otherwise, where they are only
+    decoded once a clause actually reads them; only the final matches are
+    translated back to document IDs.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Sequence] = {}
+
+    async def load_postings(self, node):
+        """Fetch the postings of every term (and fuzzy variant) in the query"""
+        terms = {variant for term_node in term_nodes(node) for variant in term_node.variants}
+        terms -= self._postings.keys()
+        if not terms:
+            return
+
+        if index_engine.loaded:
+            for term in terms:
+                postings = index_engine.get_postings(term)
+                self._postings[term] = postings.doc_nums if postings is not None else []
+            return
+
+        inverted_index, _ = get_index_collections()
+        chunks: Dict[str, List[bytes]] = {term: [] for term in terms}
+        cursor = inverted_index.find(
+            {"term": {"$in": list(terms)}}, {"term": 1, "doc_nums": 1}
+        ).sort([("term", 1), ("bucket", 1)])
+        async for entry in cursor:
+            chunks[entry["term"]].append(entry["doc_nums"])
+        for term, term_chunks in chunks.items():
+            self._postings[term] = CompressedDocSet(term_chunks)
+
+    async def execute(self, node) -> List[str]:
+        """Get the IDs of documents matching a query tree"""
+        if node is None:
+            return []
+
+        await self.load_postings(node)
+        matches = await self.evaluate(node)
+        return await DocIdMap.get_doc_ids(matches)
+
+    async def evaluate(self, node) -> Sequence:
+        """Sorted postings of the documents matching a node"""
+        if isinstance(node, TermNode):
+            if len(node.variants) == 1:
+                return self._postings[node.variants[0]]
+            return union([self._postings[variant] for variant in node.variants])
+
+        if isinstance(node, PhraseNode):
+            return await self.evaluate_phrase(node)
+
+        if node.must:
+            # Rarest clauses first, so each intersection gallops from the smallest running result
+            matches = None
+            for child in sorted(node.must, key=self.estimate):
+                if isinstance(child, PhraseNode) and matches is not None:
+                    # Only check phrase positions for documents that already qualify
+                    matches = await self.evaluate_phrase(child, matches)
+                else:
+                    postings = await self.evaluate(child)
+                    matches = list(postings) if matches is None else intersect([matches, postings])
+                if not matches:
+                    return []
+        elif node.should:
+            matches = union([await self.evaluate(child) for child in node.should])
+        else:
+            return []
+
+        for child in node.must_not:
+            if not matches:
+                break
+            matches = difference(matches, await self.evaluate(child))
+        return matches
+
+    async def evaluate_phrase(self, node: PhraseNode, candidates: Sequence = None) -> List:
+        """Sorted postings of the documents containing a phrase, optionally among candidates"""
+        doc_nums = await PhraseService.find_documents(
+            node.phrase, set(candidates) if candidates is not None else None
+        )
+        return sorted(doc_nums)
+
+    def estimate(self, node) -> float:
+        """Upper bound on the number of documents a node can match"""
+        if isinstance(node, TermNode):
+            return sum(len(self._postings[variant]) for variant in node.variants)
+        if isinstance(node, PhraseNode):
+            # Phrase matching reads positions, so phrases go after the plain terms
+            return float("inf")
+        if node.must:
+            return min(self.estimate(child) for child in node.must)
+        return sum(self.estimate(child) for child in node.should)
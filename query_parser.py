@@ -0,0 +1,266 @@
+"""
+Parser for the boolean search query language
+
+    machine learning          either term (implicit OR, as before)
+    +python -java data        python required, java excluded, data optional
+    python AND (pandas OR numpy) NOT spark
+    "machine learning"~2      phrase (required unless combined with OR)
+
+AND binds tighter than OR, and both bind tighter than the implicit
+combination of juxtaposed clauses. Operators are only recognised in upper
+case, and malformed input (unbalanced parentheses or quotes, dangling
+operators) is parsed leniently rather than rejected.
+"""
+from text_processing import process_text
+from phrase_service import PhraseQuery
+from typing import List, Optional, Tuple
+import re
+
+TOKEN_PATTERN = re.compile(
+    r'"(?P<phrase>[^"]*)"(?:~(?P<slop>\d+))?'
+    r'|(?P<paren>[()])'
+    r'|(?P<modifier>(?<!\S)[+-])(?=[^\s+-])'
+    r'|(?P<quote>")'
+    r'|(?P<word>[^\s()"]+)'
+)
+
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+class TermNode:
+    """A single term; fuzzy matching may widen it to several index terms"""
+
+    __slots__ = ("term", "variants")
+
+    def __init__(self, term: str):
+        self.term = term
+        self.variants: List[str] = [term]
+
+    def key(self) -> Tuple:
+        return ("term", self.term)
+
+
+class PhraseNode:
+    """A quoted phrase or proximity clause"""
+
+    __slots__ = ("phrase",)
+
+    def __init__(self, phrase: PhraseQuery):
+        self.phrase = phrase
+
+    def key(self) -> Tuple:
+        return ("phrase",) + self.phrase.key()
+
+
+class BoolNode:
+    """
+    A combination of clauses.
+
+    With any required (must) clauses, documents must match all of them; the
+    optional (should) clauses then only affect ranking. Otherwise documents
+    must match at least one optional clause. Documents matching an excluded
+    (must_not) clause are always dropped.
+    """
+
+    __slots__ = ("must", "should", "must_not")
+
+    def __init__(self, must: List = None, should: List = None, must_not: List = None):
+        self.must = must or []
+        self.should = should or []
+        self.must_not = must_not or []
+
+    def key(self) -> Tuple:
+        return (
+            "bool",
+            tuple(sorted(node.key() for node in self.must)),
+            tuple(sorted(node.key() for node in self.should)),
+            tuple(sorted(node.key() for node in self.must_not))
+        )
+
+
+class QueryParser:
+    """Recursive descent parser producing TermNode / PhraseNode / BoolNode trees"""
+
+    def __init__(self, query: str):
+        self.tokens: List[Tuple[str, str, Optional[str]]] = []
+        for match in TOKEN_PATTERN.finditer(query):
+            kind = match.lastgroup if match.lastgroup != "slop" else "phrase"
+            if kind == "quote":
+                continue
+            value = match.group(kind)
+            if kind == "word" and value in OPERATORS:
+                kind = "operator"
+            self.tokens.append((kind, value, match.group("slop")))
+        self.pos = 0
+
+    def peek(self) -> Tuple[Optional[str], Optional[str]]:
+        if self.pos < len(self.tokens):
+            kind, value, _ = self.tokens[self.pos]
+            return kind, value
+        return None, None
+
+    def parse(self):
+        """Parse the whole query; returns None when it has no searchable terms"""
+        return self.parse_group(top_level=True)
+
+    def parse_group(self, top_level: bool = False):
+        """clause+ — juxtaposed clauses, each optionally prefixed with + or -"""
+        must, should, must_not = [], [], []
+
+        while True:
+            kind, value = self.peek()
+            if kind is None:
+                break
+            if kind == "paren" and value == ")":
+                if not top_level:
+                    break
+                self.pos += 1  # stray closing parenthesis
+                continue
+
+            modifier = None
+            if kind == "modifier":
+                modifier = value
+                self.pos += 1
+
+            node = self.parse_or()
+            if node is None:
+                continue
+            if modifier is None and isinstance(node, BoolNode) and not node.must and not node.should:
+                # A bare "NOT x" clause excludes x from the whole group
+                must_not.extend(node.must_not)
+            elif modifier == "+":
+                must.append(node)
+            elif modifier == "-":
+                must_not.append(node)
+            elif isinstance(node, PhraseNode):
+                # Bare phrases are required, as they were before the query language existed
+                must.append(node)
+            else:
+                should.append(node)
+
+        return simplify(BoolNode(must, should, must_not))
+
+    def parse_or(self):
+        """and_expr ("OR" and_expr)*"""
+        clauses = []
+        node = self.parse_and()
+        if node is not None:
+            clauses.append(node)
+
+        while self.peek() == ("operator", "OR"):
+            self.pos += 1
+            node = self.parse_and()
+            if node is not None:
+                clauses.append(node)
+
+        if len(clauses) > 1:
+            return simplify(BoolNode(should=clauses))
+        return clauses[0] if clauses else None
+
+    def parse_and(self):
+        """unary ("AND" unary)*"""
+        must, must_not = [], []
+
+        def add(result):
+            node, negated = result
+            if node is not None:
+                (must_not if negated else must).append(node)
+
+        add(self.parse_unary())
+        while self.peek() == ("operator", "AND"):
+            self.pos += 1
+            add(self.parse_unary())
+
+        if len(must) == 1 and not must_not:
+            return must[0]
+        if not must and not must_not:
+            return None
+        return simplify(BoolNode(must=must, must_not=must_not))
+
+    def parse_unary(self) -> Tuple[object, bool]:
+        """("NOT" | "-" | "+") unary | primary, returning the node and whether it is negated"""
+        negated = False
+        while self.peek() in (("operator", "NOT"), ("modifier", "-"), ("modifier", "+")):
+            if self.peek() != ("modifier", "+"):
+                negated = not negated
+            self.pos += 1
+        return self.parse_primary(), negated
+
+    def parse_primary(self):
+        """"(" group ")" | phrase | word"""
+        kind, value = self.peek()
+        if kind is None or kind == "operator" or (kind == "paren" and value == ")"):
+            # Dangling operator: consume it so parsing always advances
+            if kind == "operator":
+                self.pos += 1
+            return None
+
+        _, _, slop = self.tokens[self.pos]
+        self.pos += 1
+
+        if kind == "paren":
+            node = self.parse_group()
+            if self.peek() == ("paren", ")"):
+                self.pos += 1
+            return node
+
+        if kind == "phrase":
+            phrase = PhraseQuery(value, int(slop or 0))
+            if not phrase.terms:
+                return None
+            if len(phrase.terms) == 1:
+                return TermNode(phrase.terms[0])
+            return PhraseNode(phrase)
+
+        terms = process_text(value)
+        if not terms:
+            return None
+        if len(terms) == 1:
+            return TermNode(terms[0])
+        # Words split by punctuation (e.g. "e-mail") match any of their parts, as before
+        return BoolNode(should=[TermNode(term) for term in terms])
+
+
+def simplify(node: BoolNode):
+    """Collapse empty and single-clause boolean nodes"""
+    if not node.must and not node.should and not node.must_not:
+        return None
+    if not node.must_not and len(node.must) + len(node.should) == 1:
+        return (node.must or node.should)[0]
+    return node
+
+
+def parse_query(query: str):
+    """Parse a search query into a query tree, or None if it has no searchable terms"""
+    return QueryParser(query).parse()
+
+
+def positive_terms(node) -> List[str]:
+    """Terms (with fuzzy variants) from every clause that is not excluded, for scoring"""
+    if node is None:
+        return []
+    if isinstance(node, TermNode):
+        return list(node.variants)
+    if isinstance(node, PhraseNode):
+        return list(node.phrase.terms)
+    return [term for child in node.must + node.should for term in positive_terms(child)]
+
+
+def term_nodes(node, excluded: bool = True) -> List[TermNode]:
+    """Every term node in a query tree; with excluded=False, only those outside excluded clauses"""
+    if node is None or isinstance(node, PhraseNode):
+        return []
+    if isinstance(node, TermNode):
+        return [node]
+    children = node.must + node.should + (node.must_not if excluded else [])
+    return [term for child in children for term in term_nodes(child, excluded)]
+
+
+def is_disjunction(node) -> bool:
+    """Whether a query is a plain OR of terms (eligible for top-k retrieval)"""
+    if isinstance(node, TermNode):
+        return True
+    return (
+        isinstance(node, BoolNode) and not node.must and not node.must_not
+        and all(isinstance(child, TermNode) for child in node.should)
+    )
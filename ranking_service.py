@@ -1,6 +1,14 @@
-from mongodb import get_database
-from text_processing import process_text
-from typing import List, Dict
+from mongodb import get_index_collections
+from text_processing import get_term_frequencies
+from index_engine import index_engine
+from doc_id_map import DocIdMap
+from postings_codec import decode_postings
+from collection_stats import collection_stats
+from bm25_ranker import BM25Ranker
+from document_service import DocumentService
+from config import settings
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 import math
 import logging
 
@@ -8,49 +16,95 @@ logger = logging.getLogger(__name__)
 
 
 class RankingService:
-    """Service for ranking search results using TF-IDF"""
+    """Service for ranking search results using TF-IDF or BM25"""
     
     @staticmethod
-    def calculate_tf(term: str, doc: Dict) -> float:
-        """Calculate Term Frequency (TF) for a term in a document"""
-        # Combine title and content (title appears twice for higher weight)
-        full_text = f"{doc.get('title', '')} {doc.get('title', '')} {doc.get('content', '')}"
-        tokens = process_text(full_text)
-        
-        if not tokens:
-            return 0.0
-        
-        # Count occurrences of term
-        term_count = tokens.count(term.lower())
-        total_terms = len(tokens)
-        
-        if total_terms == 0:
+    def calculate_tf(term_count: int, doc_length: int) -> float:
+        """Calculate Term Frequency (TF) from stored index statistics"""
+        if doc_length == 0:
             return 0.0
         
         # TF = (count of term) / (total terms in document)
-        tf = term_count / total_terms
+        tf = term_count / doc_length
         return tf
     
     @staticmethod
-    async def calculate_idf(term: str) -> float:
-        """Calculate Inverse Document Frequency (IDF) for a term"""
-        db = get_database()
-        
-        # Get total number of documents
-        total_docs = await db.documents.count_documents({})
-        
-        if total_docs == 0:
-            return 0.0
-        
-        # Get number of documents containing the term
-        index_entry = await db.inverted_index.find_one({"term": term.lower()})
+    async def get_term_frequencies(query_terms: List[str], doc_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Load the frequencies of the query terms in the candidate documents from the index"""
+        term_freqs = {}
+        
+        if index_engine.loaded:
+            known = [(doc_id, index_engine.doc_num(doc_id)) for doc_id in doc_ids]
+            known = [(doc_id, doc_num) for doc_id, doc_num in known if doc_num is not None]
+            doc_nums = np.array([doc_num for _, doc_num in known], dtype=np.int32)
+            matrix = BM25Ranker.term_frequency_matrix(doc_nums, query_terms)
+            for col, term in enumerate(query_terms):
+                hits = np.flatnonzero(matrix[:, col])
+                term_freqs[term] = {known[row][0]: int(matrix[row, col]) for row in hits}
+            return term_freqs
+        
+        doc_nums = await DocIdMap.get_doc_num_map(list(doc_ids))
+        if not doc_nums:
+            return term_freqs
+        
+        inverted_index, _ = get_index_collections()
+        buckets: Dict[str, List[Tuple[bytes, bytes]]] = {}
+        cursor = inverted_index.find(
+            {"term": {"$in": list(query_terms)}}, {"term": 1, "doc_nums": 1, "freqs": 1}
+        ).sort([("term", 1), ("bucket", 1)])
+        async for entry in cursor:
+            buckets.setdefault(entry["term"], []).append((entry["doc_nums"], entry["freqs"]))
+        
+        # Look the candidates up in each term's decoded postings
+        candidate_ids = list(doc_nums)
+        candidates = np.array(list(doc_nums.values()), dtype=np.int32)
+        for term, term_buckets in buckets.items():
+            posting_docs, posting_freqs = decode_postings(term_buckets)
+            if not posting_docs.size:
+                continue
+            pos = np.minimum(np.searchsorted(posting_docs, candidates), len(posting_docs) - 1)
+            hits = np.flatnonzero(posting_docs[pos] == candidates)
+            term_freqs[term] = {candidate_ids[i]: int(posting_freqs[pos[i]]) for i in hits}
+        
+        return term_freqs
+    
+    @staticmethod
+    async def get_document_lengths(doc_ids: List[str]) -> Dict[str, int]:
+        """Load indexed token counts for the given documents"""
+        doc_lengths = {}
+        
+        if index_engine.loaded:
+            for doc_id in doc_ids:
+                doc_num = index_engine.doc_num(doc_id)
+                if doc_num is not None and index_engine.doc_lengths[doc_num]:
+                    doc_lengths[doc_id] = index_engine.doc_lengths[doc_num]
+            return doc_lengths
+        
+        _, doc_stats = get_index_collections()
+        cursor = doc_stats.find({"doc_id": {"$in": list(doc_ids)}})
+        async for entry in cursor:
+            doc_lengths[entry["doc_id"]] = entry.get("length", 0)
+        
+        return doc_lengths
+    
+    @staticmethod
+    async def get_collection_size() -> Tuple[int, float]:
+        """Get the number of indexed documents and their average length"""
+        if not collection_stats.loaded:
+            await collection_stats.load()
         
-        if not index_entry:
-            return 0.0
+        return collection_stats.total_documents, collection_stats.avg_doc_length
+    
+    @staticmethod
+    async def calculate_idf(term: str) -> float:
+        """Calculate Inverse Document Frequency (IDF) for a term from cached statistics"""
+        if not collection_stats.loaded:
+            await collection_stats.load()
         
-        docs_with_term = index_entry.get("doc_count", 0)
+        total_docs = collection_stats.total_documents
+        docs_with_term = collection_stats.doc_freq(term.lower())
         
-        if docs_with_term == 0:
+        if total_docs == 0 or docs_with_term == 0:
             return 0.0
         
         # IDF = log(total documents / documents with term)
@@ -58,27 +112,57 @@ class RankingService:
         return idf
     
     @staticmethod
-    async def calculate_tfidf(term: str, doc: Dict) -> float:
+    async def calculate_tfidf(term: str, term_count: int, doc_length: int) -> float:
         """Calculate TF-IDF score for a term in a document"""
-        tf = RankingService.calculate_tf(term, doc)
+        tf = RankingService.calculate_tf(term_count, doc_length)
         idf = await RankingService.calculate_idf(term)
         
         tfidf = tf * idf
         return tfidf
     
     @staticmethod
-    async def rank_documents(documents: List[Dict], query_terms: List[str]) -> List[Dict]:
-        """Rank documents by relevance to query using TF-IDF"""
+    async def rank_documents(documents: List[Dict], query_terms: List[str], mode: Optional[str] = None) -> List[Dict]:
+        """Rank documents by relevance to query using the configured ranking mode"""
+        mode = mode or settings.RANKING_MODE
+        
+        if mode == "bm25":
+            return await RankingService.rank_documents_bm25(documents, query_terms)
+        
+        # Read term frequencies and document lengths recorded at index time
+        doc_ids = [doc["_id"] for doc in documents]
+        term_freqs = await RankingService.get_term_frequencies(query_terms, doc_ids)
+        doc_lengths = await RankingService.get_document_lengths(doc_ids)
+        
+        # Documents indexed before statistics were stored are counted once until the index is rebuilt
+        legacy_docs = {}
+        legacy_ids = [doc["_id"] for doc in documents if doc["_id"] not in doc_lengths]
+        if legacy_ids:
+            for doc in await DocumentService.get_documents_by_ids(legacy_ids, {"title": 1, "content": 1}):
+                legacy_docs[doc["_id"]] = doc
         
         # Calculate scores for each document
         ranked_docs = []
         
         for doc in documents:
+            doc_id = doc["_id"]
             total_score = 0.0
             
+            if doc_id in doc_lengths:
+                doc_length = doc_lengths[doc_id]
+                doc_term_freqs = {term: term_freqs.get(term, {}).get(doc_id, 0) for term in query_terms}
+            else:
+                legacy_doc = legacy_docs.get(doc_id, doc)
+                counts = get_term_frequencies(
+                    f"{legacy_doc.get('title', '')} {legacy_doc.get('title', '')} {legacy_doc.get('content', '')}"
+                )
+                doc_length = sum(counts.values())
+                doc_term_freqs = {term: counts.get(term, 0) for term in query_terms}
+            
             # Sum TF-IDF scores for all query terms
             for term in query_terms:
-                tfidf = await RankingService.calculate_tfidf(term, doc)
+                if doc_term_freqs[term] == 0:
+                    continue
+                tfidf = await RankingService.calculate_tfidf(term, doc_term_freqs[term], doc_length)
                 total_score += tfidf
             
             # Add score to document
@@ -89,3 +173,45 @@ class RankingService:
         ranked_docs.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
         
         return ranked_docs
+    
+    @staticmethod
+    async def rank_documents_bm25(documents: List[Dict], query_terms: List[str]) -> List[Dict]:
+        """Rank documents by relevance to query using vectorized BM25"""
+        query_terms = list(dict.fromkeys(query_terms))
+        ranker = BM25Ranker()
+        doc_ids = [doc["_id"] for doc in documents]
+        
+        total_docs, avg_doc_length = await RankingService.get_collection_size()
+        
+        if index_engine.loaded:
+            # Score straight from the in-memory postings arrays
+            doc_nums = [index_engine.doc_num(doc_id) for doc_id in doc_ids]
+            known = np.array([doc_num is not None for doc_num in doc_nums], dtype=bool)
+            scores = np.zeros(len(documents))
+            scores[known] = ranker.score_candidates(
+                np.array([doc_num for doc_num in doc_nums if doc_num is not None], dtype=np.int32),
+                query_terms
+            )
+        else:
+            term_freqs = await RankingService.get_term_frequencies(query_terms, doc_ids)
+            doc_lengths = await RankingService.get_document_lengths(doc_ids)
+            
+            matrix = np.array(
+                [[term_freqs.get(term, {}).get(doc_id, 0) for term in query_terms] for doc_id in doc_ids],
+                dtype=np.float64
+            ).reshape(len(doc_ids), len(query_terms))
+            scores = ranker.score(
+                matrix,
+                np.array([doc_lengths.get(doc_id, 0) for doc_id in doc_ids], dtype=np.float64),
+                np.array([collection_stats.doc_freq(term) for term in query_terms], dtype=np.float64),
+                total_docs,
+                avg_doc_length
+            )
+        
+        for doc, score in zip(documents, scores):
+            doc["relevance_score"] = round(float(score), 4)
+        
+        # Sort documents by score (highest first)
+        ranked_docs = sorted(documents, key=lambda x: x.get("relevance_score", 0), reverse=True)
+        
+        return ranked_docs
@@ -3,7 +3,7 @@ API routes for loading sample data
 """
 from fastapi import APIRouter, HTTPException
 from mongodb import get_database
-from indexing_service import IndexingService
+from indexing_queue import indexing_queue
 from security import hash_password
 from datetime import datetime
 
@@ -75,8 +75,8 @@ async def load_sample_data():
         result = await db.documents.insert_one(doc)
         doc_id = str(result.inserted_id)
         
-        # Index the document
-        await IndexingService.build_index_for_document(doc_id, doc["title"], doc["content"])
+        # Queue the document for indexing; the worker commits the whole load together
+        await indexing_queue.add(doc_id, doc["title"], doc["content"])
         count += 1
     
     return {
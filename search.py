@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Query
 from search_service import SearchService
-from typing import Dict
+from suggest_index import suggest_index
+from collection_stats import collection_stats
+from typing import Dict, Optional
 
 router = APIRouter(prefix="/api/search", tags=["Search"])
 
@@ -9,12 +11,32 @@ router = APIRouter(prefix="/api/search", tags=["Search"])
 async def search_documents(
     q: str = Query(..., description="Search query"),
     page: int = Query(1, ge=1, description="Page number"),
-    limit: int = Query(10, ge=1, le=100, description="Results per page")
+    limit: int = Query(10, ge=1, le=100, description="Results per page"),
+    ranking: Optional[str] = Query(None, pattern="^(tfidf|bm25)$", description="Ranking mode")
 ):
     """
     Search for documents matching the query.
     
-    Returns documents ranked by relevance using TF-IDF algorithm.
+    Returns documents ranked by relevance using TF-IDF (default) or BM25.
     """
-    results = await SearchService.search(q, page, limit)
+    results = await SearchService.search(q, page, limit, ranking=ranking)
     return results
+
+
+@router.get("/suggest", response_model=Dict)
+async def suggest_terms(
+    prefix: str = Query(..., min_length=1, description="Text typed so far"),
+    limit: int = Query(10, ge=1, le=suggest_index.TOP_K, description="Maximum suggestions")
+):
+    """
+    Autocomplete the last word of the prefix.
+    
+    Returns indexed terms starting with it, most frequent first, each with
+    a word that searches for the term. Served from memory, so it is cheap
+    enough to call on every keystroke.
+    """
+    if not suggest_index.loaded:
+        if not collection_stats.loaded:
+            await collection_stats.load()
+        await suggest_index.load()
+    return {"prefix": prefix, "suggestions": suggest_index.suggest(prefix, limit)}
@@ -1,69 +1,91 @@
 """
 Enhanced search service with fuzzy matching and auto-correct
 """
-from mongodb import get_database
-from text_processing import process_text
+from mongodb import get_index_collections
 from ranking_service import RankingService
-from typing import List, Dict
-from bson import ObjectId
+from document_service import DocumentService
+from index_engine import index_engine
+from doc_id_map import DocIdMap
+from fuzzy_index import fuzzy_index, damerau_levenshtein
+from collection_stats import collection_stats
+from top_k import TopKProcessor
+from query_cache import query_cache
+from query_parser import parse_query, positive_terms, term_nodes, is_disjunction
+from query_executor import QueryExecutor
+from postings_codec import decode_doc_sets
+from config import settings
+from typing import List, Dict, Optional, Set, Tuple
 
 class SearchService:
     """Service for searching documents with fuzzy matching"""
     
     @staticmethod
     def calculate_similarity(word1: str, word2: str) -> float:
-        """Calculate similarity between two words using Levenshtein distance"""
+        """Calculate similarity between two words using Damerau-Levenshtein distance"""
         if word1 == word2:
             return 1.0
         
-        # Simple similarity based on common characters
-        len1, len2 = len(word1), len(word2)
-        if len1 == 0 or len2 == 0:
+        max_len = max(len(word1), len(word2))
+        if min(len(word1), len(word2)) == 0:
             return 0.0
         
-        # Count matching characters
-        matches = sum(1 for c in word1 if c in word2)
-        max_len = max(len1, len2)
-        
-        return matches / max_len
+        distance = damerau_levenshtein(word1, word2, max_len)
+        return 1.0 - distance / max_len
     
     @staticmethod
     async def expand_query_with_fuzzy_match(query_terms: List[str], threshold: float = 0.7) -> List[str]:
-        """Expand query terms with similar terms from the index"""
-        db = get_database()
-        expanded_terms = set(query_terms)
+        """Expand query terms with similar terms from the fuzzy term index"""
+        if not fuzzy_index.loaded:
+            await fuzzy_index.load()
         
-        # Get all unique terms from the index
-        index_terms = await db.inverted_index.distinct("term")
+        expanded_terms = set(query_terms)
         
         for query_term in query_terms:
-            for index_term in index_terms:
-                similarity = SearchService.calculate_similarity(query_term.lower(), index_term.lower())
-                if similarity >= threshold and index_term not in expanded_terms:
+            query_term = query_term.lower()
+            
+            # Largest edit distance that still meets the similarity threshold
+            max_distance = int(len(query_term) * (1.0 - threshold) + 1e-9)
+            if max_distance == 0:
+                continue
+            
+            for index_term, distance in fuzzy_index.lookup(query_term, max_distance):
+                if 1.0 - distance / max(len(query_term), len(index_term)) >= threshold:
                     expanded_terms.add(index_term)
         
         return list(expanded_terms)
     
     @staticmethod
-    async def search(query: str, page: int = 1, limit: int = 10, use_fuzzy: bool = True) -> Dict:
+    async def search(
+        query: str,
+        page: int = 1,
+        limit: int = 10,
+        use_fuzzy: bool = True,
+        ranking: Optional[str] = None
+    ) -> Dict:
         """
         Search for documents matching the query with fuzzy matching
         
+        The query language supports AND / OR / NOT, required (+) and
+        excluded (-) clauses, parentheses, and quoted phrases, where
+        "phrase"~N allows the terms to drift up to N positions apart. Plain
+        words are OR-ed as before. Ranked results are cached per normalized
+        query, so repeated queries and later pages of the same query skip
+        expansion and ranking.
+        
         Args:
             query: Search query string
             page: Page number (1-indexed)
             limit: Number of results per page
             use_fuzzy: Enable fuzzy matching for typo tolerance
+            ranking: Ranking mode ("tfidf" or "bm25"), defaults to settings.RANKING_MODE
         
         Returns:
             Dictionary with search results and metadata
         """
-        db = get_database()
-        
         # Process query
-        query_terms = process_text(query)
+        query_tree = parse_query(query)
         
-        if not query_terms:
+        if query_tree is None:
             return {
                 "query": query,
                 "total_results": 0,
@@ -72,55 +94,113 @@ class SearchService:
                 "results": []
             }
         
-        # Expand query with fuzzy matching if enabled
+        mode = ranking or settings.RANKING_MODE
+        cache_key = (query_tree.key(), use_fuzzy, mode)
+        start_idx = (page - 1) * limit
+        end_idx = start_idx + limit
+        
+        cached = query_cache.get(cache_key)
+        if cached is None or (not cached["complete"] and len(cached["ranked"]) < end_idx):
+            generation = query_cache.generation
+            depth = end_idx if cached is None else max(end_idx, 2 * len(cached["ranked"]))
+            cached = await SearchService.rank_query(query_tree, use_fuzzy, mode, depth)
+            query_cache.put(cache_key, cached, generation)
+        
+        # Load full bodies only for the requested page
+        paginated_results = await SearchService.hydrate_results(cached["ranked"][start_idx:end_idx])
+        
+        return {
+            "query": query,
+            "total_results": cached["total_results"],
+            "page": page,
+            "limit": limit,
+            "results": paginated_results
+        }
+    
+    @staticmethod
+    async def rank_query(query_tree, use_fuzzy: bool, mode: str, depth: int) -> Dict:
+        """
+        Rank the documents matching a parsed query
+        
+        Returns:
+            Dictionary with the ranked (doc_id, score) pairs, the total number
+            of matches, and whether the ranking covers every match or only
+            the best `depth` documents
+        """
+        # Expand each term with its fuzzy matches if enabled; excluded terms stay literal
         if use_fuzzy:
-            query_terms = await SearchService.expand_query_with_fuzzy_match(query_terms)
+            for term_node in term_nodes(query_tree, excluded=False):
+                term_node.variants = await SearchService.expand_query_with_fuzzy_match([term_node.term])
+        
+        query_terms = list(dict.fromkeys(positive_terms(query_tree)))
+        
+        if is_disjunction(query_tree):
+            # BM25 over the in-memory index can stop after the best `depth` documents
+            if index_engine.loaded and mode == "bm25":
+                return await SearchService.rank_top_k(query_terms, depth)
+            matching_doc_ids = await SearchService.get_matching_documents(query_terms)
+        else:
+            matching_doc_ids = await QueryExecutor().execute(query_tree)
+        
+        if not matching_doc_ids:
+            return {"ranked": [], "total_results": 0, "complete": True}
+        
+        # Fetch candidate IDs in batches; ranking only needs the stored statistics
+        documents = await DocumentService.get_documents_by_ids(list(matching_doc_ids), {"_id": 1})
         
-        # Find documents containing any of the query terms
+        # Rank documents by relevance
+        ranked_docs = await RankingService.rank_documents(documents, query_terms, mode)
+        
+        return {
+            "ranked": [(doc["_id"], doc["relevance_score"]) for doc in ranked_docs],
+            "total_results": len(ranked_docs),
+            "complete": True
+        }
+    
+    @staticmethod
+    async def get_matching_documents(query_terms: List[str]) -> Set[str]:
+        """Find documents containing any of the query terms"""
         matching_doc_ids = set()
         
+        if index_engine.loaded:
+            # Serve postings from the in-memory index
+            for term in query_terms:
+                matching_doc_ids.update(index_engine.get_doc_ids(term))
+            return matching_doc_ids
+        
+        inverted_index, _ = get_index_collections()
+        
+        matching_doc_nums = set()
         for term in query_terms:
             # Find documents in inverted index
-            index_entry = await db.inverted_index.find_one({"term": term})
-            if index_entry:
-                matching_doc_ids.update(index_entry.get("doc_ids", []))
+            cursor = inverted_index.find({"term": term}, {"doc_nums": 1}).sort("bucket", 1)
+            chunks = [entry["doc_nums"] async for entry in cursor]
+            matching_doc_nums.update(decode_doc_sets(chunks).tolist())
         
-        if not matching_doc_ids:
-            return {
-                "query": query,
-                "total_results": 0,
-                "page": page,
-                "limit": limit,
-                "results": []
-            }
+        matching_doc_ids.update(await DocIdMap.get_doc_ids(matching_doc_nums))
+        return matching_doc_ids
+    
+    @staticmethod
+    async def hydrate_results(scored_ids: List[Tuple[str, float]]) -> List[Dict]:
+        """Load full documents for ranked (doc_id, score) pairs, keeping their order"""
+        documents = await DocumentService.get_documents_by_ids([doc_id for doc_id, _ in scored_ids])
+        scores = dict(scored_ids)
         
-        # Get document details
-        documents = []
-        documents = []
-        for doc_id in matching_doc_ids:
-            try:
-                # Convert string ID to ObjectId for lookup
-                doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
-                if doc:
-                    doc["_id"] = str(doc["_id"])
-                    documents.append(doc)
-            except Exception:
-                # Skip invalid IDs or other errors
-                continue
+        for doc in documents:
+            doc["relevance_score"] = round(scores[doc["_id"]], 4)
         
-        # Rank documents by relevance
-        ranked_docs = await RankingService.rank_documents(documents, query_terms)
+        return documents
+    
+    @staticmethod
+    async def rank_top_k(query_terms: List[str], depth: int) -> Dict:
+        """Rank with MaxScore top-k retrieval, keeping only the best `depth` documents"""
+        if not collection_stats.loaded:
+            await collection_stats.load()
         
-        # Pagination
-        total_results = len(ranked_docs)
-        start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        paginated_results = ranked_docs[start_idx:end_idx]
+        top_docs, total_results = TopKProcessor().search(query_terms, depth)
         
         return {
-            "query": query,
+            "ranked": [(index_engine.doc_id(doc_num), score) for doc_num, score in top_docs],
             "total_results": total_results,
-            "page": page,
-            "limit": limit,
-            "results": paginated_results
+            "complete": len(top_docs) >= total_results
         }
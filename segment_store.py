@@ -0,0 +1,772 @@
+"""
+LSM-style inverted index stored in immutable, memory-mapped segment files
+"""
+from postings_codec import encode_doc_set, decode_doc_set, encode_gaps, decode_gaps, encode_positions
+from text_processing import analyzer, LEGACY_ANALYZER
+from config import settings
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import numpy as np
+import asyncio
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SEG1"
+
+# Section boundaries of a segment file, stored in its footer
+SECTIONS = [
+    "postings", "terms", "term_offsets", "postings_offsets",
+    "doc_nums", "doc_lengths", "doc_id_offsets", "doc_ids",
+    "forward_offsets", "forward"
+]
+FOOTER = struct.Struct(f"<4sII{len(SECTIONS) + 1}Q")
+
+# Document count and encoded document set length at the start of each term's postings record
+RECORD = struct.Struct("<II")
+
+# (term, sorted document numbers, frequencies, encoded positions per document)
+TermData = Tuple[str, np.ndarray, np.ndarray, List[bytes]]
+
+
+def write_segment(path: str, postings: Iterable[TermData], documents: Dict[int, Tuple[str, int]]):
+    """
+    Write an immutable segment file
+
+    Args:
+        path: File to create
+        postings: Term postings in term order
+        documents: doc_num -> (doc_id, length) for every document in the postings
+    """
+    doc_nums = np.array(sorted(documents), dtype=np.int32)
+    rows = {int(doc_num): row for row, doc_num in enumerate(doc_nums)}
+    forward: List[List[int]] = [[] for _ in range(len(doc_nums))]
+
+    postings_blob = bytearray()
+    postings_offsets = [0]
+    terms_blob = bytearray()
+    term_offsets = [0]
+
+    for ordinal, (term, term_nums, freqs, positions) in enumerate(postings):
+        doc_set = encode_doc_set(term_nums)
+        position_offsets = np.zeros(len(positions) + 1, dtype="<u4")
+        np.cumsum([len(data) for data in positions], out=position_offsets[1:])
+
+        postings_blob += RECORD.pack(len(term_nums), len(doc_set))
+        postings_blob += doc_set
+        postings_blob += np.asarray(freqs, dtype="<i4").tobytes()
+        postings_blob += position_offsets.tobytes()
+        postings_blob += b"".join(positions)
+        postings_offsets.append(len(postings_blob))
+
+        terms_blob += term.encode("utf-8")
+        term_offsets.append(len(terms_blob))
+
+        for doc_num in term_nums.tolist():
+            forward[rows[doc_num]].append(ordinal)
+
+    doc_ids = [documents[int(doc_num)][0].encode("utf-8") for doc_num in doc_nums]
+    forward_data = [encode_gaps(ordinals) for ordinals in forward]
+
+    sections = [
+        bytes(postings_blob),
+        bytes(terms_blob),
+        np.array(term_offsets, dtype="<u4").tobytes(),
+        np.array(postings_offsets, dtype="<u8").tobytes(),
+        doc_nums.astype("<i4").tobytes(),
+        np.array([documents[int(doc_num)][1] for doc_num in doc_nums], dtype="<i4").tobytes(),
+        np.concatenate(([0], np.cumsum([len(doc_id) for doc_id in doc_ids]))).astype("<u4").tobytes(),
+        b"".join(doc_ids),
+        np.concatenate(([0], np.cumsum([len(data) for data in forward_data]))).astype("<u4").tobytes(),
+        b"".join(forward_data)
+    ]
+
+    offsets = [0]
+    for section in sections:
+        offsets.append(offsets[-1] + len(section))
+
+    # Write under a temporary name so a crash never leaves a partial segment in place
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        for section in sections:
+            f.write(section)
+        f.write(FOOTER.pack(MAGIC, len(term_offsets) - 1, len(doc_nums), *offsets))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Segment:
+    """
+    Read-only view of a segment file through mmap.
+
+    Nothing is loaded up front beyond the footer: term lookups binary
+    search the term dictionary in place, and postings are decoded from the
+    mapping on demand, so the operating system's page cache decides what
+    stays in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        footer = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        magic, self.term_count, self.doc_count = footer[:3]
+        if magic != MAGIC:
+            raise ValueError(f"Not an index segment: {path}")
+        self._offsets = dict(zip(SECTIONS, footer[3:]))
+        self._offsets["end"] = footer[-1]
+
+        self._term_offsets = self._array("term_offsets", "<u4")
+        self._postings_offsets = self._array("postings_offsets", "<u8")
+        self.doc_nums = self._array("doc_nums", "<i4")
+        self.doc_lengths = self._array("doc_lengths", "<i4")
+        self._doc_id_offsets = self._array("doc_id_offsets", "<u4")
+        self._forward_offsets = self._array("forward_offsets", "<u4")
+
+    def _array(self, section: str, dtype: str) -> np.ndarray:
+        """Zero-copy numpy view of a fixed-width section"""
+        start = self._offsets[section]
+        end = self._offsets[SECTIONS[SECTIONS.index(section) + 1]] if section != SECTIONS[-1] else self._offsets["end"]
+        return np.frombuffer(self._map, dtype=dtype, count=(end - start) // np.dtype(dtype).itemsize, offset=start)
+
+    def term(self, ordinal: int) -> str:
+        """Term at a position in the sorted dictionary"""
+        base = self._offsets["terms"]
+        start, end = self._term_offsets[ordinal], self._term_offsets[ordinal + 1]
+        return bytes(self._view[base + start:base + end]).decode("utf-8")
+
+    def find_term(self, term: str) -> int:
+        """Ordinal of a term, or -1 if the segment does not contain it"""
+        target = term.encode("utf-8")
+        base = self._offsets["terms"]
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = bytes(self._view[base + self._term_offsets[mid]:base + self._term_offsets[mid + 1]])
+            if current < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self.term(lo) == term:
+            return lo
+        return -1
+
+    def terms(self) -> Iterator[str]:
+        """Every term, in order"""
+        return (self.term(ordinal) for ordinal in range(self.term_count))
+
+    def _record(self, ordinal: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Document numbers, frequencies and the positions offsets position of a postings record"""
+        start = self._offsets["postings"] + int(self._postings_offsets[ordinal])
+        count, set_length = RECORD.unpack_from(self._map, start)
+        start += RECORD.size
+        doc_nums = decode_doc_set(self._view[start:start + set_length])
+        freqs = np.frombuffer(self._map, dtype="<i4", count=count, offset=start + set_length)
+        return doc_nums, freqs, start + set_length + count * 4
+
+    def postings(self, ordinal: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted document numbers and frequencies of a term"""
+        doc_nums, freqs, _ = self._record(ordinal)
+        return doc_nums, freqs
+
+    def positions(self, ordinal: int) -> Tuple[np.ndarray, np.ndarray, List[bytes]]:
+        """Document numbers, frequencies and encoded positions of a term"""
+        doc_nums, freqs, start = self._record(ordinal)
+        offsets = np.frombuffer(self._map, dtype="<u4", count=len(doc_nums) + 1, offset=start)
+        base = start + len(offsets) * 4
+        bounds = offsets.tolist()
+        return doc_nums, freqs, [
+            bytes(self._view[base + bounds[i]:base + bounds[i + 1]]) for i in range(len(doc_nums))
+        ]
+
+    def positions_for(self, ordinal: int, doc_nums: Iterable[int]) -> Dict[int, bytes]:
+        """Encoded positions of a term in the given documents, for those that contain it"""
+        term_nums, _, start = self._record(ordinal)
+        wanted = np.asarray(list(doc_nums), dtype=np.int32)
+        rows = np.searchsorted(term_nums, wanted)
+        found = (rows < len(term_nums)) & (term_nums[np.minimum(rows, len(term_nums) - 1)] == wanted)
+        if not found.any():
+            return {}
+
+        offsets = np.frombuffer(self._map, dtype="<u4", count=len(term_nums) + 1, offset=start)
+        base = start + len(offsets) * 4
+        return {
+            int(doc_num): bytes(self._view[base + int(offsets[row]):base + int(offsets[row + 1])])
+            for doc_num, row in zip(wanted[found].tolist(), rows[found].tolist())
+        }
+
+    def find_document(self, doc_num: int) -> int:
+        """Row of a document in the segment's document table, or -1"""
+        row = int(np.searchsorted(self.doc_nums, doc_num))
+        if row < self.doc_count and self.doc_nums[row] == doc_num:
+            return row
+        return -1
+
+    def doc_id(self, row: int) -> str:
+        base = self._offsets["doc_ids"]
+        start, end = self._doc_id_offsets[row], self._doc_id_offsets[row + 1]
+        return bytes(self._view[base + start:base + end]).decode("utf-8")
+
+    def document_terms(self, row: int) -> List[str]:
+        """Terms of a document, from the segment's forward index"""
+        base = self._offsets["forward"]
+        start, end = self._forward_offsets[row], self._forward_offsets[row + 1]
+        return [self.term(ordinal) for ordinal in decode_gaps(self._view[base + start:base + end])]
+
+    def documents(self) -> Iterator[Tuple[int, str, int]]:
+        """(doc_num, doc_id, length) of every document"""
+        for row, (doc_num, length) in enumerate(zip(self.doc_nums.tolist(), self.doc_lengths.tolist())):
+            yield doc_num, self.doc_id(row), length
+
+
+class MemSegment:
+    """The small in-memory segment receiving writes until it is flushed to disk"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+        self.documents: Dict[int, Tuple[str, int, List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, doc_num: int, doc_id: str, term_positions: Dict[str, List[int]]):
+        for term, positions in term_positions.items():
+            self.postings.setdefault(term, {})[doc_num] = (len(positions), encode_positions(positions))
+        length = sum(len(positions) for positions in term_positions.values())
+        self.documents[doc_num] = (doc_id, length, list(term_positions))
+
+    def remove(self, doc_num: int) -> Optional[Tuple[str, int, List[str]]]:
+        document = self.documents.pop(doc_num, None)
+        if document is not None:
+            for term in document[2]:
+                term_postings = self.postings[term]
+                del term_postings[doc_num]
+                if not term_postings:
+                    del self.postings[term]
+        return document
+
+    def term_data(self) -> Iterator[TermData]:
+        for term in sorted(self.postings):
+            term_postings = self.postings[term]
+            doc_nums = sorted(term_postings)
+            yield (
+                term,
+                np.array(doc_nums, dtype=np.int32),
+                np.array([term_postings[doc_num][0] for doc_num in doc_nums], dtype=np.int32),
+                [term_postings[doc_num][1] for doc_num in doc_nums]
+            )
+
+
+class SegmentStore:
+    """
+    Inverted index kept as a set of immutable on-disk segments.
+
+    New documents go to an in-memory segment, backed by a write-ahead log,
+    which is flushed to a new segment file once it holds SEGMENT_FLUSH_DOCS
+    documents. Deleting a document from a flushed segment records a
+    tombstone that hides it from reads until a merge drops it for good.
+    A background task merges segments of similar size (SEGMENT_MERGE_FACTOR
+    at a time), so reads touch a logarithmic number of segments.
+
+    The manifest names the live segments, tombstones and write-ahead log;
+    it is replaced atomically, so a crash leaves either the old or the new
+    index, never a mix.
+    """
+
+    # Fraction of a segment's documents deleted before it is rewritten without them
+    EXPUNGE_DELETES_RATIO = 0.2
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.SEGMENT_DIR
+        self.opened = False
+        self.segments: List[Segment] = []
+        self.memtable = MemSegment()
+        self.tombstones: Set[int] = set()
+        # Number of each live document, kept with the segments so writes resolve IDs under the lock
+        self._doc_nums: Dict[str, int] = {}
+        self._tombstone_array = np.empty(0, dtype=np.int32)
+        self.next_doc_num = 0
+        self._next_segment = 0
+        self.analyzer: Optional[str] = None
+        self._wal_name: Optional[str] = None
+        self._wal = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._merge_wanted: Optional[asyncio.Event] = None
+        self._merge_task: Optional[asyncio.Task] = None
+
+    @property
+    def empty(self) -> bool:
+        """Whether the store holds no documents at all"""
+        return not self.segments and not len(self.memtable)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def open(self):
+        """Open the segments named by the manifest, replay the write-ahead log and start merging"""
+        if self.opened:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = asyncio.Lock()
+        self._merge_wanted = asyncio.Event()
+
+        manifest = {}
+        if os.path.exists(self._path("manifest.json")):
+            with open(self._path("manifest.json")) as f:
+                manifest = json.load(f)
+
+        self.segments = [Segment(self._path(name)) for name in manifest.get("segments", [])]
+        self.tombstones = set(manifest.get("tombstones", []))
+        self.next_doc_num = manifest.get("next_doc_num", 0)
+        self._next_segment = manifest.get("next_segment", 0)
+        self.analyzer = manifest.get("analyzer", LEGACY_ANALYZER) if manifest else analyzer.signature()
+        self._wal_name = manifest.get("wal")
+
+        if self._wal_name and os.path.exists(self._path(self._wal_name)):
+            with open(self._path(self._wal_name)) as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+        self._tombstones_changed()
+        self._doc_nums = {doc_id: doc_num for doc_num, doc_id, _ in self.documents()}
+
+        if self._wal_name is None:
+            self._wal_name = self._new_name("wal")
+            self._write_manifest()
+        self._wal = open(self._path(self._wal_name), "a")
+
+        self._merge_task = asyncio.create_task(self._merge_loop())
+        self.opened = True
+        logger.info(
+            f"✅ Opened segment store: {len(self.segments)} segments, "
+            f"{len(self.memtable)} buffered documents, {len(self.tombstones)} tombstones"
+        )
+
+    async def close(self):
+        """Stop merging and close the write-ahead log"""
+        if self._merge_task:
+            self._merge_task.cancel()
+            try:
+                await self._merge_task
+            except asyncio.CancelledError:
+                pass
+        if self._wal:
+            self._wal.close()
+        self.opened = False
+
+    def _new_name(self, kind: str) -> str:
+        name = f"{kind}_{self._next_segment:08d}.{'seg' if kind == 'segment' else 'log'}"
+        self._next_segment += 1
+        return name
+
+    def _write_manifest(self):
+        manifest = {
+            "segments": [segment.name for segment in self.segments],
+            "tombstones": sorted(self.tombstones),
+            "next_doc_num": self.next_doc_num,
+            "next_segment": self._next_segment,
+            "analyzer": self.analyzer,
+            "wal": self._wal_name
+        }
+        temp_path = self._path("manifest.json.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path("manifest.json"))
+
+    def _log(self, record: Dict):
+        self._wal.write(json.dumps(record) + "\n")
+        self._wal.flush()
+
+    def _apply(self, record: Dict):
+        """Apply a write-ahead log record to the in-memory state"""
+        doc_num = record["doc_num"]
+        if record["op"] == "add":
+            self.memtable.add(doc_num, record["doc_id"], record["positions"])
+            self.next_doc_num = max(self.next_doc_num, doc_num + 1)
+            self._doc_nums[record["doc_id"]] = doc_num
+        else:
+            # A replayed delete may already have been dropped by a merge
+            if self.memtable.remove(doc_num) is None and any(
+                segment.find_document(doc_num) >= 0 for segment in self.segments
+            ):
+                self.tombstones.add(doc_num)
+            if self._doc_nums.get(record.get("doc_id")) == doc_num:
+                del self._doc_nums[record["doc_id"]]
+
+    def _tombstones_changed(self):
+        self._tombstone_array = np.array(sorted(self.tombstones), dtype=np.int32)
+
+    # Reads
+
+    def documents(self) -> Iterator[Tuple[int, str, int]]:
+        """(doc_num, doc_id, length) of every live document"""
+        for segment in self.segments:
+            for doc_num, doc_id, length in segment.documents():
+                if doc_num not in self.tombstones:
+                    yield doc_num, doc_id, length
+        for doc_num, (doc_id, length, _) in self.memtable.documents.items():
+            yield doc_num, doc_id, length
+
+    def terms(self) -> Set[str]:
+        """Every term with at least one posting in a segment or the memtable"""
+        terms = set()
+        for segment in self.segments:
+            terms.update(segment.terms())
+        if self.tombstones:
+            # Until a merge drops them, deleted documents may be a term's only postings
+            terms = {term for term in terms if self.get_postings(term) is not None}
+        return terms | set(self.memtable.postings)
+
+    def get_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Sorted document numbers and frequencies of a term across all segments, minus tombstones"""
+        parts = []
+        for segment in self.segments:
+            ordinal = segment.find_term(term)
+            if ordinal >= 0:
+                parts.append(segment.postings(ordinal))
+
+        buffered = self.memtable.postings.get(term)
+        if buffered:
+            doc_nums = sorted(buffered)
+            parts.append((
+                np.array(doc_nums, dtype=np.int32),
+                np.array([buffered[doc_num][0] for doc_num in doc_nums], dtype=np.int32)
+            ))
+        if not parts:
+            return None
+
+        doc_nums = np.concatenate([part[0] for part in parts])
+        freqs = np.concatenate([part[1] for part in parts])
+        # Merged segments cover interleaved number ranges
+        if len(parts) > 1 and np.any(np.diff(doc_nums) < 0):
+            order = np.argsort(doc_nums, kind="stable")
+            doc_nums, freqs = doc_nums[order], freqs[order]
+        if self._tombstone_array.size:
+            live = ~np.isin(doc_nums, self._tombstone_array)
+            doc_nums, freqs = doc_nums[live], freqs[live]
+        if not doc_nums.size:
+            return None
+        return doc_nums, freqs
+
+    def get_positions(self, term: str, doc_nums: Iterable[int]) -> Dict[int, bytes]:
+        """Encoded positions of a term in the given documents"""
+        doc_nums = list(doc_nums)
+        positions = {}
+        for segment in self.segments:
+            ordinal = segment.find_term(term)
+            if ordinal >= 0:
+                positions.update(segment.positions_for(ordinal, doc_nums))
+
+        buffered = self.memtable.postings.get(term, {})
+        for doc_num in doc_nums:
+            if doc_num in buffered:
+                positions[doc_num] = buffered[doc_num][1]
+        return positions
+
+    # Writes
+
+    def doc_num(self, doc_id: str) -> Optional[int]:
+        """Number of a live document"""
+        return self._doc_nums.get(doc_id)
+
+    async def add_documents(
+        self,
+        analyzed: List[Tuple[str, Dict[str, List[int]]]]
+    ) -> Tuple[Dict[str, int], Dict[str, Tuple[List[str], int]]]:
+        """
+        Add analyzed documents to the memtable
+
+        A document already in the store (say, picked up by a rebuild while
+        its add was queued) is replaced rather than indexed twice.
+
+        Returns:
+            The number assigned to each document, and the terms and length of each replaced one
+        """
+        await self.open()
+        async with self._lock:
+            doc_nums, replaced = {}, {}
+            for doc_id, term_positions in analyzed:
+                previous = self._delete(doc_id)
+                if previous is not None:
+                    replaced[doc_id] = previous
+
+                doc_num = self.next_doc_num
+                self.next_doc_num += 1
+                record = {"op": "add", "doc_num": doc_num, "doc_id": doc_id, "positions": term_positions}
+                self._log(record)
+                self._apply(record)
+                doc_nums[doc_id] = doc_num
+            if replaced:
+                self._tombstones_changed()
+
+            if len(self.memtable) >= settings.SEGMENT_FLUSH_DOCS:
+                await self._flush()
+        return doc_nums, replaced
+
+    async def delete_document(self, doc_id: str) -> Optional[Tuple[List[str], int]]:
+        """
+        Delete a document, dropping it from the memtable or tombstoning it in its segment
+
+        The number is looked up under the lock, so a delete waiting on a
+        rebuild resolves against the renumbered segments.
+
+        Returns:
+            The document's terms and length, or None if it is not indexed
+        """
+        await self.open()
+        async with self._lock:
+            deleted = self._delete(doc_id)
+            if deleted is not None:
+                self._tombstones_changed()
+            return deleted
+
+    def _delete(self, doc_id: str) -> Optional[Tuple[List[str], int]]:
+        """Log and apply the delete of a live document (hold the lock and refresh the tombstone array after)"""
+        doc_num = self._doc_nums.get(doc_id)
+        if doc_num is None:
+            return None
+
+        document = self.memtable.documents.get(doc_num)
+        if document is not None:
+            terms, length = document[2], document[1]
+        else:
+            for segment in self.segments:
+                row = segment.find_document(doc_num)
+                if row >= 0:
+                    terms, length = segment.document_terms(row), int(segment.doc_lengths[row])
+                    break
+            else:
+                return None
+
+        record = {"op": "delete", "doc_num": doc_num, "doc_id": doc_id}
+        self._log(record)
+        self._apply(record)
+        return terms, length
+
+    async def flush(self):
+        """Write the memtable out as a new segment"""
+        await self.open()
+        async with self._lock:
+            await self._flush()
+
+    async def _flush(self):
+        if not len(self.memtable):
+            return
+
+        memtable = self.memtable
+        name = self._new_name("segment")
+        documents = {doc_num: (doc_id, length) for doc_num, (doc_id, length, _) in memtable.documents.items()}
+        await asyncio.to_thread(write_segment, self._path(name), list(memtable.term_data()), documents)
+
+        # Swap the new segment and an empty log in together, so nothing is ever read twice or lost
+        old_wal = self._wal_name
+        self._wal.close()
+        self._wal_name = self._new_name("wal")
+        self._wal = open(self._path(self._wal_name), "a")
+        self.segments = self.segments + [Segment(self._path(name))]
+        self.memtable = MemSegment()
+        self._write_manifest()
+        self._remove_file(old_wal)
+
+        logger.info(f"📦 Flushed {len(documents)} documents to {name}")
+        self._merge_wanted.set()
+
+    def _remove_file(self, name: str):
+        # Open mappings stay valid after unlinking, so readers holding an old segment are unaffected
+        try:
+            os.remove(self._path(name))
+        except OSError as e:
+            logger.warning(f"⚠️ Could not remove {name}: {e}")
+
+    # Merging
+
+    def pick_merge(self) -> List[Segment]:
+        """Segments of one size tier once SEGMENT_MERGE_FACTOR of them have accumulated, or one with many deletes"""
+        factor = settings.SEGMENT_MERGE_FACTOR
+        tiers: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            tier = int(math.log(max(segment.doc_count, 1), factor))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= factor:
+                return tiers[tier][:factor]
+
+        # A segment with many deleted documents is rewritten on its own to reclaim them
+        if self._tombstone_array.size:
+            for segment in self.segments:
+                deleted = np.isin(segment.doc_nums, self._tombstone_array, assume_unique=True).sum()
+                if deleted >= max(1, segment.doc_count * self.EXPUNGE_DELETES_RATIO):
+                    return [segment]
+        return []
+
+    async def _merge_loop(self):
+        while True:
+            await self._merge_wanted.wait()
+            self._merge_wanted.clear()
+            try:
+                while await self.merge_once():
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Segment merge failed: {e}")
+
+    async def merge_once(self) -> bool:
+        """Merge one group of segments, if the policy picks any; returns whether it did"""
+        segments = self.pick_merge()
+        if not segments:
+            return False
+
+        # Tombstones known now are applied; later ones stay until the next merge
+        tombstones = set(self.tombstones)
+        async with self._lock:
+            name = self._new_name("segment")
+        await asyncio.to_thread(merge_segments, self._path(name), segments, tombstones)
+
+        async with self._lock:
+            replaced = {segment.name for segment in segments}
+            if not replaced <= {segment.name for segment in self.segments}:
+                # A rebuild replaced the inputs while they were being merged
+                self._remove_file(name)
+                return False
+
+            merged = Segment(self._path(name))
+            remaining = [segment for segment in self.segments if segment.name not in replaced]
+            self.segments = remaining + [merged]
+
+            # Tombstones are dropped once no segment still holds their document
+            applied = {
+                doc_num for doc_num in tombstones
+                if all(segment.find_document(doc_num) < 0 for segment in self.segments)
+            }
+            self.tombstones -= applied
+            self._tombstones_changed()
+            self._write_manifest()
+
+        for segment in segments:
+            self._remove_file(segment.name)
+        logger.info(
+            f"🔄 Merged {len(segments)} segments into {name} "
+            f"({merged.doc_count} documents, {len(applied)} deletes applied)"
+        )
+        return True
+
+    async def rebuild(self, batches) -> int:
+        """
+        Replace the whole index with documents from an async iterator of analyzed batches
+
+        Writes wait until the new segments are swapped in; reads keep using
+        the old ones until then.
+
+        Returns:
+            Number of documents indexed
+        """
+        await self.open()
+        async with self._lock:
+            names = []
+            buffer = MemSegment()
+            doc_num = 0
+            doc_nums = {}
+            count = 0
+
+            async def write_buffer():
+                name = self._new_name("segment")
+                documents = {num: (doc_id, length) for num, (doc_id, length, _) in buffer.documents.items()}
+                await asyncio.to_thread(write_segment, self._path(name), list(buffer.term_data()), documents)
+                names.append(name)
+
+            async for analyzed in batches:
+                for doc_id, term_positions in analyzed:
+                    buffer.add(doc_num, doc_id, term_positions)
+                    doc_nums[doc_id] = doc_num
+                    doc_num += 1
+                count += len(analyzed)
+                if len(buffer) >= settings.SEGMENT_FLUSH_DOCS:
+                    await write_buffer()
+                    buffer = MemSegment()
+            if len(buffer):
+                await write_buffer()
+
+            old_files = [segment.name for segment in self.segments] + [self._wal_name]
+            self._wal.close()
+            self._wal_name = self._new_name("wal")
+            self._wal = open(self._path(self._wal_name), "a")
+            self.segments = [Segment(self._path(name)) for name in names]
+            self.memtable = MemSegment()
+            self.tombstones = set()
+            self._tombstones_changed()
+            self._doc_nums = doc_nums
+            self.next_doc_num = doc_num
+            self.analyzer = analyzer.signature()
+            self._write_manifest()
+
+        for name in old_files:
+            self._remove_file(name)
+        self._merge_wanted.set()
+        return count
+
+    def stats(self) -> Dict:
+        """Segment counts and sizes"""
+        return {
+            "segments": len(self.segments),
+            "segment_documents": [segment.doc_count for segment in self.segments],
+            "buffered_documents": len(self.memtable),
+            "tombstones": len(self.tombstones)
+        }
+
+
+def merge_segments(path: str, segments: List[Segment], tombstones: Set[int]):
+    """Write the union of several segments as one, dropping tombstoned documents"""
+    tombstone_array = np.array(sorted(tombstones), dtype=np.int32)
+
+    def term_data() -> Iterator[TermData]:
+        def keyed(i: int) -> Iterator[Tuple[str, int, int]]:
+            for ordinal, term in enumerate(segments[i].terms()):
+                yield term, i, ordinal
+
+        iterators = [keyed(i) for i in range(len(segments))]
+        current, parts = None, []
+        for term, i, ordinal in heapq.merge(*iterators):
+            if term != current:
+                if parts:
+                    merged = combine(current, parts)
+                    if merged:
+                        yield merged
+                current, parts = term, []
+            parts.append(segments[i].positions(ordinal))
+        if parts:
+            merged = combine(current, parts)
+            if merged:
+                yield merged
+
+    def combine(term: str, parts) -> Optional[TermData]:
+        doc_nums = np.concatenate([part[0] for part in parts])
+        freqs = np.concatenate([part[1] for part in parts])
+        positions = [data for part in parts for data in part[2]]
+        order = np.argsort(doc_nums, kind="stable")
+        live = ~np.isin(doc_nums[order], tombstone_array)
+        order = order[live]
+        if not order.size:
+            return None
+        return term, doc_nums[order], freqs[order], [positions[i] for i in order.tolist()]
+
+    documents = {
+        doc_num: (doc_id, length)
+        for segment in segments
+        for doc_num, doc_id, length in segment.documents()
+        if doc_num not in tombstones
+    }
+    write_segment(path, term_data(), documents)
+
+
+# Global segment store instance
+segment_store = SegmentStore()
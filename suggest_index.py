@@ -0,0 +1,239 @@
+"""
+Prefix autocomplete over the indexed vocabulary, weighted by document frequency
+"""
+from mongodb import get_database
+from collection_stats import collection_stats
+from text_processing import analyzer
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _rank(completion: Tuple[int, str]):
+    """Heaviest completions first, then alphabetical"""
+    return -completion[0], completion[1]
+
+
+class _Node:
+    """Radix trie node: the label of the edge leading to it, and the completions below it"""
+    __slots__ = ("label", "children", "term", "weight", "top")
+
+    def __init__(self, label: str):
+        self.label = label
+        # Children keyed by the first character of their label
+        self.children: Dict[str, "_Node"] = {}
+        # Set when a term ends at this node
+        self.term: Optional[str] = None
+        self.weight = 0
+        # Best (weight, term) completions in this subtree, or None once stale
+        self.top: Optional[List[Tuple[int, str]]] = None
+
+
+class SuggestIndex:
+    """
+    Radix trie of the indexed terms, weighted by document frequency.
+
+    Chains of single-child nodes are collapsed into one edge, so the trie
+    holds roughly one node per term. Every node caches the TOP_K heaviest
+    completions of its subtree: a lookup walks down the prefix and returns
+    that cache. Changing a term's weight only marks the nodes on its path
+    stale; a stale node is rebuilt from its children's caches the next
+    time it is read, so incremental updates stay cheap and lookups never
+    scan a subtree.
+    """
+
+    TOP_K = 10
+    # Stored documents analyzed at load time to learn the words behind stems
+    SURFACE_SAMPLE_DOCS = 2000
+
+    def __init__(self):
+        self.loaded = False
+        self.size = 0
+        self._root = _Node("")
+
+    def clear(self):
+        """Drop all terms"""
+        self.size = 0
+        self._root = _Node("")
+
+    async def load(self):
+        """Build the trie from the collection statistics (load those first)"""
+        # Build a fresh trie and swap it in whole so lookups never see a partial one
+        fresh = SuggestIndex()
+        for term, doc_freq in collection_stats.doc_freqs().items():
+            fresh.set_weight(term, doc_freq)
+        fresh._top(fresh._root)
+        self._root, self.size = fresh._root, fresh.size
+
+        self.loaded = True
+        logger.info(f"✅ Loaded suggestion trie: {self.size} terms")
+
+        if analyzer.stemming:
+            await self.sample_surfaces()
+
+    async def sample_surfaces(self):
+        """
+        Analyze a sample of the stored documents so suggestions show words, not stems
+
+        Frequent terms are the ones suggested first, and a sample almost
+        always contains them; words seen while indexing are learnt as well.
+        """
+        try:
+            cursor = get_database().documents.find({}, {"title": 1, "content": 1}).limit(self.SURFACE_SAMPLE_DOCS)
+            async for doc in cursor:
+                analyzer.analyze(f"{doc.get('title', '')} {doc.get('content', '')}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not sample documents for suggestions: {e}")
+
+    def set_weight(self, term: str, weight: int):
+        """Insert a term, change its weight, or remove it with a weight of 0"""
+        node = self._root
+        path = [node]
+        i = 0
+        while i < len(term):
+            child = node.children.get(term[i])
+            if child is None:
+                if weight <= 0:
+                    return
+                child = _Node(term[i:])
+                node.children[term[i]] = child
+                i = len(term)
+            else:
+                label = child.label
+                common = 1
+                while common < len(label) and i + common < len(term) and label[common] == term[i + common]:
+                    common += 1
+                if common < len(label):
+                    if weight <= 0:
+                        return
+                    # Split the edge where the term leaves it
+                    middle = _Node(label[:common])
+                    child.label = label[common:]
+                    middle.children[child.label[0]] = child
+                    node.children[term[i]] = middle
+                    child = middle
+                i += common
+            node = child
+            path.append(node)
+
+        if node.weight == weight or (node.term is None and weight <= 0):
+            return
+
+        if weight > 0:
+            if node.term is None:
+                self.size += 1
+            node.term, node.weight = term, weight
+        else:
+            node.term, node.weight = None, 0
+            self.size -= 1
+
+        for visited in path:
+            visited.top = None
+        if weight <= 0:
+            self._prune(path)
+
+    def _prune(self, path: List[_Node]):
+        """Remove nodes left without terms and re-merge edges after a removal"""
+        for depth in range(len(path) - 1, 0, -1):
+            node, parent = path[depth], path[depth - 1]
+            if node.term is not None:
+                return
+            if not node.children:
+                del parent.children[node.label[0]]
+                continue
+            if len(node.children) == 1:
+                (child,) = node.children.values()
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+            return
+
+    def update_terms(self, terms: Iterable[str]):
+        """Re-read the document frequency of terms whose postings changed (ignored until loaded)"""
+        if not self.loaded:
+            return
+        for term in terms:
+            self.set_weight(term, collection_stats.doc_freq(term))
+
+    def _top(self, node: _Node) -> List[Tuple[int, str]]:
+        """A node's cached completions, rebuilding stale caches bottom-up"""
+        if node.top is not None:
+            return node.top
+
+        stack = [node]
+        while stack:
+            current = stack[-1]
+            stale = [child for child in current.children.values() if child.top is None]
+            if stale:
+                stack.extend(stale)
+                continue
+            stack.pop()
+
+            completions = [(current.weight, current.term)] if current.term is not None else []
+            for child in current.children.values():
+                completions.extend(child.top)
+            current.top = heapq.nsmallest(self.TOP_K, completions, key=_rank)
+
+        return node.top
+
+    def _find(self, prefix: str) -> Optional[_Node]:
+        """The node whose subtree holds every term starting with prefix"""
+        node = self._root
+        i = 0
+        while i < len(prefix):
+            child = node.children.get(prefix[i])
+            if child is None:
+                return None
+            label = child.label
+            if prefix.startswith(label, i):
+                i += len(label)
+                node = child
+            elif label.startswith(prefix[i:]):
+                # The prefix ends inside this edge
+                return child
+            else:
+                return None
+        return node
+
+    def complete(self, prefix: str, limit: int = TOP_K) -> List[Tuple[str, int]]:
+        """(term, doc_freq) of the most frequent terms starting with prefix"""
+        node = self._find(prefix)
+        if node is None:
+            return []
+        return [(term, weight) for weight, term in self._top(node)[:limit]]
+
+    def suggest(self, text: str, limit: int = TOP_K) -> List[Dict]:
+        """
+        Completions for the last word of text, most frequent first
+
+        The word is matched against the index terms both as typed and
+        analyzed, since a finished word ("database") is often longer than
+        its stem ("databas").
+
+        Args:
+            text: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of {"text", "term", "doc_freq"}, where text is a word that searches for term
+        """
+        tokens = analyzer.tokenize(text)
+        if not tokens:
+            return []
+
+        word = tokens[-1]
+        completions = dict(self.complete(word, limit))
+        term = analyzer.term(word)
+        if term is not None and term != word:
+            completions.update(self.complete(term, limit))
+
+        ranked = sorted(completions.items(), key=lambda completion: (-completion[1], completion[0]))[:limit]
+        return [
+            {"text": analyzer.surface_form(term), "term": term, "doc_freq": doc_freq}
+            for term, doc_freq in ranked
+        ]
+
+
+# Global suggestion trie instance
+suggest_index = SuggestIndex()
@@ -0,0 +1,139 @@
+"""Tests for the query result cache and the document cache"""
+import pytest
+
+import query_cache as query_cache_module
+from document_cache import DocumentCache
+from query_cache import QueryResultCache
+
+
+def ranked(count: int, complete: bool = True):
+    return {"ranked": [(f"d{i}", float(count - i)) for i in range(count)], "total_results": count, "complete": complete}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable monotonic clock for TTL checks"""
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_query_cache_hit_and_ttl(clock):
+    cache = QueryResultCache(max_entries=10, ttl=60, max_depth=100, max_results=1000)
+    cache.put("python", ranked(3), cache.generation)
+    assert cache.get("python") == ranked(3)
+
+    clock[0] += 59
+    assert cache.get("python") is not None
+    clock[0] += 2
+    assert cache.get("python") is None
+    assert len(cache) == 0 and cache.results == 0
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_query_cache_generation():
+    cache = QueryResultCache(max_entries=10, ttl=60, max_depth=100, max_results=1000)
+    cache.put("python", ranked(3), cache.generation)
+
+    # An index write after the query was cached drops it
+    cache.bump_generation()
+    assert cache.get("python") is None and cache.results == 0
+
+    # Results ranked before a write that landed while ranking are never stored
+    generation = cache.generation
+    cache.bump_generation()
+    cache.put("python", ranked(3), generation)
+    assert cache.get("python") is None and len(cache) == 0
+
+
+def test_query_cache_result_bounds():
+    cache = QueryResultCache(max_entries=10, ttl=60, max_depth=5, max_results=12)
+
+    # Deep results keep only the first max_depth pairs and are marked incomplete
+    cache.put("deep", ranked(8), cache.generation)
+    entry = cache.get("deep")
+    assert entry["ranked"] == ranked(8)["ranked"][:5] and not entry["complete"]
+    assert entry["total_results"] == 8 and cache.results == 5
+
+    # Least recently used entries go first once the entries hold too many pairs
+    cache.put("a", ranked(4), cache.generation)
+    cache.put("b", ranked(3), cache.generation)
+    assert cache.get("deep") is not None
+    cache.put("c", ranked(2), cache.generation)
+    assert cache.get("a") is None
+    assert cache.get("deep") is not None and cache.get("b") is not None and cache.get("c") is not None
+    assert cache.results == 10
+
+    # Replacing an entry releases its old pairs
+    cache.put("b", ranked(1), cache.generation)
+    assert cache.results == 8 and len(cache) == 3
+
+
+def test_query_cache_skips_oversized_results():
+    cache = QueryResultCache(max_entries=10, ttl=60, max_depth=100, max_results=10)
+    cache.put("small", ranked(4), cache.generation)
+    cache.put("large", ranked(11), cache.generation)
+    assert cache.get("large") is None
+    assert cache.get("small") == ranked(4) and cache.results == 4
+
+    # Replacing an entry with an oversized result drops the old one
+    cache.put("small", ranked(11), cache.generation)
+    assert cache.get("small") is None and cache.results == 0
+
+
+def test_query_cache_entry_bound():
+    cache = QueryResultCache(max_entries=2, ttl=60, max_depth=100, max_results=1000)
+    for key in ("a", "b", "c"):
+        cache.put(key, ranked(1), cache.generation)
+    assert cache.get("a") is None and len(cache) == 2
+
+
+def doc(doc_id: str, content: str, title: str = ""):
+    return {"_id": doc_id, "title": title, "content": content}
+
+
+def test_document_cache_eviction_order():
+    cache = DocumentCache(max_bytes=10)
+    cache.put(doc("a", "aaaa"), cache.generation)
+    cache.put(doc("b", "bbbb"), cache.generation)
+    assert cache.total_bytes == 8
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == doc("a", "aaaa")
+    cache.put(doc("c", "cc", title="c"), cache.generation)
+    assert cache.get("b") is None
+    assert cache.get_many(["a", "b", "c"]) == ({"a": doc("a", "aaaa"), "c": doc("c", "cc", title="c")}, ["b"])
+    assert cache.total_bytes == 7
+
+    # Sizes are UTF-8 bytes, so this one needs both older entries gone
+    cache.put(doc("d", "éééé"), cache.generation)
+    assert cache.get("a") is None and cache.get("c") is None
+    assert len(cache) == 1 and cache.total_bytes == 8
+
+
+def test_document_cache_skips_oversized_documents():
+    cache = DocumentCache(max_bytes=10)
+    cache.put(doc("a", "aaaa"), cache.generation)
+    cache.put(doc("big", "x" * 11), cache.generation)
+    assert cache.get("big") is None
+    assert cache.get("a") is not None and cache.total_bytes == 4
+
+
+def test_document_cache_invalidation():
+    cache = DocumentCache(max_bytes=100)
+    cache.put(doc("a", "old"), cache.generation)
+
+    # Cached documents are copies
+    cache.get("a")["content"] = "changed"
+    assert cache.get("a")["content"] == "old"
+
+    # A read that raced with an update is not cached
+    generation = cache.generation
+    cache.invalidate("a")
+    assert cache.get("a") is None and cache.total_bytes == 0
+    cache.put(doc("a", "old"), generation)
+    assert cache.get("a") is None
+
+    cache.put(doc("a", "new content"), cache.generation)
+    cache.put(doc("a", "newer"), cache.generation)
+    assert cache.get("a")["content"] == "newer" and cache.total_bytes == 5
@@ -0,0 +1,272 @@
+"""Tests for index storage: the postings codec, postings buckets and the on-disk segment store"""
+import asyncio
+import numpy as np
+import pytest
+
+from config import settings
+from index_engine import TermPostings
+from indexing_service import IndexingService
+from postings_codec import (
+    ARRAY_CONTAINER_MAX, BITMAP_BYTES, CONTAINERS, SMALL_SET, SMALL_SET_MAX, HEADER,
+    CompressedDocSet, decode_doc_set, decode_doc_sets, decode_freqs, decode_positions, decode_postings,
+    doc_set_cardinality, encode_doc_set, encode_freqs, encode_positions
+)
+from segment_store import SegmentStore
+
+
+def round_trip(doc_nums) -> bytes:
+    """Encode a document set, check it decodes to the same numbers, and return the encoding"""
+    data = encode_doc_set(doc_nums)
+    decoded = decode_doc_set(data)
+    assert decoded.dtype == np.int32
+    assert decoded.tolist() == list(doc_nums)
+    assert doc_set_cardinality(data) == len(doc_nums)
+    return data
+
+
+def test_empty_doc_set():
+    data = round_trip([])
+    assert data[0] == SMALL_SET
+    assert decode_doc_sets([]).tolist() == []
+    assert len(CompressedDocSet([data])) == 0
+
+
+def test_small_set_boundary():
+    assert round_trip(list(range(0, 3 * SMALL_SET_MAX, 3)[:SMALL_SET_MAX]))[0] == SMALL_SET
+    assert round_trip(list(range(SMALL_SET_MAX + 1)))[0] == CONTAINERS
+    # Gaps wider than one varint byte
+    round_trip([5, 300, 70000, 2 ** 31 - 1])
+
+
+def test_array_and_bitmap_containers():
+    # Up to ARRAY_CONTAINER_MAX numbers a chunk is a 16-bit array, one more makes it a bitmap
+    sparse = list(range(0, 2 * ARRAY_CONTAINER_MAX, 2))
+    data = round_trip(sparse)
+    assert len(data) == 1 + HEADER.size + 4 + 2 * ARRAY_CONTAINER_MAX
+
+    data = round_trip(sparse + [2 * ARRAY_CONTAINER_MAX + 1])
+    assert len(data) == 1 + HEADER.size + 4 + BITMAP_BYTES
+
+
+def test_runs():
+    # Consecutive numbers, short and long, ending on a container's last value
+    round_trip(list(range(65536 - 100, 65536)))
+    round_trip(list(range(1000, 1000 + ARRAY_CONTAINER_MAX + 500)))
+    round_trip(list(range(10, 20)) + list(range(40000, 50000)) + [65535])
+
+
+def test_full_container():
+    # 65536 numbers overflow a 16-bit count, so the directory stores cardinality - 1
+    data = round_trip(list(range(65536)))
+    assert len(data) == 1 + HEADER.size + 4 + BITMAP_BYTES
+    round_trip(list(range(3 * 65536, 4 * 65536)))
+
+
+def test_several_containers():
+    doc_nums = (
+        [7, 9]                                      # array in chunk 0
+        + list(range(65536, 65536 + 5000))          # bitmap in chunk 1
+        + list(range(5 * 65536, 6 * 65536))         # full chunk 5
+        + [6 * 65536 + 1]                           # single number in chunk 6
+        + [2 ** 31 - 2, 2 ** 31 - 1]                # last chunk
+    )
+    data = round_trip(doc_nums)
+    assert HEADER.unpack_from(data, 1) == (len(doc_nums), 5)
+
+
+def test_bucketed_doc_sets():
+    buckets = [list(range(0, 200)), list(range(200, 70000, 7)), [70001, 200000]]
+    chunks = [encode_doc_set(bucket) for bucket in buckets]
+    expected = [doc_num for bucket in buckets for doc_num in bucket]
+    assert decode_doc_sets(chunks).tolist() == expected
+
+    lazy = CompressedDocSet(chunks)
+    assert len(lazy) == len(expected)
+    assert list(lazy) == expected and len(lazy) == len(expected)
+
+    # Overlapping buckets from concurrent writers are merged without duplicates
+    overlapping = [encode_doc_set([1, 5, 9]), encode_doc_set([5, 6, 10])]
+    assert decode_doc_sets(overlapping).tolist() == [1, 5, 6, 9, 10]
+
+
+def test_freqs():
+    # One byte each while every frequency is below 128
+    assert encode_freqs([1, 3, 127]) == bytes([1, 3, 127])
+    for freqs in ([], [1, 3, 127], [1, 128, 70000, 1]):
+        decoded = decode_freqs(encode_freqs(freqs))
+        assert decoded.dtype == np.int32 and decoded.tolist() == freqs
+
+
+def test_bucketed_postings():
+    buckets = [([1, 5, 9], [2, 1, 300]), ([5, 6, 10], [4, 1, 1])]
+    encoded = [(encode_doc_set(doc_nums), encode_freqs(freqs)) for doc_nums, freqs in buckets]
+
+    doc_nums, freqs = decode_postings(encoded[:1])
+    assert doc_nums.tolist() == [1, 5, 9] and freqs.tolist() == [2, 1, 300]
+
+    # Overlapping buckets keep each document once, with its frequencies still aligned
+    doc_nums, freqs = decode_postings(encoded)
+    assert doc_nums.tolist() == [1, 5, 6, 9, 10] and freqs.tolist() == [2, 1, 1, 300, 1]
+    assert [part.tolist() for part in decode_postings([])] == [[], []]
+
+
+def test_term_postings_decode_lazily():
+    encoded = [(encode_doc_set([2, 4]), encode_freqs([1, 5])), (encode_doc_set([8]), encode_freqs([2]))]
+    postings = TermPostings(encoded)
+    assert len(postings) == 3 and postings._encoded is encoded
+
+    assert list(postings.doc_nums) == [2, 4, 8] and list(postings.freqs) == [1, 5, 2]
+    assert postings._encoded is None
+
+    # Changes go to the decoded arrays
+    postings = TermPostings(encoded)
+    postings.set(6, 3)
+    assert postings.discard(2)
+    assert list(postings.doc_nums) == [4, 6, 8] and list(postings.freqs) == [5, 3, 2]
+
+
+def test_positions():
+    positions = [0, 1, 127, 128, 16384, 2 ** 21]
+    assert decode_positions(encode_positions(positions)) == positions
+    assert decode_positions(encode_positions([])) == []
+
+
+def test_buckets_capped_by_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "POSTINGS_BUCKET_SIZE", 4)
+    monkeypatch.setattr(settings, "POSTINGS_BUCKET_BYTES", 100)
+    tail = {"bucket": 2, "min_doc": 10, "last_doc": 12, "doc_count": 2, "size": 60}
+
+    # The tail takes what fits in its 40 free bytes; the rest open new buckets by count or bytes
+    routed = IndexingService.assign_buckets([tail], {13: 30, 14: 30, 15: 30, 16: 30, 17: 30, 18: 30, 19: 30})
+    assert routed == {2: [13], 3: [14, 15, 16], 4: [17, 18, 19]}
+
+    routed = IndexingService.assign_buckets([tail], {13: 50, 14: 10})
+    assert routed == {3: [13, 14]}
+
+    # A document larger than a bucket still gets one to itself, and older documents keep their bucket
+    routed = IndexingService.assign_buckets([tail], {11: 500, 20: 500, 21: 10})
+    assert routed == {2: [11], 3: [20], 4: [21]}
+    assert IndexingService.assign_buckets([], {0: 60, 1: 60, 2: 10}) == {0: [0], 1: [1, 2]}
+
+
+def analyzed(doc_id: str, *terms: str):
+    """An analyzed document holding each term once, at consecutive positions"""
+    return doc_id, {term: [position] for position, term in enumerate(terms)}
+
+
+def doc_ids(store: SegmentStore):
+    return sorted(doc_id for _, doc_id, _ in store.documents())
+
+
+def posting_ids(store: SegmentStore, term: str):
+    postings = store.get_postings(term)
+    if postings is None:
+        return []
+    ids = {doc_num: doc_id for doc_num, doc_id, _ in store.documents()}
+    return sorted(ids[int(doc_num)] for doc_num in postings[0])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # No automatic flushes or tier merges unless a test asks for them
+    monkeypatch.setattr(settings, "SEGMENT_FLUSH_DOCS", 1000)
+    monkeypatch.setattr(settings, "SEGMENT_MERGE_FACTOR", 100)
+    return SegmentStore(str(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_wal_replay_after_crash(store):
+    await store.add_documents([analyzed("a", "python", "data"), analyzed("b", "python")])
+    await store.flush()
+    await store.add_documents([analyzed("c", "data", "cloud"), analyzed("d", "cloud")])
+    await store.delete_document("a")
+    await store.delete_document("d")
+
+    # Reopen without closing, as after a crash: the segment comes from the manifest, the rest from the log
+    reopened = SegmentStore(store.directory)
+    await reopened.open()
+
+    assert doc_ids(reopened) == ["b", "c"]
+    assert posting_ids(reopened, "python") == ["b"]
+    assert posting_ids(reopened, "data") == ["c"]
+    assert posting_ids(reopened, "cloud") == ["c"]
+    assert reopened.doc_num("a") is None and reopened.doc_num("c") == store.doc_num("c")
+    assert reopened.tombstones == {store.tombstones.pop()}
+
+    # New documents keep numbering past the replayed ones
+    doc_nums, _ = await reopened.add_documents([analyzed("e", "data")])
+    assert doc_nums["e"] == 4
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_merge_drops_tombstoned_documents(store):
+    await store.add_documents([analyzed(doc_id, "shared", doc_id) for doc_id in "abcd"])
+    await store.flush()
+    await store.delete_document("b")
+    await store.delete_document("c")
+    assert store.tombstones == {1, 2}
+
+    # Half the segment is deleted, so it is rewritten on its own
+    assert [segment.name for segment in store.pick_merge()] == [store.segments[0].name]
+    # The background merge woken by the flush may get there first
+    while await store.merge_once():
+        pass
+
+    assert store.tombstones == set()
+    assert len(store.segments) == 1 and store.segments[0].doc_count == 2
+    assert list(store.segments[0].doc_nums) == [0, 3]
+    assert posting_ids(store, "shared") == ["a", "d"]
+    assert store.get_postings("b") is None
+    assert not await store.merge_once()
+
+    reopened = SegmentStore(store.directory)
+    await reopened.open()
+    assert doc_ids(reopened) == ["a", "d"] and reopened.tombstones == set()
+    await store.close()
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_tier_merge_applies_tombstones(store, monkeypatch):
+    monkeypatch.setattr(settings, "SEGMENT_MERGE_FACTOR", 2)
+    for batch in (["a", "b"], ["c", "d"]):
+        await store.add_documents([analyzed(doc_id, "shared", doc_id) for doc_id in batch])
+        await store.flush()
+    await store.delete_document("c")
+
+    while await store.merge_once():
+        pass
+
+    assert len(store.segments) == 1
+    assert sorted(store.segments[0].doc_nums) == [0, 1, 3]
+    assert store.tombstones == set()
+    assert posting_ids(store, "shared") == ["a", "b", "d"]
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_during_rebuild(store):
+    await store.add_documents([analyzed("a", "alpha"), analyzed("b", "beta"), analyzed("c", "gamma")])
+    await store.flush()
+    writes = []
+
+    async def batches():
+        # "a" is gone from the source, so every other document is renumbered
+        yield [analyzed("b", "beta")]
+        # Queued behind the rebuild: a delete of a renumbered document and an add it also picks up
+        writes.append(asyncio.create_task(store.delete_document("c")))
+        writes.append(asyncio.create_task(store.add_documents([analyzed("d", "delta", "beta")])))
+        await asyncio.sleep(0)
+        yield [analyzed("c", "gamma"), analyzed("d", "delta", "beta")]
+
+    assert await store.rebuild(batches()) == 3
+    deleted, (added, replaced) = await asyncio.gather(*writes)
+
+    assert deleted == (["gamma"], 1)
+    assert list(replaced) == ["d"] and sorted(replaced["d"][0]) == ["beta", "delta"]
+    assert doc_ids(store) == ["b", "d"]
+    assert store.get_postings("gamma") is None and store.get_postings("alpha") is None
+    assert posting_ids(store, "beta") == ["b", "d"]
+    assert store.doc_num("d") == added["d"]
+    await store.close()
@@ -0,0 +1,135 @@
+"""Tests for the background indexing queue: coalescing, retries and backpressure"""
+import asyncio
+import pytest
+
+from config import settings
+from indexing_queue import IndexingQueue
+from indexing_service import IndexingService
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    """Stub out the index writes, recording each call; set `fail` to make the next N group commits raise"""
+    calls = {"added": [], "updated": [], "removed": [], "fail": 0, "release": None}
+
+    async def build_index_for_documents(documents):
+        if calls["release"] is not None:
+            await calls["release"].wait()
+        if calls["fail"]:
+            calls["fail"] -= 1
+            raise RuntimeError("index write failed")
+        calls["added"].append(list(documents))
+
+    async def update_document_index(doc_id, title, content):
+        calls["updated"].append((doc_id, title, content))
+
+    async def remove_document_from_index(doc_id):
+        calls["removed"].append(doc_id)
+
+    monkeypatch.setattr(IndexingService, "build_index_for_documents", build_index_for_documents)
+    monkeypatch.setattr(IndexingService, "update_document_index", update_document_index)
+    monkeypatch.setattr(IndexingService, "remove_document_from_index", remove_document_from_index)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_SIZE", 10)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_BATCH", 10)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_LINGER", 0.05)
+    monkeypatch.setattr(settings, "INDEX_MAX_LAG", 60.0)
+    monkeypatch.setattr(IndexingQueue, "RETRY_BACKOFF", 0.01)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_inline_until_started(indexed):
+    queue = IndexingQueue()
+    await queue.add("a", "title", "content")
+    assert indexed["added"] == [[("a", "title", "content")]] and queue.stats()["running"] is False
+
+
+@pytest.mark.asyncio
+async def test_operations_on_one_document_coalesce(indexed):
+    queue = IndexingQueue()
+    queue.start()
+    await queue.add("a", "first", "text")
+    await queue.add("a", "second", "text")
+    await queue.update("a", "edited", "text")
+    await queue.add("b", "other", "text")
+    await queue.remove("c")
+    await queue.flush()
+
+    # One group commit holding the latest version of each new document
+    assert indexed["added"] == [[("a", "edited", "text"), ("b", "other", "text")]]
+    assert indexed["updated"] == [] and indexed["removed"] == ["c"]
+    assert queue.commits == 1 and queue.indexed == 3
+    await queue.stop()
+
+
+def test_coalesce():
+    net = IndexingQueue.coalesce([
+        ("update", "a", "t1", "c1"),
+        ("add", "b", "t2", "c2"),
+        ("update", "b", "t3", "c3"),
+        ("remove", "a", None, None),
+        ("add", "a", "t4", "c4")
+    ])
+    assert list(net) == ["a", "b"]
+    assert net["a"] == ("add", "a", "t4", "c4") and net["b"] == ("add", "b", "t3", "c3")
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried(indexed):
+    indexed["fail"] = 1
+    queue = IndexingQueue()
+    queue.start()
+    await queue.add("a", "title", "content")
+    await queue.flush()
+
+    assert indexed["added"] == [[("a", "title", "content")]]
+    assert queue.failures == 1 and queue.commits == 1
+    stats = queue.stats()
+    assert stats["retry_attempt"] == 0 and stats["queued"] == 0 and not stats["needs_reconcile"]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_given_up_until_indexed(indexed, monkeypatch):
+    monkeypatch.setattr(IndexingQueue, "MAX_ATTEMPTS", 2)
+    indexed["fail"] = 2
+    queue = IndexingQueue()
+    queue.start()
+    await queue.add("a", "title", "content")
+    await queue.flush()
+
+    assert indexed["added"] == [] and queue.failures == 2
+    assert queue.failed == {"a": "add"} and queue.stats()["needs_reconcile"]
+
+    # A later operation on the document that succeeds clears it
+    await queue.update("a", "title", "edited")
+    await queue.flush()
+    assert indexed["updated"] == [("a", "title", "edited")]
+    assert queue.failed == {} and not queue.stats()["needs_reconcile"]
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_blocks_writers(indexed, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_QUEUE_SIZE", 2)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_BATCH", 1)
+    indexed["release"] = asyncio.Event()
+    queue = IndexingQueue()
+    queue.start()
+
+    # The worker holds one operation while two more fill the queue
+    for doc_id in ("a", "b", "c"):
+        await asyncio.wait_for(queue.add(doc_id, doc_id, "text"), 1)
+    await asyncio.sleep(0.01)
+    assert queue.stats()["queued"] == 2
+
+    blocked = asyncio.create_task(queue.add("d", "d", "text"))
+    await asyncio.sleep(0.1)
+    assert not blocked.done()
+
+    indexed["release"].set()
+    await asyncio.wait_for(blocked, 1)
+    await queue.flush()
+    assert [documents[0][0] for documents in indexed["added"]] == ["a", "b", "c", "d"]
+    assert queue.commits == 4 and queue.lag() == 0.0
+    await queue.stop()
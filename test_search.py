@@ -0,0 +1,339 @@
+"""Tests for the search query language, query execution and suggestions"""
+from collections import Counter
+import numpy as np
+import pytest
+
+from collection_stats import collection_stats
+from config import settings
+from document_service import DocumentService
+from fuzzy_index import fuzzy_index
+from bm25_ranker import BM25Ranker
+from index_engine import index_engine
+from query_parser import PhraseNode, TermNode, parse_query
+from search_service import SearchService
+from suggest_index import SuggestIndex
+from text_processing import MAX_SLOP, Analyzer, analyzer
+from top_k import TopKProcessor
+
+
+def term(word: str):
+    return ("term", analyzer.term(word))
+
+
+def bool_(must=(), should=(), must_not=()):
+    return ("bool", tuple(sorted(must)), tuple(sorted(should)), tuple(sorted(must_not)))
+
+
+def key(query: str):
+    node = parse_query(query)
+    return node.key() if node is not None else None
+
+
+def test_operator_precedence():
+    # AND binds tighter than OR, which binds tighter than juxtaposition
+    assert key("python OR java AND spark") == bool_(should=[term("python"), bool_(must=[term("java"), term("spark")])])
+    assert key("python AND java OR spark AND cloud") == bool_(should=[
+        bool_(must=[term("python"), term("java")]),
+        bool_(must=[term("spark"), term("cloud")])
+    ])
+    assert key("python java OR spark") == bool_(should=[term("python"), bool_(should=[term("java"), term("spark")])])
+    # Only upper-case operators count; "or" is searched as a word
+    assert key("python or java") == bool_(should=[term("python"), term("or"), term("java")])
+
+
+def test_parentheses():
+    assert key("python AND (java OR spark)") == bool_(must=[term("python"), bool_(should=[term("java"), term("spark")])])
+    assert key("(python OR java) AND spark") == bool_(must=[bool_(should=[term("python"), term("java")]), term("spark")])
+    assert key("((python))") == term("python")
+    assert key("(python java) cloud") == bool_(should=[bool_(should=[term("python"), term("java")]), term("cloud")])
+
+
+def test_quoted_phrases():
+    node = parse_query('"machine learning"~3')
+    assert isinstance(node, PhraseNode)
+    assert node.phrase.terms == [analyzer.term("machine"), analyzer.term("learning")]
+    assert node.phrase.offsets == [0, 1] and node.phrase.slop == 3
+
+    # Stop words are dropped but keep their place
+    assert parse_query('"learning of machines"').phrase.offsets == [0, 2]
+    assert parse_query('"machine learning"~5000').phrase.slop == MAX_SLOP
+
+    # Bare phrases are required unless combined with OR
+    phrase = parse_query('"machine learning"').key()
+    assert key('"machine learning" cloud') == bool_(must=[phrase], should=[term("cloud")])
+    assert key('"machine learning" OR cloud') == bool_(should=[phrase, term("cloud")])
+
+    # A phrase of one term is just that term
+    assert isinstance(parse_query('"the python"~2'), TermNode)
+
+
+def test_negation():
+    excluded = bool_(must_not=[term("python")])
+    assert key("-python") == key("NOT python") == excluded
+    assert key("NOT NOT python") == term("python")
+
+    assert key("python -java") == key("python NOT java") == bool_(should=[term("python")], must_not=[term("java")])
+    assert key("python AND NOT java") == bool_(must=[term("python")], must_not=[term("java")])
+    assert key("+python data") == bool_(must=[term("python")], should=[term("data")])
+    assert key("-(java OR spark) python") == bool_(
+        should=[term("python")],
+        must_not=[bool_(should=[term("java"), term("spark")])]
+    )
+    # A hyphen inside a word is not a modifier
+    assert key("e-mail") == bool_(should=[term("e"), term("mail")])
+
+
+def test_unbalanced_input():
+    disjunction = key("python OR java")
+    assert key("(python OR java") == disjunction
+    assert key("python OR java)") == disjunction
+    assert key(")python OR (java") == disjunction
+    assert key('"machine learning') == bool_(should=[term("machine"), term("learning")])
+
+    # Dangling operators and modifiers are skipped
+    assert key("OR python") == key("python OR") == key("python AND") == key("python -") == term("python")
+    assert key("AND") is None
+    assert key("()") is None
+
+
+def test_stop_word_only_queries():
+    assert key("the and of") is None
+    assert key('"the of"~2') is None
+    assert key("the OR a") is None
+    assert key("-the") is None
+    assert key("") is None
+    assert key("python AND the") == term("python")
+
+
+def edges(node):
+    """The trie below a node as nested {label: subtree} dicts"""
+    return {child.label: edges(child) for child in node.children.values()}
+
+
+def test_suggest_insert_splits_edges():
+    index = SuggestIndex()
+    index.set_weight("test", 5)
+    assert edges(index._root) == {"test": {}}
+
+    index.set_weight("team", 3)
+    assert edges(index._root) == {"te": {"st": {}, "am": {}}}
+
+    # Terms ending at a split point or extending a leaf
+    index.set_weight("te", 2)
+    index.set_weight("tester", 1)
+    index.set_weight("t", 4)
+    assert edges(index._root) == {"t": {"e": {"st": {"er": {}}, "am": {}}}}
+    assert index.size == 5
+
+    assert index.complete("te") == [("test", 5), ("team", 3), ("te", 2), ("tester", 1)]
+    # A prefix ending inside an edge
+    assert index.complete("tes") == [("test", 5), ("tester", 1)]
+    assert index.complete("testers") == [] and index.complete("x") == []
+
+
+def test_suggest_removal_prunes_and_merges_edges():
+    index = SuggestIndex()
+    for term, weight in (("t", 4), ("te", 2), ("team", 3), ("test", 5), ("tester", 1)):
+        index.set_weight(term, weight)
+
+    # Removing terms that are not indexed changes nothing
+    index.set_weight("tes", 0)
+    index.set_weight("tent", 0)
+    index.set_weight("testers", 0)
+    assert index.size == 5
+
+    index.set_weight("tester", 0)
+    assert edges(index._root) == {"t": {"e": {"st": {}, "am": {}}}}
+
+    # "e" still has two children, so it stays
+    index.set_weight("te", 0)
+    assert edges(index._root) == {"t": {"e": {"st": {}, "am": {}}}}
+
+    index.set_weight("team", 0)
+    assert edges(index._root) == {"t": {"est": {}}}
+
+    index.set_weight("t", 0)
+    assert edges(index._root) == {"test": {}}
+    assert index.complete("te") == [("test", 5)]
+
+    index.set_weight("test", 0)
+    assert edges(index._root) == {} and index.size == 0
+    assert index.complete("") == []
+
+
+def test_suggest_refreshes_stale_top():
+    index = SuggestIndex()
+    for term, weight in (("python", 5), ("pytorch", 3), ("pyramid", 1), ("java", 4)):
+        index.set_weight(term, weight)
+    assert index.complete("py") == [("python", 5), ("pytorch", 3), ("pyramid", 1)]
+    assert index.complete("")[0] == ("python", 5)
+
+    index.set_weight("pyramid", 10)
+    # Only caches on the changed term's path are dropped
+    assert index._find("pyt").top is not None and index._find("java").top is not None
+    assert index.complete("py") == [("pyramid", 10), ("python", 5), ("pytorch", 3)]
+    assert index.complete("")[0] == ("pyramid", 10)
+
+    index.set_weight("pyramid", 0)
+    assert index.complete("py") == [("python", 5), ("pytorch", 3)]
+    assert index.complete("", limit=2) == [("python", 5), ("java", 4)]
+
+
+def test_suggest_top_k_after_weight_changes():
+    index = SuggestIndex()
+    for i in range(2 * SuggestIndex.TOP_K):
+        index.set_weight(f"k{i:02d}", i + 1)
+    top = index.complete("k")
+    assert len(top) == SuggestIndex.TOP_K and top[0] == ("k19", 20)
+
+    # A term outside every cached top list moves to the front
+    index.set_weight("k00", 100)
+    assert index.complete("k")[0] == ("k00", 100)
+    assert index.complete("k0")[0] == ("k00", 100)
+    assert len(index.complete("k")) == SuggestIndex.TOP_K
+
+
+def test_surface_form():
+    stemming = Analyzer()
+    # Unseen stems map back to themselves, or to a word when the stem itself is not stable
+    assert stemming.surface_form("python") == "python"
+    assert stemming.surface_form("databas") == "database"
+
+    # The shortest word seen for a stem is preferred
+    stemming.analyze("Running runs runner")
+    assert stemming.surface_form("run") == "runs"
+    stemming.analyze("Images imaging")
+    assert stemming.surface_form(stemming.term("images")) == "images"
+    stemming.analyze("image")
+    assert stemming.surface_form(stemming.term("images")) == "image"
+
+    assert Analyzer(stemming=False).surface_form("databas") == "databas"
+
+
+def test_analyzer_terms():
+    text = "The Running dogs are running quickly through databases"
+    assert Analyzer().analyze(text) == ["run", "dog", "run", "quickli", "through", "databas"]
+    assert Analyzer(stemming=False).analyze(text) == ["running", "dogs", "running", "quickly", "through", "databases"]
+    assert Analyzer(ascii_folding=True).analyze("Café naïve") == ["cafe", "naiv"]
+    # Stop words are dropped but keep their positions
+    assert Analyzer().positioned_terms("the cats of the city") == [(1, "cat"), (4, "citi")]
+
+    # Caching never changes the output
+    assert Analyzer(cache_size=0).analyze(text + " " + text) == Analyzer(cache_size=2).analyze(text + " " + text)
+
+
+def test_analyzer_cache_bound():
+    stemming = Analyzer(cache_size=3)
+    stemming.analyze("alpha beta the")
+    assert stemming.cache_info() == {"size": 3, "max_size": 3, "misses": 3}
+
+    # Hits are free; once full the oldest entry is evicted, even if it was just used (FIFO)
+    assert stemming.term("alpha") == "alpha" and stemming.term("the") is None
+    assert stemming.cache_info()["misses"] == 3
+    stemming.analyze("gamma")
+    assert list(stemming._cache) == ["beta", "the", "gamma"]
+    stemming.term("alpha")
+    assert list(stemming._cache) == ["the", "gamma", "alpha"]
+    assert stemming.cache_info() == {"size": 3, "max_size": 3, "misses": 5}
+
+
+def test_suggest_shows_words():
+    index = SuggestIndex()
+    stem = analyzer.term("database")
+    index.set_weight(stem, 5)
+    index.set_weight(analyzer.term("data"), 7)
+    analyzer.analyze("databases database")
+
+    suggestions = index.suggest("machine databa")
+    assert suggestions == [{"text": "database", "term": stem, "doc_freq": 5}]
+    # The finished word is matched by its stem as well
+    assert index.suggest("database")[0]["term"] == stem
+    assert [suggestion["text"] for suggestion in index.suggest("dat")] == ["data", "database"]
+    assert index.suggest("the") == [] and index.suggest("") == []
+
+
+@pytest.fixture
+def memory_index(monkeypatch):
+    """Index documents into the in-memory engine, fuzzy index and statistics"""
+    monkeypatch.setattr(settings, "INDEX_STORAGE", "mongodb")
+
+    async def ids_only(doc_ids, projection=None):
+        return [{"_id": doc_id} for doc_id in doc_ids]
+    monkeypatch.setattr(DocumentService, "get_documents_by_ids", ids_only)
+
+    for component in (index_engine, fuzzy_index, collection_stats):
+        component.clear()
+        component.loaded = True
+
+    def add(documents):
+        for doc_num, (doc_id, text) in enumerate(documents):
+            term_freqs = Counter(analyzer.analyze(text))
+            length = sum(term_freqs.values())
+            index_engine.add_document(doc_id, doc_num, term_freqs, length)
+            fuzzy_index.add_terms(term_freqs)
+            collection_stats.add_document(term_freqs, length)
+
+    yield add
+    for component in (index_engine, fuzzy_index, collection_stats):
+        component.clear()
+        component.loaded = False
+
+
+async def ranked_ids(query: str, use_fuzzy: bool = True, depth: int = 10):
+    ranked = await SearchService.rank_query(parse_query(query), use_fuzzy, "bm25", depth)
+    return [doc_id for doc_id, _ in ranked["ranked"]]
+
+
+@pytest.mark.asyncio
+async def test_excluded_terms_are_not_fuzzy_expanded(memory_index):
+    memory_index([("d1", "data python"), ("d2", "date")])
+
+    # "date" is a typo variant of "data", but excluding it must not exclude "data"
+    assert await ranked_ids("python -date") == ["d1"]
+    assert await ranked_ids("data -date") == ["d1"]
+    assert await ranked_ids("python NOT (date OR java)") == ["d1"]
+
+    # Included terms are still widened to their variants
+    assert sorted(await ranked_ids("data")) == ["d1", "d2"]
+
+
+def exhaustive_top_k(query_terms, k):
+    """The k best documents from BM25-scoring every match, ties broken by document number"""
+    matches = sorted({
+        int(doc_num) for term in query_terms
+        if index_engine.get_postings(term) is not None
+        for doc_num in index_engine.get_postings(term).doc_nums
+    })
+    scores = BM25Ranker().score_candidates(np.array(matches, dtype=np.int32), query_terms)
+    ranked = sorted(zip(matches, scores.tolist()), key=lambda pair: (-round(pair[1], 9), pair[0]))
+    return ranked[:k], len(matches)
+
+
+def test_top_k_matches_exhaustive_ranking(memory_index, monkeypatch):
+    # Small windows so pruning carries its threshold across several of them
+    monkeypatch.setattr(TopKProcessor, "WINDOW", 16)
+    rng = np.random.default_rng(7)
+    words = ["python", "java", "spark", "cloud", "data", "search", "index", "query"]
+    documents = []
+    for i in range(200):
+        text = " ".join(rng.choice(words, size=rng.integers(1, 12), p=[.3, .2, .15, .1, .1, .07, .05, .03]))
+        documents.append((f"d{i}", text))
+        if i % 10 == 0:
+            # Identical documents score the same, so the ties must be broken the same way
+            documents.append((f"d{i}-copy", text))
+    memory_index(documents)
+
+    queries = [["python"], ["query"], ["python", "java"], ["spark", "cloud", "query"], words]
+    for query_terms in ([analyzer.term(word) for word in query] for query in queries):
+        for k in (1, 5, 20, 1000):
+            top, total = TopKProcessor().search(query_terms, k)
+            expected, expected_total = exhaustive_top_k(query_terms, k)
+            assert total == expected_total
+            assert [doc_num for doc_num, _ in top] == [doc_num for doc_num, _ in expected]
+            assert [score for _, score in top] == pytest.approx([score for _, score in expected])
+
+    # More documents asked for than match: every match, in full order
+    top, total = TopKProcessor().search([analyzer.term("query")], 1000)
+    assert 0 < len(top) == total < 1000
+    assert TopKProcessor().search(["missing"], 5) == ([], 0)
+    assert TopKProcessor().search(["python"], 0) == ([], 0)
@@ -1,40 +1,225 @@
 import re
-from typing import List, Set
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from porter_stemmer import stem
+from config import settings
+
+
+# Runs of word characters; lowercasing is done once per text, not per token
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+# Largest phrase slop honoured; fields are spaced further apart, so phrases never span two
+MAX_SLOP = 100
+# Positions reserved for each copy of the title before the content starts
+TITLE_POSITIONS = 1024
+
+
+# Common stop words that don't add meaning
+STOP_WORDS: Set[str] = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+    'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the',
+    'to', 'was', 'will', 'with', 'this', 'but', 'they', 'have', 'had',
+    'what', 'when', 'where', 'who', 'which', 'why', 'how'
+}
+
+
+class Analyzer:
+    """
+    Text analysis chain shared by indexing and querying:
+    tokenize -> lowercase -> (ASCII folding) -> stop word filter -> (stemming).
+
+    Each distinct token is run through the filters once and the resulting
+    term is kept in a plain dict, so analysis of typical text is a regex
+    scan plus one dict lookup per token, done in bulk per text. When full
+    the cache evicts first in, first out: hits are not tracked, which
+    keeps the bulk lookup a bare dict.get. On cache misses it
+    also remembers the shortest token seen for each stem, so stems can be
+    shown to users as words.
+    """
+
+    def __init__(
+        self,
+        stemming: bool = True,
+        ascii_folding: bool = False,
+        stop_words: Optional[Set[str]] = None,
+        cache_size: int = 100_000
+    ):
+        self.stemming = stemming
+        self.ascii_folding = ascii_folding
+        self.stop_words = frozenset(STOP_WORDS if stop_words is None else stop_words)
+        self.cache_size = cache_size
+        # Token -> term, with "" for stop words so a lookup miss is simply None
+        self._cache: Dict[str, str] = {}
+        self.misses = 0
+        # Shortest token seen for each stem, e.g. "databas" -> "database"
+        self.surfaces: Dict[str, str] = {}
+
+    def signature(self) -> str:
+        """Identifies the settings that determine indexed terms; an index is only valid for one signature"""
+        return f"stem={int(self.stemming)},fold={int(self.ascii_folding)}"
+
+    def tokenize(self, text: str) -> List[str]:
+        """Lowercased (and optionally ASCII-folded) tokens, stop words included"""
+        text = text.lower()
+        if self.ascii_folding and not text.isascii():
+            text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+        return TOKEN_PATTERN.findall(text)
+
+    def _term(self, token: str) -> Optional[str]:
+        """Index term of a token, or None for a stop word (cached by term())"""
+        if token in self.stop_words:
+            return None
+        if self.stemming:
+            term = stem(token)
+            surface = self.surfaces.get(term)
+            if surface is None or len(token) < len(surface):
+                self.surfaces[term] = token
+            return term
+        return token
+
+    def _miss(self, token: str) -> str:
+        """Analyze a token not in the cache and cache it"""
+        self.misses += 1
+        term = self._term(token) or ""
+        if self.cache_size > 0:
+            if len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]
+            self._cache[token] = term
+        return term
+
+    def term(self, token: str) -> Optional[str]:
+        """Index term of a token, or None for a stop word"""
+        term = self._cache.get(token)
+        if term is None:
+            term = self._miss(token)
+        return term or None
+
+    def _terms(self, tokens: List[str]) -> List[str]:
+        """Index term of each token, "" for stop words"""
+        get = self._cache.get
+        terms = [get(token) for token in tokens]
+        if None in terms:
+            for i, term in enumerate(terms):
+                if term is None:
+                    terms[i] = self._miss(tokens[i])
+        return terms
+
+    def surface_form(self, term: str) -> str:
+        """
+        A word that analyzes to the given term, for showing index terms to users
+
+        Stems are not always words, nor stable when stemmed again ("databas"
+        stems to "databa"), so the shortest token seen for the stem is
+        preferred; unseen stems fall back to a plain "-e" or "-y" form when
+        that analyzes back to the term.
+        """
+        surface = self.surfaces.get(term)
+        if surface is not None or not self.stemming:
+            return surface or term
+        candidates = (term, term + "e", term[:-1] + "y") if term.endswith("i") else (term, term + "e")
+        for candidate in candidates:
+            if candidate not in self.stop_words and stem(candidate) == term:
+                return candidate
+        return term
+
+    def analyze(self, text: str) -> List[str]:
+        """Terms of a text in order, stop words removed"""
+        return [t for t in self._terms(self.tokenize(text)) if t]
+
+    def positioned_terms(self, text: str) -> List[Tuple[int, str]]:
+        """(position, term) pairs; stop words are dropped but still occupy a position"""
+        return [(position, t) for position, t in enumerate(self._terms(self.tokenize(text))) if t]
+
+    def term_positions(self, text: str) -> Dict[str, List[int]]:
+        """Positions of each term in a text"""
+        positions: Dict[str, List[int]] = {}
+        for position, t in enumerate(self._terms(self.tokenize(text))):
+            if t:
+                if t in positions:
+                    positions[t].append(position)
+                else:
+                    positions[t] = [position]
+        return positions
+
+    def document_positions(self, title: str, content: str) -> Dict[str, List[int]]:
+        """
+        Term positions of a document indexed as its title twice (for weight) and then its content
+
+        Each field starts at a fixed position rather than where the previous
+        one ended, so editing the title leaves every content position as it
+        was, and fields lie more than MAX_SLOP apart.
+        """
+        title_terms = self._terms(self.tokenize(title))
+        # Only a title longer than TITLE_POSITIONS tokens moves the content further out
+        span = TITLE_POSITIONS * -(-(len(title_terms) + MAX_SLOP + 1) // TITLE_POSITIONS)
+
+        positions: Dict[str, List[int]] = {}
+        for base, terms in ((0, title_terms), (span, title_terms), (2 * span, self._terms(self.tokenize(content)))):
+            for position, t in enumerate(terms, base):
+                if t:
+                    if t in positions:
+                        positions[t].append(position)
+                    else:
+                        positions[t] = [position]
+        return positions
+
+    def analyze_many(self, texts: List[str]) -> List[Dict[str, List[int]]]:
+        """Term positions of many texts in one call, sharing the term cache"""
+        return [self.term_positions(text) for text in texts]
+
+    def cache_info(self) -> Dict:
+        return {"size": len(self._cache), "max_size": self.cache_size, "misses": self.misses}
+
+
+# Signature of indexes built before the analyzer was configurable (no stemming or folding)
+LEGACY_ANALYZER = "stem=0,fold=0"
+
+
+# Global analyzer instance, configured from settings
+analyzer = Analyzer(
+    stemming=settings.ANALYZER_STEMMING,
+    ascii_folding=settings.ANALYZER_ASCII_FOLDING,
+    cache_size=settings.ANALYZER_CACHE_SIZE
+)
 
 
 def tokenize(text: str) -> List[str]:
     """Split text into individual words (tokens)"""
-    # Convert to lowercase and split by whitespace and punctuation
-    tokens = re.findall(r'\b\w+\b', text.lower())
-    return tokens
+    return analyzer.tokenize(text)
 
 
 def normalize(tokens: List[str]) -> List[str]:
-    """Normalize tokens (already lowercased in tokenize)"""
+    """Normalize tokens (lowercasing and folding happen in tokenize)"""
     return tokens
 
 
 def remove_stop_words(tokens: List[str]) -> List[str]:
     """Remove common stop words that don't add meaning"""
-    stop_words: Set[str] = {
-        'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
-        'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the',
-        'to', 'was', 'will', 'with', 'this', 'but', 'they', 'have', 'had',
-        'what', 'when', 'where', 'who', 'which', 'why', 'how'
-    }
-    
-    return [token for token in tokens if token not in stop_words]
+    return [token for token in tokens if token not in analyzer.stop_words]
 
 
 def process_text(text: str) -> List[str]:
-    """Process text: tokenize, normalize, and remove stop words"""
-    tokens = tokenize(text)
-    tokens = normalize(tokens)
-    tokens = remove_stop_words(tokens)
-    return tokens
+    """Process text into index terms: tokenize, normalize, remove stop words and stem"""
+    return analyzer.analyze(text)
 
 
 def get_unique_terms(text: str) -> Set[str]:
     """Get unique terms from text"""
-    tokens = process_text(text)
-    return set(tokens)
+    return set(analyzer.analyze(text))
+
+
+def get_term_frequencies(text: str) -> Dict[str, int]:
+    """Get the number of occurrences of each term in text"""
+    return dict(Counter(analyzer.analyze(text)))
+
+
+def get_term_positions(text: str) -> Dict[str, List[int]]:
+    """
+    Get the token positions of each term in text
+
+    Stop words are dropped but still occupy a position, so the gaps between
+    terms match the original text.
+    """
+    return analyzer.term_positions(text)
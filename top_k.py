@@ -0,0 +1,119 @@
+"""
+Top-k query processing with MaxScore dynamic pruning
+"""
+from index_engine import index_engine
+from bm25_ranker import BM25Ranker
+from typing import List, Tuple
+import heapq
+import numpy as np
+
+
+class TopKProcessor:
+    """
+    Find the k best BM25 matches without scoring every matching document.
+
+    Each query term gets a score upper bound (its highest posting weight).
+    Terms are ordered by that bound; once the k-th best score so far exceeds
+    the summed bounds of the weakest terms, those terms become non-essential:
+    they no longer generate candidates and are only probed for documents
+    found in the essential terms, strongest first, dropping documents as soon
+    as the remaining bounds cannot lift them into the top k.
+
+    Documents are processed in windows of internal document numbers; each
+    window is scored with NumPy and merged into a bounded heap whose minimum
+    is the pruning threshold for the next window.
+    """
+
+    WINDOW = 1 << 14
+
+    def __init__(self, ranker: BM25Ranker = None):
+        self.ranker = ranker or BM25Ranker()
+
+    def search(self, query_terms: List[str], k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        Get the top k documents for a disjunctive query
+
+        Returns:
+            (doc_num, score) pairs sorted by score descending, and the total
+            number of documents matching any query term
+        """
+        lists = []
+        for term in dict.fromkeys(query_terms):
+            postings = index_engine.get_postings(term)
+            if postings is None or len(postings) == 0:
+                continue
+            weights = self.ranker.posting_weights(term)
+            lists.append((float(weights.max()), np.frombuffer(postings.doc_nums, dtype=np.int32).copy(), weights))
+
+        if not lists or k <= 0:
+            return [], 0
+
+        last_doc = max(int(docs[-1]) for _, docs, _ in lists)
+        matched = np.zeros(last_doc + 1, dtype=bool)
+        for _, docs, _ in lists:
+            matched[docs] = True
+        total_matches = int(np.count_nonzero(matched))
+
+        # Weakest terms first; cum_bounds[i] = sum of bounds of terms 0..i
+        lists.sort(key=lambda item: item[0])
+        doc_lists = [docs for _, docs, _ in lists]
+        weight_lists = [weights for _, _, weights in lists]
+        cum_bounds = np.cumsum([bound for bound, _, _ in lists])
+
+        # Any single term's k-th best weight is a safe starting threshold
+        threshold = 0.0
+        for weights in weight_lists:
+            if len(weights) >= k:
+                threshold = max(threshold, float(np.partition(weights, len(weights) - k)[len(weights) - k]))
+
+        heap: List[Tuple[float, int]] = []
+
+        for lo in range(0, last_doc + 1, self.WINDOW):
+            hi = lo + self.WINDOW
+            first_essential = int(np.searchsorted(cum_bounds, threshold, side="left"))
+            if first_essential == len(lists):
+                break
+
+            # Candidates come only from essential terms, accumulated term-at-a-time
+            present = np.zeros(self.WINDOW, dtype=bool)
+            accumulators = np.zeros(self.WINDOW)
+            for i in range(first_essential, len(lists)):
+                start, end = np.searchsorted(doc_lists[i], [lo, hi])
+                offsets = doc_lists[i][start:end] - lo
+                present[offsets] = True
+                accumulators[offsets] += weight_lists[i][start:end]
+            candidates = np.flatnonzero(present)
+            if len(candidates) == 0:
+                continue
+            scores = accumulators[candidates]
+            candidates += lo
+
+            # Probe non-essential terms only for documents that can still qualify
+            for i in range(first_essential - 1, -1, -1):
+                alive = scores + cum_bounds[i] >= threshold
+                candidates, scores = candidates[alive], scores[alive]
+                if len(candidates) == 0:
+                    break
+                docs = doc_lists[i]
+                pos = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                hits = docs[pos] == candidates
+                scores[hits] += weight_lists[i][pos[hits]]
+
+            alive = scores >= threshold
+            candidates, scores = candidates[alive], scores[alive]
+            if len(candidates) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+                candidates, scores = candidates[best], scores[best]
+
+            for doc_num, score in zip(candidates.tolist(), scores.tolist()):
+                item = (score, -doc_num)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+            if len(heap) == k:
+                threshold = max(threshold, heap[0][0])
+
+        results = sorted(heap, reverse=True)
+        return [(-neg_doc, score) for score, neg_doc in results], total_matches